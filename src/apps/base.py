@@ -7,6 +7,7 @@ from flask_babel import Babel
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 
 from extensions.cassandra_cql import CassandraCqlClient
+from extensions.opentelemetry import TracingMiddleware
 from extensions.project_config import get_config
 
 babel = Babel(default_locale="en", configure_jinja=False)
@@ -28,6 +29,7 @@ def create_app(config_name: str = None) -> Flask:
     app.config.from_object(config)
 
     # 注册组件
+    TracingMiddleware.init_tracer()
     FlaskInstrumentor().instrument_app(app)
 
     babel.init_app(app)
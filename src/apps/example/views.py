@@ -12,12 +12,15 @@ from apps.example.serializers import (
     PersonSerializer,
     PersonValidator,
 )
-from extensions.centrifugo import centrifugo, user_channel
+from extensions.cassandra_orm.singleflight import get_model
+from extensions.centrifugo import publish_async, user_channel
 from extensions.flask_api.api import class_route, login_required, route
 from extensions.flask_api.exceptions import ObjectNotFound
 from extensions.flask_api.serializer import serialize, validate
 from extensions.flask_api.views import (
+    BulkPostView,
     GetView,
+    ListView,
     PostView,
     deprecated_api,
     removed_api,
@@ -63,13 +66,25 @@ def person_list():
     return Person.all()
 
 
+@class_route(blueprint, "/paging")
+class PersonPagingView(ListView):
+    """cursor 分页, 每次只读取一页"""
+
+    list_serializer_class = PersonSerializer
+    cursor_paging = True
+    page_size = 10
+
+    def filter_objects(self):
+        return Person.all()
+
+
 @route(blueprint, "/<first_name>")
 @validate(FirstNameValidator)
 @serialize(PersonSerializer)
 def get_person():
     """获取 Person list"""
     try:
-        return Person.get(first_name=g.validated_data["first_name"])
+        return get_model(Person, first_name=g.validated_data["first_name"])
     except Person.DoesNotExist:
         raise ObjectNotFound
 
@@ -102,10 +117,14 @@ def create_person():
 class GetExampleView(GetView):
     args_deserializer_class = FirstNameValidator
     get_serializer_class = PersonSerializer
+    cache_ttl = 60
+    cache_key_fields = ("first_name",)
 
     def get_object(self):
         try:
-            return Person.get(first_name=self.validated_data["first_name"])
+            return get_model(
+                Person, first_name=self.validated_data["first_name"]
+            )
         except Person.DoesNotExist:
             raise ObjectNotFound
 
@@ -114,13 +133,14 @@ class GetExampleView(GetView):
 class PostExampleView(PostView):
     args_deserializer_class = PersonValidator
     post_serializer_class = PersonSerializer
+    invalidate_views = (GetExampleView,)
 
     def save(self):
         """保存数据"""
         if self.app_id:
             print(_("You are using %(app_id)s", app_id=self.app_id))
 
-        centrifugo.publish(
+        publish_async(
             user_channel(self.kong_user_id),
             {
                 "stream": "example",
@@ -136,3 +156,14 @@ class PostExampleView(PostView):
             first_name=self.validated_data["first_name"],
             last_name=self.validated_data["last_name"],
         )
+
+
+@class_route(blueprint, "/bulk", methods=["POST"])
+class BulkPostExampleView(BulkPostView):
+    item_deserializer_class = PersonValidator
+    bulk_serializer_class = PersonSerializer
+    bulk_model = Person
+    invalidate_views = (GetExampleView,)
+
+    def get_kafka_topic(self):
+        return app.config["FLASK_TEMPLATE_TOPIC"]
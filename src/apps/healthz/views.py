@@ -1,6 +1,7 @@
-from flask import Blueprint
+from flask import Blueprint, Response
 
 from extensions.flask_api.api import route
+from extensions.metrics import render_metrics
 from extensions.project_config import get_config
 
 blueprint = Blueprint("healthz", __name__)
@@ -18,3 +19,9 @@ def healthz():
 def readiness():
     """k8s readiness 检测"""
     return "ok"
+
+
+@blueprint.route("/metrics")
+def metrics():
+    """Prometheus 抓取 API 的耗时和错误统计"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,5 @@
+from .views import blueprint
+
+blueprints = [blueprint]
+
+__all__ = ["blueprints"]
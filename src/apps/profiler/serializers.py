@@ -0,0 +1,23 @@
+from marshmallow import Schema, fields, validate
+
+from extensions.project_config import get_config
+
+config = get_config()
+
+
+class ProfileValidator(Schema):
+    seconds = fields.Float(
+        load_default=10,
+        validate=[validate.Range(min=0, max=config.PROFILER_MAX_SECONDS)],
+    )
+    interval = fields.Float(
+        load_default=0.01, validate=[validate.Range(min=0.001, max=1)]
+    )
+
+
+class ProfileResultValidator(Schema):
+    profile_id = fields.Str(required=True)
+    format = fields.Str(
+        load_default="collapsed",
+        validate=[validate.OneOf(["collapsed", "json"])],
+    )
@@ -0,0 +1,154 @@
+"""
+线上 worker 的采样 profiler
+
+PROFILER_ENABLED 为 True 时可用, 请求需要带上 Authorization: Bearer <PROFILER_TOKEN>
+所有 worker 共享 redis 中的限流, PROFILER_RATE_LIMIT 秒内只能采样一次
+
+/profiler 在处理请求的 worker 中启动后台采样并立即返回 profile_id,
+采样期间这个 worker 继续处理其他请求, 结束后结果保存到 redis,
+任意 worker 都可以通过 /profiler/<profile_id> 读取
+
+eg:
+    curl -H "Authorization: Bearer $TOKEN" "http://pod:8000/profiler?seconds=10"
+    sleep 10
+    curl -H "Authorization: Bearer $TOKEN" \\
+        "http://pod:8000/profiler/$PROFILE_ID" > stacks.txt
+    flamegraph.pl stacks.txt > flamegraph.svg
+"""
+import hmac
+import json
+import os
+import uuid
+from functools import wraps
+
+from flask import Blueprint, Response, g, request
+
+from apps.profiler.serializers import ProfileResultValidator, ProfileValidator
+from extensions.flask_api.api import route
+from extensions.flask_api.exceptions import APIException, PermissionDenied
+from extensions.flask_api.serializer import validate
+from extensions.profiler import (
+    ProfilerBusy,
+    start_profile,
+    track_request,
+    untrack_request,
+)
+from extensions.project_config import get_config
+from extensions.redis_cluster import redis_client
+
+blueprint = Blueprint("profiler", __name__)
+
+config = get_config()
+
+# 采样期间记录每个线程正在处理的 endpoint
+blueprint.before_app_request(track_request)
+blueprint.teardown_app_request(untrack_request)
+
+
+def token_required(view):
+    """没有开启 profiler 或者 token 不正确时拒绝访问"""
+
+    @wraps(view)
+    def decorator(*args, **kwargs):
+        if not config.PROFILER_ENABLED or not config.PROFILER_TOKEN:
+            raise PermissionDenied
+
+        authorization = request.headers.get("Authorization", "")
+        expected = f"Bearer {config.PROFILER_TOKEN}"
+        if not hmac.compare_digest(authorization.encode(), expected.encode()):
+            raise PermissionDenied
+        return view(*args, **kwargs)
+
+    return decorator
+
+
+def check_rate_limit():
+    """SET NX: 所有 worker 中只有一个请求能成功"""
+    is_allowed = redis_client.set(
+        f"profiler:{config.SERVICE_NAME}",
+        value=os.getpid(),
+        ex=config.PROFILER_RATE_LIMIT,
+        nx=True,
+    )
+    if not is_allowed:
+        raise APIException(
+            error_type="profiler_rate_limited",
+            error_message="Profiler rate limited",
+        )
+
+
+def result_key(profile_id):
+    return f"profiler:{config.SERVICE_NAME}:{profile_id}"
+
+
+def save_result(profile_id, sampler):
+    """采样结束后在后台线程中保存结果"""
+    result = {
+        "status": "finished",
+        "pid": os.getpid(),
+        "summary": sampler.summary(),
+        "collapsed": sampler.collapsed(),
+    }
+    redis_client.set(
+        result_key(profile_id),
+        json.dumps(result),
+        ex=config.PROFILER_RESULT_TTL,
+    )
+
+
+@route(blueprint, "/profiler")
+@token_required
+@validate(ProfileValidator)
+def profile():
+    """在当前 worker 中启动后台采样, 返回 profile_id"""
+    check_rate_limit()
+    seconds = g.validated_data["seconds"]
+    profile_id = uuid.uuid4().hex
+    redis_client.set(
+        result_key(profile_id),
+        json.dumps({
+            "status": "running",
+            "pid": os.getpid()
+        }),
+        ex=int(seconds) + config.PROFILER_RESULT_TTL,
+    )
+    try:
+        start_profile(
+            seconds,
+            g.validated_data["interval"],
+            callback=lambda sampler: save_result(profile_id, sampler),
+        )
+    except ProfilerBusy:
+        redis_client.delete(result_key(profile_id))
+        raise APIException(
+            error_type="profiler_busy", error_message="Profiler busy"
+        )
+    return {"profile_id": profile_id, "pid": os.getpid(), "seconds": seconds}
+
+
+@route(blueprint, "/profiler/<profile_id>")
+@token_required
+@validate(ProfileResultValidator)
+def profile_result():
+    """读取采样结果
+    format=collapsed: 返回 flamegraph.pl 使用的 collapsed 格式
+    format=json: 返回每个 endpoint 的采样次数和最耗时的函数
+    """
+    value = redis_client.get(result_key(g.validated_data["profile_id"]))
+    if value is None:
+        raise APIException(
+            error_type="profile_not_found", error_message="Profile not found"
+        )
+    result = json.loads(value)
+    if result["status"] != "finished":
+        raise APIException(
+            error_type="profile_running",
+            error_message="Profile is still running",
+        )
+
+    if g.validated_data["format"] == "json":
+        return dict(result["summary"], pid=result["pid"])
+
+    response = Response(result["collapsed"], mimetype="text/plain")
+    response.headers["X-Profiler-Pid"] = str(result["pid"])
+    return response
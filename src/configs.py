@@ -39,6 +39,9 @@ class Testing(Config):
     # Jaeger 统计请求的频率
     SAMPLER_RATE = 1
 
+    PROFILER_ENABLED = True
+    PROFILER_TOKEN = "testing"
+
     # logger config
     LOGGING_LEVEL = "DEBUG"
 
@@ -67,6 +70,9 @@ class Staging(Config):
             os.environ.get("REDIS_STARTUP_NODES", "")
         )
 
+    PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED") == "true"
+    PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN", "")
+
     # jaeger
     JAEGER_AGENT_HOST = os.environ.get("JAEGER_AGENT_HOST")
     # Jaeger 统计请求的频率
@@ -97,5 +103,8 @@ class Production(Config):
             os.environ.get("REDIS_STARTUP_NODES", "")
         )
 
+    PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED") == "true"
+    PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN", "")
+
     # logger config
     LOGGING_LEVEL = "INFO"
@@ -16,6 +16,9 @@ class BaseConfig:
     DEBUG = True
     SECRET_KEY = "aw(*@#Hha9s8dfy1h2342j349uh123872345234673641!x"
     SERVICE_NAME = "flask_template"
+    # API 响应的 json 编码后端: stdlib / ujson / orjson
+    # ujson 需要 2.0 以上的版本, 锁定的 ujson 1.35 不可用, 会退回 stdlib
+    JSON_ENCODER = "stdlib"
 
     # cassandra config
     CASSANDRA_NODES = ["cassandra"]
@@ -23,6 +26,9 @@ class BaseConfig:
     CASSANDRA_PASSWORD = "cassandra"
     CASSANDRA_KEYSPACE = "flask_template"
     CASSANDRA_REPLICATION_FACTOR = 1
+    # 本地数据中心, 为空时使用最先连接上的节点所在的数据中心
+    CASSANDRA_LOCAL_DC = None
+    CASSANDRA_PROTOCOL_VERSION = 4
 
     # centrifugo
     CENTRIFUGO_URL = "http://centrifugo:8000"
@@ -30,11 +36,30 @@ class BaseConfig:
     # Centrifugo 的库使用 requests，requests 请求的时候，超时设置用 tuple 表示
     # 类型: (connect timeout, read timeout)
     CENTRIFUGO_TIMEOUT = (1.5, 1)
+    # publish_async 队列中最多缓存的消息数量, 超过时丢弃新的消息
+    CENTRIFUGO_PUBLISH_QUEUE_SIZE = 10000
+    # publish_async 一次 http 请求最多发送的消息数量
+    CENTRIFUGO_PUBLISH_BATCH_SIZE = 100
+    # broadcast_users 每个 broadcast command 最多包含的 channel 数量
+    CENTRIFUGO_BROADCAST_CHUNK_SIZE = 1000
+    # broadcast_users 并发发送的线程数量, 同时也是 http 连接池的大小
+    CENTRIFUGO_FANOUT_WORKERS = 8
 
     # kafka
     KAFKA_SERVER = "kafka:9092"
     KAFKA_HEALTHZ_TOPIC = "FlaskTemplateHealthz"
     FLASK_TEMPLATE_TOPIC = "FlaskTemplate"
+    # 批量发送: 等待时间越长, 每批的消息越多, 吞吐量越高, 延迟也越高
+    KAFKA_LINGER_MS = 5
+    KAFKA_BATCH_NUM_MESSAGES = 10000
+    # 单独设置某些 topic 的 producer 配置, eg: {"FlaskTemplate": {"linger.ms": 50}}
+    KAFKA_TOPIC_CONFIGS = {}
+    # 后台处理发送结果的间隔, 单位: 秒
+    KAFKA_POLL_INTERVAL = 0.1
+    # 本地队列满时, 发送消息最多阻塞的时间, 单位: 秒
+    KAFKA_PRODUCE_BLOCK_TIMEOUT = 1
+    # 进程退出时, 等待本地队列中的消息发送完成的最长时间, 单位: 秒
+    KAFKA_SHUTDOWN_TIMEOUT = 3
 
     # redis cluster
     REDIS_STARTUP_NODES = [{"host": "redis_cluster", "port": 7000}]
@@ -53,6 +78,34 @@ class BaseConfig:
     # OpenTelemetry
     JAEGER_AGENT_HOST = ""
     SAMPLER_RATE = 0
+    # head: 请求开始时按 SAMPLER_RATE 采样
+    # tail: 记录所有请求, 只发送慢请求, 失败的请求和 TRACE_TAIL_BASELINE_RATE 的请求
+    TRACE_SAMPLING_MODE = "head"
+    # 慢请求的阈值, 单位: 秒
+    TRACE_TAIL_LATENCY_THRESHOLD = 0.5
+    # 各个 endpoint 的阈值, key 为 url rule, eg: {"/paging": 1}
+    TRACE_TAIL_ENDPOINT_THRESHOLDS = {}
+    TRACE_TAIL_BASELINE_RATE = 0.01
+    # 内存中最多缓存的未结束的 trace 数量
+    TRACE_TAIL_MAX_TRACES = 10000
+
+    # API metrics, 由 /metrics 输出
+    METRICS_ENABLED = True
+    # 多个 worker 汇总数据的目录, 为空时只输出当前进程的数据
+    METRICS_DIR = "/tmp/flask_template_metrics"
+    # worker 写入数据的间隔, 单位: 秒
+    METRICS_FLUSH_INTERVAL = 5
+
+    # 采样 profiler, 见 apps/profiler
+    PROFILER_ENABLED = False
+    # 请求需要带上 Authorization: Bearer <PROFILER_TOKEN>, 为空时不能访问
+    PROFILER_TOKEN = ""
+    # 单次采样的最长时间, 单位: 秒
+    PROFILER_MAX_SECONDS = 20
+    # 所有 worker 在这段时间内只能采样一次, 单位: 秒
+    PROFILER_RATE_LIMIT = 60
+    # 采样结果在 redis 中保存的时间, 单位: 秒
+    PROFILER_RESULT_TTL = 600
 
     # logger config
     LOGGING_LEVEL = "INFO"
@@ -1,24 +1,18 @@
-from cassandra.auth import PlainTextAuthProvider
-from cassandra.cluster import Cluster
+from extensions.cassandra_orm.management import DatabaseManagement
 
 
 class CassandraCqlClient:
+    """app.cql 和 cqlengine 共用 DatabaseManagement 的 Cluster 和 Session"""
 
     def __init__(self, app):
         self.app = app
-        auth = PlainTextAuthProvider(
-            username=self.app.config["CASSANDRA_USER"],
-            password=self.app.config["CASSANDRA_PASSWORD"],
-        )
-
-        self.cluster = Cluster(
-            self.app.config["CASSANDRA_NODES"], auth_provider=auth
-        )
+        self.db_management = DatabaseManagement(app)
 
     def setup_cql(self):
-        self.app.cql = self.cluster.connect(
-            self.app.config["CASSANDRA_KEYSPACE"]
-        )
+        self.db_management.connect()
+        self.app.cql = self.db_management.cql_session()
+        # app.cql.execute(app.cql_statements.prepare(cql), parameters)
+        self.app.cql_statements = self.db_management.prepared_statements
 
     def register_cassandra_cql(self):
         """启动 Cassandra cql"""
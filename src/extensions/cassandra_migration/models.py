@@ -19,6 +19,22 @@ class MigrationRecord(Model):
     created_at = columns.DateTime(default=datetime.utcnow)
 
 
+class MigrationCheckpoint(Model):
+    """TokenRangeMigration 已完成的 token 范围
+    migration 中断后重新执行时, 跳过已完成的范围
+    """
+
+    __table_name__ = "migration_checkpoint"
+
+    project = columns.Text(partition_key=True)
+    migration = columns.Text(partition_key=True)
+    start_token = columns.BigInt(primary_key=True)
+    end_token = columns.BigInt(primary_key=True)
+    rows = columns.BigInt()
+    written = columns.BigInt()
+    created_at = columns.DateTime(default=datetime.utcnow)
+
+
 def run_migration(migration_module, migration_id, migration_name):
     """执行 migration 操作"""
     # 执行 migration 操作
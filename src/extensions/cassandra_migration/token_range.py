@@ -0,0 +1,313 @@
+"""
+按 token 范围并发迁移数据
+
+1. Murmur3 的 token 环 (-2^63, 2^63 - 1] 平均分成 split_count 段
+2. 多个线程并发处理不同的 token 范围, 每段只扫描自己范围内的数据
+3. 写入使用 execute_async, 每段最多同时有 max_in_flight 个写请求
+4. 每段处理完成后记录到 MigrationCheckpoint, 中断后重新执行会跳过已完成的范围
+
+eg:
+    def add_new_property(row):
+        if row["new_property"] is not None:
+            return None
+        return {"new_property": "init value"}
+
+    def migrate():
+        return TokenRangeMigration(
+            MyModel, add_new_property, name=__name__, fields=["new_property"]
+        ).run()
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import click
+
+from extensions.cassandra_migration.models import MigrationCheckpoint
+from extensions.cassandra_orm.management import DatabaseManagement
+from extensions.cassandra_orm.queries import select_columns
+from extensions.project_config import get_config
+
+MIN_TOKEN = -2**63
+MAX_TOKEN = 2**63 - 1
+RING_SIZE = MAX_TOKEN - MIN_TOKEN
+
+
+def split_token_ranges(split_count):
+    """token 环平均分成 split_count 段, 返回 [(start, end)], 范围为 (start, end]"""
+    step = RING_SIZE // split_count
+    boundaries = [MIN_TOKEN + step * index for index in range(split_count)]
+    boundaries.append(MAX_TOKEN)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def token_span(start_token, end_token):
+    """token 范围 (start, end] 的大小, start >= end 时范围跨过了环的终点"""
+    if start_token < end_token:
+        return end_token - start_token
+    return RING_SIZE - (start_token - end_token)
+
+
+def sample_token_ranges(token_ranges, count):
+    """在所有 token 范围中均匀地取 count 段"""
+    count = min(max(count, 1), len(token_ranges))
+    step = len(token_ranges) / count
+    return [token_ranges[int(index * step)] for index in range(count)]
+
+
+def quote(name):
+    return f'"{name}"'
+
+
+class TokenRangeMigration:
+
+    def __init__(
+        self,
+        model,
+        transform,
+        name,
+        fields=None,
+        split_count=256,
+        concurrency=4,
+        max_in_flight=100,
+        fetch_size=1000,
+    ):
+        """
+        model: 需要迁移的 cqlengine model
+        transform(row): row 为字段名到值的 dict, 返回需要更新的字段 dict, 返回 None 时跳过
+        name: migration 名称, 用于记录已完成的 token 范围, 一般使用 __name__
+        fields: 需要读取的字段, 主键字段总是会读取
+        split_count: token 环分成多少段
+        concurrency: 同时处理的 token 范围数量
+        max_in_flight: 每个 token 范围同时进行的写请求数量
+        fetch_size: 扫描时每页读取的行数
+        """
+        self.model = model
+        self.transform = transform
+        self.name = name
+        self.split_count = split_count
+        self.concurrency = concurrency
+        self.max_in_flight = max_in_flight
+        self.fetch_size = fetch_size
+
+        self.partition_keys = list(model._partition_keys)
+        self.primary_keys = list(model._primary_keys)
+        fields = select_columns(model, fields)
+        self.fields = self.primary_keys + [
+            field for field in fields if field not in self.primary_keys
+        ]
+
+        self.project = get_config().CASSANDRA_KEYSPACE
+        self.db_management = DatabaseManagement.instance()
+        if self.db_management is None:
+            raise RuntimeError("Cassandra is not connected")
+
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.written = 0
+        self.finished_ranges = 0
+
+    def column_name(self, field):
+        return self.model._columns[field].db_field_name
+
+    def select_cql(self):
+        """读取一个 token 范围内的数据"""
+        columns = ", ".join(
+            quote(self.column_name(field)) for field in self.fields
+        )
+        token = ", ".join(
+            quote(self.column_name(field)) for field in self.partition_keys
+        )
+        return (
+            f"SELECT {columns} FROM {self.model.column_family_name()} "
+            f"WHERE token({token}) > ? AND token({token}) <= ?"
+        )
+
+    def write_cql(self, fields):
+        """INSERT 只写入给定的字段, 其他字段保持不变"""
+        fields = self.primary_keys + list(fields)
+        columns = ", ".join(quote(self.column_name(field)) for field in fields)
+        values = ", ".join("?" for _ in fields)
+        return (
+            f"INSERT INTO {self.model.column_family_name()} "
+            f"({columns}) VALUES ({values})"
+        )
+
+    def finished_token_ranges(self):
+        """之前已经完成的 token 范围"""
+        checkpoints = MigrationCheckpoint.objects.filter(
+            project=self.project, migration=self.name
+        )
+        return {(checkpoint.start_token, checkpoint.end_token)
+                for checkpoint in checkpoints}
+
+    def scan_range(self, start_token, end_token, write=True):
+        """处理一个 token 范围, 返回读取和需要写入的行数
+        write: 为 False 时只执行 transform, 不写入数据
+        """
+        session = self.db_management.db_session
+        statement = self.db_management.prepare(self.select_cql()).bind(
+            (start_token, end_token)
+        )
+        statement.fetch_size = self.fetch_size
+
+        rows, written = 0, 0
+        in_flight = deque()
+        for row in session.execute(statement):
+            rows += 1
+            values = self.transform({
+                field: row[self.column_name(field)] for field in self.fields
+            })
+            if not values:
+                continue
+            written += 1
+            if not write:
+                continue
+
+            # 达到上限时等待最早的写请求完成
+            if len(in_flight) >= self.max_in_flight:
+                in_flight.popleft().result()
+
+            write_statement = self.db_management.prepare(self.write_cql(values))
+            parameters = [
+                row[self.column_name(field)] for field in self.primary_keys
+            ]
+            parameters.extend(values.values())
+            in_flight.append(session.execute_async(write_statement, parameters))
+
+        while in_flight:
+            in_flight.popleft().result()
+        return rows, written
+
+    def migrate_range(self, start_token, end_token):
+        """迁移一个 token 范围, 完成后记录到 MigrationCheckpoint"""
+        rows, written = self.scan_range(start_token, end_token)
+        MigrationCheckpoint.create(
+            project=self.project,
+            migration=self.name,
+            start_token=start_token,
+            end_token=end_token,
+            rows=rows,
+            written=written,
+        )
+        return rows, written
+
+    def _run_range(self, token_range):
+        rows, written = self.migrate_range(*token_range)
+        with self._lock:
+            self.rows += rows
+            self.written += written
+            self.finished_ranges += 1
+            self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.rows / elapsed if elapsed else 0
+        progress = f"{self.finished_ranges}/{self.pending_ranges}"
+        click.echo(
+            f"{self.name}: {progress} ranges, {self.rows} rows read, "
+            f"{self.written} rows written, {rate:.0f} rows/s"
+        )
+
+    def size_estimate(self):
+        """根据 system.size_estimates 估算表的 partition 数量和数据大小
+        size_estimates 只包含协调节点负责的 token 范围, 按覆盖的比例换算到整个环
+        """
+        rows = self.db_management.db_session.execute(
+            "SELECT range_start, range_end, mean_partition_size, "
+            "partitions_count FROM system.size_estimates "
+            "WHERE keyspace_name = %s AND table_name = %s",
+            (self.model._get_keyspace(), self.model._raw_column_family_name()),
+        )
+
+        covered, partitions, size = 0, 0, 0
+        for row in rows:
+            covered += token_span(
+                int(row["range_start"]), int(row["range_end"])
+            )
+            partitions += row["partitions_count"]
+            size += row["partitions_count"] * row["mean_partition_size"]
+
+        if not covered:
+            return {"partitions": None, "bytes": None}
+        ratio = RING_SIZE / covered
+        return {
+            "partitions": int(partitions * ratio),
+            "bytes": int(size * ratio),
+        }
+
+    def dry_run(self, sample=1):
+        """只读取 sample 个 token 范围执行 transform, 不写入数据
+        根据采样的结果估算整个表的行数, 写入量和迁移时间
+        """
+        token_ranges = sample_token_ranges(
+            split_token_ranges(self.split_count), sample
+        )
+        started_at = time.monotonic()
+        rows, written = 0, 0
+        for token_range in token_ranges:
+            _rows, _written = self.scan_range(*token_range, write=False)
+            rows += _rows
+            written += _written
+        elapsed = time.monotonic() - started_at
+
+        # 采样的范围占整个环的比例
+        ratio = sum(
+            token_span(*token_range) for token_range in token_ranges
+        ) / RING_SIZE
+        estimated_rows = int(rows / ratio)
+        row_cost = elapsed / rows if rows else 0
+        size = self.size_estimate()
+        return {
+            "migration": self.name,
+            "table": self.model.column_family_name(),
+            "sampled_ranges": len(token_ranges),
+            "sampled_rows": rows,
+            "sampled_writes": written,
+            "row_cost_ms": row_cost * 1000,
+            "estimated_rows": estimated_rows,
+            "estimated_writes": int(written / ratio),
+            # 多个 token 范围并发处理, 不包含写入的耗时
+            "estimated_seconds": estimated_rows * row_cost / self.concurrency,
+            "estimated_partitions": size["partitions"],
+            "estimated_bytes": size["bytes"],
+        }
+
+    def run(self):
+        """执行迁移, 返回迁移结果"""
+        finished = self.finished_token_ranges()
+        token_ranges = [
+            token_range for token_range in split_token_ranges(self.split_count)
+            if token_range not in finished
+        ]
+        self.pending_ranges = len(token_ranges)
+        if finished:
+            click.echo(
+                f"{self.name}: resume, {len(finished)} ranges already migrated"
+            )
+
+        self.started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [
+                executor.submit(self._run_range, token_range)
+                for token_range in token_ranges
+            ]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # 第一个范围失败时取消还没有开始的范围, 不再等待它们执行完
+                # 已完成的范围记录了 checkpoint, 重新执行时会跳过
+                executor.shutdown(cancel_futures=True)
+                raise
+
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "ranges": len(token_ranges),
+            "skipped_ranges": len(finished),
+            "rows": self.rows,
+            "written": self.written,
+            "elapsed": elapsed,
+            "rows_per_second": self.rows / elapsed if elapsed else 0,
+        }
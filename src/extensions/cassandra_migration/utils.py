@@ -12,6 +12,10 @@ migration 脚本:
         # 记录 migration 结果
         result.append({})
         return result
+3. 数据量大的表使用 token_range.TokenRangeMigration 按 token 范围并发迁移,
+   中断后重新执行 migrate 会从上次完成的位置继续
+4. 脚本中定义 get_migration() 返回 TokenRangeMigration 时,
+   可以使用 migrate --dry-run 采样估算迁移的时间和写入量
 """
 import importlib
 import pkgutil
@@ -21,20 +25,23 @@ from cassandra.cqlengine import management
 
 import migrations
 from extensions.cassandra_migration.models import (
+    MigrationCheckpoint,
     MigrationRecord,
     run_migration,
 )
 from extensions.project_config import get_config
 
 
-def migrate():
+def migrate(dry_run=False, sample=1):
     """
     migration 入口流程:
     1. 获取所有没有执行过的 migration 脚本
     2. 依次执行 migration 脚本
+    dry_run: 只采样 sample 个 token 范围估算迁移的时间, 不写入数据
     """
     # 更新 MigrationRecord 表
     management.sync_table(MigrationRecord)
+    management.sync_table(MigrationCheckpoint)
 
     # 已经执行过的 migrate id 记录
     config = get_config()
@@ -44,6 +51,11 @@ def migrate():
     )
     unexecuted_migrations = get_newest_migration(migrated_record)
 
+    if dry_run:
+        for migration_module in unexecuted_migrations:
+            dry_run_migration(migration_module, sample)
+        return
+
     # 执行 migration
     for index, migration_module in enumerate(unexecuted_migrations):
         migration_name = migration_module.__name__
@@ -74,3 +86,30 @@ def get_newest_migration(migrated_record):
                     importlib.import_module("migrations." + module.name)
                 )
     return unexecuted_migrations
+
+
+def dry_run_migration(migration_module, sample):
+    """采样执行 migration, 输出估算的结果"""
+    migration_name = migration_module.__name__
+    if not hasattr(migration_module, "get_migration"):
+        click.echo(f"{migration_name}: dry run is not supported")
+        return
+
+    report = migration_module.get_migration().dry_run(sample=sample)
+    partitions = report["estimated_partitions"]
+    size = (report["estimated_bytes"] or 0) / 1024**2
+    lines = [
+        f"Migration: {migration_name}",
+        f"  table: {report['table']}",
+        f"  sampled ranges: {report['sampled_ranges']}",
+        f"  sampled rows: {report['sampled_rows']}",
+        f"  sampled writes: {report['sampled_writes']}",
+        f"  cost per row: {report['row_cost_ms']:.3f} ms",
+        f"  estimated rows: {report['estimated_rows']}",
+        f"  estimated writes: {report['estimated_writes']}",
+        f"  estimated partitions: {partitions if partitions else '-'}",
+        f"  estimated size: {size:.1f} MB",
+        # 不包含写入的耗时
+        f"  estimated time: {report['estimated_seconds']:.0f} s",
+    ]
+    click.echo("\n".join(lines))
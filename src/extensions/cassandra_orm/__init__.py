@@ -1,6 +1,7 @@
 import logging
 
 from extensions.cassandra_orm.management import DatabaseManagement
+from extensions.client_registry import client_registry
 
 logger = logging.getLogger("flask")
 
@@ -20,3 +21,32 @@ class CassandraSessionBuilder:
     def register_cassandra_session(self):
         """启动 Cassandra db session"""
         self.setup_db_session()
+
+
+def release_before_fork():
+    """gunicorn preload_app 时, master 进程在 fork 之前关闭连接"""
+    db_management = DatabaseManagement.instance()
+    if db_management is not None:
+        db_management.release_before_fork()
+
+
+def reconnect_after_fork():
+    """gunicorn preload_app 时, 在 worker 中重新连接 fork 之前创建的 Cluster"""
+    db_management = DatabaseManagement.instance()
+    if db_management is not None:
+        db_management.reconnect_after_fork()
+
+
+client_registry.register_fork_handler(
+    before=release_before_fork, after=reconnect_after_fork
+)
+
+
+def disconnect(timeout):
+    """worker 退出时关闭 Cassandra 连接"""
+    db_management = DatabaseManagement.instance()
+    if db_management is not None:
+        db_management.disconnect()
+
+
+client_registry.register_shutdown_handler("cassandra", disconnect)
@@ -1,4 +1,5 @@
 import inspect
+import threading
 
 from cassandra import AlreadyExists, ConsistencyLevel
 from cassandra.auth import PlainTextAuthProvider
@@ -12,7 +13,14 @@ from cassandra.cqlengine import connection as cqlengine_connection
 from cassandra.cqlengine import management
 from cassandra.cqlengine.models import Model
 from cassandra.cqltypes import UserType
-from cassandra.query import dict_factory
+from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
+from cassandra.query import dict_factory, named_tuple_factory
+
+from extensions.cassandra_orm.schema import sync_schema
+from extensions.cassandra_orm.tracing import instrument_session
+
+# app.cql 使用的 execution profile, 返回 namedtuple
+EXEC_PROFILE_CQL = "cql"
 
 
 def get_models(app_module, keyspace):
@@ -39,6 +47,95 @@ def get_models(app_module, keyspace):
     return table_models, user_type_models
 
 
+def load_balancing_policy(config):
+    """token aware + dc aware 的负载均衡策略
+    prepared statement 可以直接发送到数据所在的节点, 每个 profile 需要单独的实例
+    """
+    return TokenAwarePolicy(
+        DCAwareRoundRobinPolicy(local_dc=config.get("CASSANDRA_LOCAL_DC"))
+    )
+
+
+def build_cluster(config, execution_profiles=None):
+    """根据配置创建 Cluster"""
+    if execution_profiles is None:
+        profile = ExecutionProfile(
+            load_balancing_policy=load_balancing_policy(config)
+        )
+        execution_profiles = {EXEC_PROFILE_DEFAULT: profile}
+
+    auth = PlainTextAuthProvider(
+        username=config["CASSANDRA_USER"],
+        password=config["CASSANDRA_PASSWORD"],
+    )
+    # protocol version 3 以上每个节点使用一个可以并发请求的连接, 不需要设置连接池大小
+    return Cluster(
+        config["CASSANDRA_NODES"],
+        execution_profiles=execution_profiles,
+        auth_provider=auth,
+        protocol_version=config["CASSANDRA_PROTOCOL_VERSION"],
+    )
+
+
+class PreparedStatementCache:
+    """session 的 prepared statement 缓存, 相同的 cql 只 prepare 一次"""
+
+    def __init__(self, session=None):
+        self.session = session
+        self._statements = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def bind(self, session):
+        """切换 session, prepared statement 属于 session, 需要清空缓存"""
+        with self._lock:
+            self.session = session
+            self._statements = {}
+
+    def prepare(self, cql):
+        statement = self._statements.get(cql)
+        if statement is not None:
+            self.hits += 1
+            return statement
+
+        with self._lock:
+            statement = self._statements.get(cql)
+            if statement is None:
+                self.misses += 1
+                statement = self.session.prepare(cql)
+                self._statements[cql] = statement
+        return statement
+
+    def __len__(self):
+        return len(self._statements)
+
+
+class ProfiledSession:
+    """使用指定 execution profile 的 session 代理
+    和 DatabaseManagement 共用同一个 Cluster 和 Session, 重新连接后自动使用新的 session
+    """
+
+    def __init__(self, db_management, execution_profile):
+        self.db_management = db_management
+        self.execution_profile = execution_profile
+
+    @property
+    def session(self):
+        return self.db_management.db_session
+
+    def execute(self, query, parameters=None, *args, **kwargs):
+        kwargs.setdefault("execution_profile", self.execution_profile)
+        return self.session.execute(query, parameters, *args, **kwargs)
+
+    def execute_async(self, query, parameters=None, *args, **kwargs):
+        kwargs.setdefault("execution_profile", self.execution_profile)
+        return self.session.execute_async(query, parameters, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
 class Singleton(type):
     """单例元类, 用于创建单例对象"""
 
@@ -49,6 +146,14 @@ class Singleton(type):
             cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
 
+    def instance(cls):
+        """已经创建的单例对象, 没有创建时返回 None"""
+        return cls._instances.get(cls)
+
+    def reset(cls):
+        """删除单例对象, 下次调用时重新创建, 不会关闭对象持有的连接"""
+        cls._instances.pop(cls, None)
+
 
 class DatabaseManagement(metaclass=Singleton):
     """数据库管理器类, 单例: 使用 DatabaseManagement() 得到的永远是一个对象"""
@@ -58,6 +163,9 @@ class DatabaseManagement(metaclass=Singleton):
         self._keyspace = None
         self.db_session = None
         self._is_connected = False
+        # fork 之前释放了连接, fork 之后需要重新连接
+        self._reconnect_after_fork = False
+        self.prepared_statements = PreparedStatementCache()
         self.config = app.config
         self.replication_factor = self.config["CASSANDRA_REPLICATION_FACTOR"]
 
@@ -71,45 +179,90 @@ class DatabaseManagement(metaclass=Singleton):
     def keyspace(self, new_keyspace):
         self._keyspace = new_keyspace
 
-    def connect(self):
-        """连接数据库"""
-        if self._is_connected:
-            return
-
-        profile = ExecutionProfile(
-            row_factory=dict_factory,
-            request_timeout=self.timeout,
-            consistency_level=ConsistencyLevel.LOCAL_QUORUM,
-        )
-
-        auth = PlainTextAuthProvider(
-            username=self.config["CASSANDRA_USER"],
-            password=self.config["CASSANDRA_PASSWORD"],
-        )
-
-        cluster = Cluster(
-            self.config["CASSANDRA_NODES"],
-            execution_profiles={EXEC_PROFILE_DEFAULT: profile},
-            auth_provider=auth,
+    def execution_profiles(self):
+        """cqlengine 和 app.cql 共用一个 Cluster, 通过 execution profile 区分"""
+        return {
+            EXEC_PROFILE_DEFAULT:
+                ExecutionProfile(
+                    load_balancing_policy=load_balancing_policy(self.config),
+                    row_factory=dict_factory,
+                    request_timeout=self.timeout,
+                    consistency_level=ConsistencyLevel.LOCAL_QUORUM,
+                ),
+            # 和驱动的默认配置一致
+            EXEC_PROFILE_CQL:
+                ExecutionProfile(
+                    load_balancing_policy=load_balancing_policy(self.config),
+                    row_factory=named_tuple_factory,
+                    request_timeout=self.timeout,
+                    consistency_level=ConsistencyLevel.LOCAL_ONE,
+                ),
+        }
+
+    def open_session(self):
+        """创建 Cluster 和没有指定 keyspace 的 Session, 进程内只创建一次"""
+        if self.db_session is not None:
+            return self.db_session
+
+        cluster = build_cluster(
+            self.config, execution_profiles=self.execution_profiles()
         )
         try:
             self.db_session = cluster.connect()
         except NoHostAvailable:
             # 再尝试连接一次
             self.db_session = cluster.connect()
-        self.db_session.set_keyspace(self.keyspace)
+        instrument_session(self.db_session)
+        self.prepared_statements.bind(self.db_session)
+        return self.db_session
 
+    def connect(self):
+        """连接数据库"""
+        if self._is_connected:
+            return
+
+        self.open_session().set_keyspace(self.keyspace)
         cqlengine_connection.set_session(self.db_session)
 
         self._is_connected = True
 
+    def cql_session(self):
+        """给 app.cql 使用的 session"""
+        return ProfiledSession(self, EXEC_PROFILE_CQL)
+
     def disconnect(self):
         """断开连接"""
-        if not self._is_connected:
+        if self.db_session is None:
             return
         self.db_session.cluster.shutdown()
         self.db_session = None
+        self.prepared_statements.bind(None)
+        self._is_connected = False
+
+    def release_before_fork(self):
+        """fork 之前关闭连接, fork 之后在子进程中重新连接"""
+        if self.db_session is None:
+            return
+
+        was_connected = self._is_connected
+        self.disconnect()
+        self._reconnect_after_fork = was_connected
+
+    def reconnect_after_fork(self):
+        """fork 之后重新连接
+        父进程的连接和驱动的 IO 线程在子进程中不可用, 不能调用 shutdown, 直接丢弃
+        """
+        need_connect = self._is_connected or self._reconnect_after_fork
+        self.db_session = None
+        self.prepared_statements.bind(None)
         self._is_connected = False
+        self._reconnect_after_fork = False
+        if need_connect:
+            self.connect()
+
+    def prepare(self, cql):
+        """获取 prepared statement, 相同的 cql 只 prepare 一次"""
+        return self.prepared_statements.prepare(cql)
 
     def create_keyspace_if_not_exist(self):
         """
@@ -124,26 +277,14 @@ class DatabaseManagement(metaclass=Singleton):
             (self.keyspace, self.replication_factor)
         )
 
-        auth = PlainTextAuthProvider(
-            username=self.config["CASSANDRA_USER"],
-            password=self.config["CASSANDRA_PASSWORD"],
-        )
-
-        cluster = Cluster(self.config["CASSANDRA_NODES"], auth_provider=auth)
-        try:
-            db_session = cluster.connect()
-        except NoHostAvailable:
-            # 再尝试连接一次
-            db_session = cluster.connect()
-
         try:
-            db_session.execute(create_keyspace_cql)
+            self.open_session().execute(create_keyspace_cql)
         except AlreadyExists:
             return False
         return True
 
     def sync_db(self, *model_modules):
-        """同步数据库
+        """同步数据库, 所有模块中的 model 一起计算需要执行的 DDL
         eg: sync_db(model_1, model_2)
         """
         self.create_keyspace_if_not_exist()
@@ -160,10 +301,10 @@ class DatabaseManagement(metaclass=Singleton):
             table_models.extend(_table_models)
             user_type_models.extend(_user_type_models)
 
-        for model in user_type_models:
-            management.sync_type(ks_name=self.keyspace, type_model=model)
-        for model in table_models:
-            management.sync_table(model)
+        # 只执行需要的 DDL, 所有 model 一起同步
+        sync_schema(
+            self.db_session, self.keyspace, table_models, user_type_models
+        )
 
     def drop_db(self):
         """删除数据表, 单元测试时使用"""
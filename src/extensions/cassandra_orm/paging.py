@@ -0,0 +1,109 @@
+"""
+Cassandra 驱动层分页
+
+每次请求只读取一页数据, 下一页通过 paging_state 继续读取
+paging_state 需要返回给客户端, 使用 url safe base64 编码
+"""
+import base64
+import binascii
+
+from cassandra.cqlengine import connection
+from cassandra.query import SimpleStatement
+
+DEFAULT_FETCH_SIZE = 1000
+
+
+def encode_paging_state(paging_state: bytes):
+    """paging_state 编码为字符串"""
+    if paging_state is None:
+        return None
+    return base64.urlsafe_b64encode(paging_state).decode()
+
+
+def decode_paging_state(value: str):
+    """解码客户端传回的 paging_state, 格式错误时抛出 ValueError"""
+    if not value:
+        return None
+    try:
+        # validate=True: 拒绝包含非 base64 字符的值, 而不是忽略这些字符
+        return base64.b64decode(value.encode(), altchars=b"-_", validate=True)
+    except (binascii.Error, UnicodeEncodeError) as error:
+        raise ValueError("Invalid paging state") from error
+
+
+def make_statement(query, fetch_size):
+    """cql 字符串包装为设置了 fetch_size 的 statement"""
+    if isinstance(query, str):
+        return SimpleStatement(query, fetch_size=fetch_size)
+    query.fetch_size = fetch_size
+    return query
+
+
+def fetch_page(session, query, parameters=None, size=10, paging_state=None):
+    """只读取一页数据
+    返回: (当前页的数据, 下一页的 paging_state), 没有下一页时 paging_state 为 None
+    """
+    result = session.execute(
+        make_statement(query, size), parameters, paging_state=paging_state
+    )
+    return result.current_rows, result.paging_state
+
+
+def iter_rows(session, query, parameters=None, fetch_size=DEFAULT_FETCH_SIZE):
+    """流式读取所有数据, 驱动按 fetch_size 逐页拉取, 不会一次性加载到内存"""
+    return session.execute(make_statement(query, fetch_size), parameters)
+
+
+def queryset_statement(queryset, fetch_size):
+    """cqlengine 的查询转换为驱动的 statement, 返回: (statement, 参数)"""
+    model = queryset.model
+    # cqlengine 的 queryset 默认带有 LIMIT 10000, 驱动分页时会在 10000 行后停止
+    select = queryset.limit(None)._select_query()
+    statement = SimpleStatement(
+        str(select),
+        consistency_level=queryset._consistency,
+        fetch_size=fetch_size,
+    )
+    # 和 cqlengine 一样设置 routing_key, 查询发送到数据所在的节点
+    if model._partition_key_index:
+        key_values = select.partition_key_values(model._partition_key_index)
+        if not any(value is None for value in key_values):
+            statement.routing_key = model._routing_key_from_values(
+                key_values,
+                connection.get_cluster(queryset._connection).protocol_version,
+            )
+            statement.keyspace = model._get_keyspace()
+    return statement, select.get_context()
+
+
+def result_constructor(queryset):
+    """和 queryset 迭代时一样把 row 转换为 model 对象"""
+    return queryset._maybe_inject_deferred(queryset._get_result_constructor())
+
+
+def fetch_queryset_page(queryset, size=10, paging_state=None):
+    """cqlengine 的查询只读取一页数据, 和 queryset 迭代时返回相同类型的对象
+    返回: (当前页的对象, 下一页的 paging_state)
+    """
+    statement, parameters = queryset_statement(queryset, size)
+    session = connection.get_session(queryset._connection)
+    result = session.execute(
+        statement,
+        parameters,
+        timeout=queryset._timeout,
+        paging_state=paging_state,
+    )
+    construct = result_constructor(queryset)
+    return [construct(row) for row in result.current_rows], result.paging_state
+
+
+def iter_queryset(queryset, fetch_size=DEFAULT_FETCH_SIZE):
+    """流式读取 cqlengine 查询的所有数据
+    直接迭代 queryset 会把所有对象缓存在 _result_cache 中, 并且最多返回 10000 行,
+    这里由驱动按 fetch_size 逐页拉取, 不缓存已经返回的对象
+    """
+    statement, parameters = queryset_statement(queryset, fetch_size)
+    session = connection.get_session(queryset._connection)
+    construct = result_constructor(queryset)
+    for row in iter_rows(session, statement, parameters, fetch_size):
+        yield construct(row)
@@ -0,0 +1,166 @@
+"""
+绕过 cqlengine 的批量查询, 使用 prepared statement 并发执行
+"""
+from cassandra.concurrent import (
+    execute_concurrent,
+    execute_concurrent_with_args,
+)
+from cassandra.cqlengine import ValidationError
+from cassandra.query import UNSET_VALUE, BatchStatement, BatchType
+
+DEFAULT_CONCURRENCY = 50
+# 一个 unlogged batch 中最多的语句数量, batch 太大会给协调节点带来压力
+DEFAULT_BATCH_SIZE = 50
+
+
+def select_columns(model, fields=None):
+    """需要查询的字段, fields 中有不是 model 字段的值时查询所有字段
+    去重并按 model 字段的顺序排列, 相同的字段集合只 prepare 一条语句
+    """
+    if fields is None or any(field not in model._columns for field in fields):
+        return list(model._columns)
+    fields = set(fields)
+    return [name for name in model._columns if name in fields]
+
+
+def missing_primary_keys(model, keys):
+    """keys 中缺少的主键字段, 返回: {keys 中的序号: 缺少的字段列表}"""
+    missing = {}
+    for index, key in enumerate(keys):
+        names = [name for name in model._primary_keys if name not in key]
+        if names:
+            missing[index] = names
+    return missing
+
+
+def primary_key_select_cql(model, fields):
+    """根据完整主键查询单行数据的 cql"""
+    columns = ", ".join(
+        f'"{model._columns[field].db_field_name}"' for field in fields
+    )
+    conditions = " AND ".join(
+        f'"{column.db_field_name}" = ?'
+        for column in model._primary_keys.values()
+    )
+    return (
+        f"SELECT {columns} FROM {model.column_family_name()} "
+        f"WHERE {conditions}"
+    )
+
+
+def multi_get(
+    db_management, model, keys, fields=None, concurrency=DEFAULT_CONCURRENCY
+):
+    """并发地根据主键获取多行数据
+    db_management: DatabaseManagement
+    keys: 包含完整主键字段的 dict 列表
+    fields: 只查询这些字段
+    返回: 和 keys 顺序一致的列表, 每个元素为字段名到值的 dict, 不存在的数据为 None
+    """
+    missing = missing_primary_keys(model, keys)
+    if missing:
+        raise ValidationError(f"missing primary keys: {missing}")
+
+    fields = select_columns(model, fields)
+    statement = db_management.prepare(primary_key_select_cql(model, fields))
+    parameters = [
+        tuple(key[name] for name in model._primary_keys) for key in keys
+    ]
+
+    results = execute_concurrent_with_args(
+        db_management.db_session,
+        statement,
+        parameters,
+        concurrency=concurrency,
+    )
+
+    items = []
+    for _, result in results:
+        row = result.one()
+        if row is None:
+            items.append(None)
+            continue
+        items.append({
+            field: row[model._columns[field].db_field_name] for field in fields
+        })
+    return items
+
+
+def insert_cql(model, fields):
+    columns = ", ".join(
+        f'"{model._columns[field].db_field_name}"' for field in fields
+    )
+    values = ", ".join("?" for _ in fields)
+    return (
+        f"INSERT INTO {model.column_family_name()} ({columns}) "
+        f"VALUES ({values})"
+    )
+
+
+def insert_values(model, item):
+    """和 cqlengine 的 save 一样设置默认值和验证数据, 返回写入的值
+    None 使用 UNSET_VALUE, 不写入 null, 避免产生 tombstone
+    """
+    instance = model(**item)
+    instance.validate()
+    values = []
+    for name, column in model._columns.items():
+        value = column.to_database(getattr(instance, name))
+        if value is None and column.primary_key:
+            raise ValidationError(f"{name} is required")
+        values.append(UNSET_VALUE if value is None else value)
+    return values
+
+
+def bulk_insert(
+    db_management,
+    model,
+    items,
+    batch_size=DEFAULT_BATCH_SIZE,
+    concurrency=DEFAULT_CONCURRENCY,
+):
+    """批量写入数据
+    同一个 partition 的数据合并成 unlogged batch, 不同的 partition 并发写入
+    items: 字段名到值的 dict 列表
+    返回: 和 items 顺序一致的列表, 写入成功为 None, 失败为异常
+    """
+    statement = db_management.prepare(insert_cql(model, model._columns))
+    partition_indexes = [
+        list(model._columns).index(name) for name in model._partition_keys
+    ]
+
+    errors = [None] * len(items)
+    partitions = {}
+    for index, item in enumerate(items):
+        try:
+            values = insert_values(model, item)
+        except (ValidationError, TypeError, ValueError) as error:
+            errors[index] = error
+            continue
+        partition_key = tuple(values[i] for i in partition_indexes)
+        partitions.setdefault(partition_key, []).append((index, values))
+
+    # (items 中的序号, 写入的语句)
+    writes = []
+    for rows in partitions.values():
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start:start + batch_size]
+            if len(chunk) == 1:
+                writes.append(([chunk[0][0]], statement.bind(chunk[0][1])))
+                continue
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for _, values in chunk:
+                batch.add(statement, values)
+            writes.append(([index for index, _ in chunk], batch))
+
+    results = execute_concurrent(
+        db_management.db_session,
+        [(write, None) for _, write in writes],
+        concurrency=concurrency,
+        raise_on_first_error=False,
+    )
+    for (indexes, _), (success, result) in zip(writes, results):
+        if not success:
+            for index in indexes:
+                errors[index] = result
+    return errors
@@ -0,0 +1,194 @@
+"""
+对比 model 和数据库中的表结构, 只执行需要的 DDL
+
+cqlengine 的 sync_table 每个 model 单独同步, 每条 DDL 之后都会等待所有节点的
+schema 一致, 表多的时候 sync_db 需要几分钟
+这里先读取一次 keyspace 的 metadata, 计算出所有 model 需要执行的 DDL,
+按依赖顺序分成几个阶段执行, 每个阶段结束后才等待 schema 一致:
+    1. user type
+    2. 创建表, 添加字段
+    3. 创建索引
+一个阶段结束后 schema 仍不一致时停止同步, 避免后面的 DDL 在还没有看到新表的节点上失败
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from cassandra.cqlengine import columns, management
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaAgreementError(Exception):
+    """等待 max_schema_agreement_wait 之后各节点的 schema 仍不一致"""
+
+
+def collect_user_types(table_models, user_type_models=()):
+    """model 中用到的所有 user type, 被依赖的 user type 排在前面"""
+    ordered = []
+
+    def add(type_model):
+        if type_model in ordered:
+            return
+        for field in type_model._fields.values():
+            udts = []
+            columns.resolve_udts(field, udts)
+            for udt in udts:
+                if udt is not type_model:
+                    add(udt)
+        ordered.append(type_model)
+
+    for type_model in user_type_models:
+        add(type_model)
+    for model in table_models:
+        for column in model._columns.values():
+            udts = []
+            columns.resolve_udts(column, udts)
+            for udt in udts:
+                add(udt)
+    return ordered
+
+
+def diff_user_types(keyspace_meta, type_models):
+    """创建不存在的 user type, 给已存在的 user type 添加字段"""
+    statements = []
+    for type_model in type_models:
+        type_name = type_model.type_name()
+        type_meta = keyspace_meta.user_types.get(type_name)
+        if type_meta is None:
+            statements.append(
+                management.get_create_type(type_model, keyspace_meta.name)
+            )
+            continue
+
+        for field in type_model._fields.values():
+            if field.db_field_name not in type_meta.field_names:
+                statements.append(
+                    f"ALTER TYPE {keyspace_meta.name}.{type_name} "
+                    f"ADD {field.get_column_def().strip()}"
+                )
+    return statements
+
+
+def create_index_cql(model, column):
+    return (
+        f"CREATE INDEX ON {model.column_family_name()} "
+        f'("{column.db_field_name}")'
+    )
+
+
+def diff_table(keyspace_meta, model):
+    """单个 model 需要执行的 DDL
+    返回: (创建表和添加字段的 DDL, 创建索引的 DDL)
+    """
+    index_columns = [
+        column for column in model._columns.values() if column.index
+    ]
+    table_meta = keyspace_meta.tables.get(model._raw_column_family_name())
+    if table_meta is None:
+        return (
+            [management._get_create_table(model)],
+            [create_index_cql(model, column) for column in index_columns],
+        )
+
+    # 主键不一致时抛出异常
+    management._validate_pk(model, table_meta)
+
+    table_statements = []
+    for column in model._columns.values():
+        column_meta = table_meta.columns.get(column.db_field_name)
+        if column_meta is None:
+            table_statements.append(
+                f"ALTER TABLE {model.column_family_name()} "
+                f"ADD {column.get_column_def().strip()}"
+            )
+        elif column_meta.cql_type != column.db_type:
+            logger.warning(
+                f"Existing table {model.column_family_name()} has column "
+                f"{column.db_field_name} with a type ({column_meta.cql_type}) "
+                f"differing from the model type ({column.db_type})"
+            )
+
+    index_statements = []
+    for column in index_columns:
+        index_name = management._get_index_name_by_column(
+            table_meta, column.db_field_name
+        )
+        if not index_name:
+            index_statements.append(create_index_cql(model, column))
+    return table_statements, index_statements
+
+
+def plan_sync(keyspace_meta, table_models, user_type_models=()):
+    """计算所有 model 需要执行的 DDL, 返回按阶段分组的 DDL 列表"""
+    type_statements = diff_user_types(
+        keyspace_meta, collect_user_types(table_models, user_type_models)
+    )
+
+    table_statements, index_statements = [], []
+    for model in table_models:
+        _table_statements, _index_statements = diff_table(keyspace_meta, model)
+        table_statements.extend(_table_statements)
+        index_statements.extend(_index_statements)
+
+    return [type_statements, table_statements, index_statements]
+
+
+@contextmanager
+def defer_schema_agreement(cluster):
+    """执行 DDL 时不等待 schema 一致, 退出时等待一次
+    DDL 都执行成功但没有等到 schema 一致时抛出 SchemaAgreementError
+    """
+    max_schema_agreement_wait = cluster.max_schema_agreement_wait
+    cluster.max_schema_agreement_wait = 0
+    try:
+        yield
+    finally:
+        cluster.max_schema_agreement_wait = max_schema_agreement_wait
+        agreed = cluster.control_connection.wait_for_schema_agreement()
+    if not agreed:
+        raise SchemaAgreementError(
+            f"Schema agreement not reached in {max_schema_agreement_wait}s"
+        )
+
+
+def sync_schema(session, keyspace, table_models, user_type_models=()):
+    """同步所有 model 的表结构
+    一个阶段之后 schema 不一致时抛出 SchemaAgreementError, 不执行后面的阶段
+    返回: 执行的 DDL
+    """
+    started_at = time.monotonic()
+    cluster = session.cluster
+    # 同步之前的表结构, 之后的计算都使用这一份 metadata
+    keyspace_meta = cluster.metadata.keyspaces[keyspace]
+    phases = plan_sync(keyspace_meta, table_models, user_type_models)
+
+    executed = []
+    for statements in phases:
+        if not statements:
+            continue
+        with defer_schema_agreement(cluster):
+            for statement in statements:
+                logger.info(f"Sync schema: {statement}")
+                session.execute(statement)
+                executed.append(statement)
+
+    if executed:
+        cluster.refresh_keyspace_metadata(keyspace)
+
+    # user type 需要注册之后才能在 cqlengine 中使用
+    for type_model in collect_user_types(table_models, user_type_models):
+        type_model.register_for_keyspace(keyspace)
+
+    # 表的配置 (__options__) 有变化时更新, 新建的表在创建时已经包含了配置
+    existing_tables = set(keyspace_meta.tables)
+    for model in table_models:
+        table_name = model._raw_column_family_name()
+        if model.__options__ and table_name in existing_tables:
+            management._update_options(model)
+
+    logger.info(
+        f"Synced {len(table_models)} tables with {len(executed)} statements "
+        f"in {time.monotonic() - started_at:.2f}s"
+    )
+    return executed
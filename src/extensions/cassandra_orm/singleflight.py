@@ -0,0 +1,89 @@
+"""
+合并并发的相同查询
+
+同一个进程中, 多个请求同时查询同一个 key 时, 只有第一个请求真正执行查询,
+其他请求等待并共享它的结果 (或异常)
+使用 threading 的锁和 Event, gevent worker 中 monkey patch 之后同样有效
+
+注意: 返回的对象被多个请求共享, 不要修改
+model_flight 执行和被合并的次数由 /metrics 输出
+
+eg:
+    person = get_model(Person, first_name="Test")
+"""
+import threading
+
+from extensions.metrics import register_collector
+
+
+class _Call:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # 真正执行的次数和被合并的次数
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """同一时间相同的 key 只执行一次 func"""
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as error:
+            # 包括 gevent.Timeout 等不是 Exception 的异常, 否则等待的请求会得到 None
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+        }
+
+
+model_flight = SingleFlight()
+
+register_collector(
+    "model_singleflight_calls_total",
+    "role",
+    lambda: {
+        "leader": model_flight.executed,
+        "coalesced": model_flight.coalesced
+    },
+    help_text="get_model queries executed (leader) and coalesced",
+)
+
+
+def get_model(model, **primary_key):
+    """根据主键获取 model, 并发的相同查询只执行一次, 不存在时抛出 DoesNotExist"""
+    key = (model, tuple(sorted(primary_key.items())))
+    return model_flight.do(key, lambda: model.get(**primary_key))
@@ -0,0 +1,106 @@
+"""
+cassandra 请求的子 span
+
+驱动在发送请求之前, 在调用 execute / execute_async 的线程中调用
+request init listener, 这里创建子 span, 请求完成后在驱动的 IO 线程中结束
+cqlengine 的 Model.get / create 和 app.cql 都通过同一个 session 发送请求
+和 Redis / Kafka 的 span 一样用 byte_size 记录请求和返回数据的大小,
+只计算 str / bytes 的值, 返回数据只计算第一页
+"""
+import re
+
+from cassandra.query import BatchStatement
+
+from extensions.opentelemetry.spans import (
+    byte_size,
+    end_span,
+    is_recording,
+    start_child_span,
+)
+
+TABLE_PATTERN = re.compile(
+    r"\b(?:FROM|INTO|UPDATE)\s+([\w\".]+)", re.IGNORECASE
+)
+
+
+def query_string(query):
+    """SimpleStatement / BoundStatement / str 的 cql"""
+    if isinstance(query, str):
+        return query
+    prepared_statement = getattr(query, "prepared_statement", None)
+    if prepared_statement is not None:
+        return prepared_statement.query_string
+    return getattr(query, "query_string", "")
+
+
+def request_bytes(query):
+    """cql 和参数的大小
+    SimpleStatement 的参数拼接在 cql 中, BoundStatement 的参数是序列化后的 bytes,
+    prepared statement 只发送 id, 不计算 cql
+    """
+    if isinstance(query, BatchStatement):
+        size = 0
+        for prepared, statement, values in query._statements_and_parameters:
+            if not prepared:
+                size += byte_size(statement)
+            size += sum(byte_size(value) for value in values)
+        return size
+    size = sum(byte_size(value) for value in getattr(query, "values", ()))
+    if getattr(query, "prepared_statement", None) is None:
+        size += byte_size(query_string(query))
+    return size
+
+
+def rows_bytes(rows):
+    """返回的 row 可以是 dict 或 tuple"""
+    return sum(
+        byte_size(value)
+        for row in rows
+        for value in (row.values() if isinstance(row, dict) else row)
+    )
+
+
+def query_attributes(response_future):
+    cql = query_string(response_future.query)
+    attributes = {
+        "db.system": "cassandra",
+        "db.statement": cql,
+        "db.operation": cql.split(None, 1)[0].upper() if cql else "",
+        "db.cassandra.request_bytes": request_bytes(response_future.query),
+    }
+    match = TABLE_PATTERN.search(cql)
+    if match:
+        attributes["db.cassandra.table"] = match.group(1).replace('"', "")
+    return attributes
+
+
+def trace_request(response_future):
+    """session 的 request init listener"""
+    if not is_recording():
+        return
+
+    attributes = query_attributes(response_future)
+    name = f"cassandra {attributes['db.operation']}"
+    if "db.cassandra.table" in attributes:
+        name = f"{name} {attributes['db.cassandra.table']}"
+    span = start_child_span(name, lambda: attributes)
+
+    def on_result(rows):
+        # 翻页时会再次调用 callback, span 只结束一次
+        if not span.is_recording():
+            return
+        if isinstance(rows, list):
+            span.set_attribute("db.cassandra.rows", len(rows))
+            span.set_attribute("db.cassandra.response_bytes", rows_bytes(rows))
+        span.end()
+
+    def on_error(error):
+        if span.is_recording():
+            end_span(span, error)
+
+    response_future.add_callbacks(on_result, on_error)
+
+
+def instrument_session(session):
+    session.add_request_init_listener(trace_request)
+    return session
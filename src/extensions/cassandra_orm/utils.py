@@ -17,10 +17,13 @@ def sync_db(app):
 
     os.environ["CQLENG_ALLOW_SCHEMA_MANAGEMENT"] = "true"
 
+    model_modules = []
     for module_name in dir(apps):
         if module_name.startswith("__"):
             continue
 
         if hasattr(getattr(apps, module_name), "models"):
-            _models = getattr(getattr(apps, module_name), "models")
-            DatabaseManagement(app, timeout=60).sync_db(_models)
+            model_modules.append(getattr(getattr(apps, module_name), "models"))
+
+    # 所有 app 的 model 一起同步, 只读取一次表结构
+    DatabaseManagement(app, timeout=60).sync_db(*model_modules)
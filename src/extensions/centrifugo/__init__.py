@@ -5,9 +5,19 @@ from typing import Union
 
 import requests
 from cent import Client
+from opentelemetry import trace
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
+from extensions.centrifugo.fanout import broadcast
+from extensions.centrifugo.publisher import AsyncPublisher
+from extensions.client_registry import (
+    SHUTDOWN_ORDER_FLUSH,
+    LazyClient,
+    client_registry,
+)
+from extensions.opentelemetry.spans import child_span, is_recording
+
 
 def get_config(config_name: str = None):
     """
@@ -27,6 +37,44 @@ def user_channel(user_id: Union[str, uuid.UUID]) -> str:
     return f"user#{user_id}"
 
 
+class TracedClient(Client):
+    """每次请求 centrifugo 记录为子 span"""
+
+    def send(self, method=None, params=None):
+        messages = self._messages
+        if method and params is not None:
+            messages = [*messages, {"method": method, "params": params}]
+
+        def attributes():
+            channels = []
+            for message in messages:
+                params = message["params"]
+                if "channel" in params:
+                    channels.append(params["channel"])
+                channels.extend(params.get("channels", ()))
+            methods = sorted({message["method"] for message in messages})
+            return {
+                "centrifugo.methods": methods,
+                "centrifugo.commands": len(messages),
+                "centrifugo.channels": channels[:100],
+                "centrifugo.channel_count": len(channels),
+            }
+
+        if len(messages) == 1:
+            name = f"centrifugo {messages[0]['method']}"
+        else:
+            name = "centrifugo batch"
+        with child_span(name, attributes):
+            return super().send(method, params)
+
+    def _send(self, url, data):
+        if is_recording():
+            trace.get_current_span().set_attribute(
+                "centrifugo.request_bytes", len(data)
+            )
+        return super()._send(url, data)
+
+
 def initialize_centrifugo():
     config = get_config()
     session = requests.Session()
@@ -36,10 +84,15 @@ def initialize_centrifugo():
         status_forcelist=[429, 500, 503, 504],
         allowed_methods=["POST"],
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    # broadcast_users 并发发送时, 每个线程需要一个连接
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=config.CENTRIFUGO_FANOUT_WORKERS,
+        pool_maxsize=config.CENTRIFUGO_FANOUT_WORKERS,
+    )
     session.mount(prefix="http://", adapter=adapter)
 
-    return Client(
+    return TracedClient(
         config.CENTRIFUGO_URL,
         api_key=config.CENTRIFUGO_API_KEY,
         timeout=config.CENTRIFUGO_TIMEOUT,
@@ -47,4 +100,65 @@ def initialize_centrifugo():
     )
 
 
-centrifugo = initialize_centrifugo()
+def initialize_publisher():
+    # 使用单独的 Client, cent.Client 的消息缓存不是线程安全的
+    config = get_config()
+    return AsyncPublisher(
+        initialize_centrifugo(),
+        max_queue_size=config.CENTRIFUGO_PUBLISH_QUEUE_SIZE,
+        batch_size=config.CENTRIFUGO_PUBLISH_BATCH_SIZE,
+    )
+
+
+centrifugo = LazyClient("centrifugo", initialize_centrifugo)
+centrifugo_publisher = LazyClient("centrifugo_publisher", initialize_publisher)
+
+
+def publish_async(channel, data, uid=None):
+    """在后台线程中发送消息, 不阻塞请求
+    返回: 是否放入了队列, 队列已满时消息会被丢弃
+    data 不能序列化为 json 时抛出 TypeError
+    """
+    return centrifugo_publisher.publish(channel, data, uid=uid)
+
+
+def broadcast_users(user_ids, data):
+    """给多个用户发送同一条消息
+    返回: 发送结果, 包含每组的耗时和错误
+    """
+    config = get_config()
+    channels = [user_channel(user_id) for user_id in user_ids]
+    # 各组在线程池中发送, 只记录整个 broadcast 的耗时
+    with child_span(
+        "centrifugo broadcast_users",
+        lambda: {"centrifugo.channel_count": len(channels)},
+    ):
+        return broadcast(
+            centrifugo.get_client(),
+            channels,
+            data,
+            chunk_size=config.CENTRIFUGO_BROADCAST_CHUNK_SIZE,
+            max_workers=config.CENTRIFUGO_FANOUT_WORKERS,
+        )
+
+
+def close_centrifugo(timeout):
+    """worker 退出时关闭 http 连接"""
+    if centrifugo.is_initialized:
+        centrifugo.session.close()
+
+
+def drain_publisher(timeout):
+    """worker 退出时发送队列中的消息"""
+    if not centrifugo_publisher.is_initialized:
+        return
+
+    centrifugo_publisher.flush(timeout)
+    centrifugo_publisher.close()
+    centrifugo_publisher.client.session.close()
+
+
+client_registry.register_shutdown_handler("centrifugo", close_centrifugo)
+client_registry.register_shutdown_handler(
+    "centrifugo_publisher", drain_publisher, order=SHUTDOWN_ORDER_FLUSH
+)
@@ -0,0 +1,69 @@
+"""
+给大量 channel 发送同一条消息
+
+channel 按 chunk_size 分组, 每组使用一个 broadcast command,
+多个分组在线程池中并发发送, 共用 client 的 http 连接池
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def chunked(items, size):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def send_broadcast(client, channels, data):
+    """发送一个 broadcast command, 不使用 client 的消息缓存, 可以在多个线程中调用
+    返回: 这一组的发送结果
+    """
+    command = {
+        "method": "broadcast",
+        "params": client.get_broadcast_params(channels, data),
+    }
+    started_at = time.monotonic()
+    error = None
+    try:
+        response = client._send(
+            client.prepare_url(),
+            json.dumps(command, cls=client.json_encoder).encode(),
+        )
+        reply = json.loads(response.split("\n")[0])
+        if reply.get("error"):
+            error = str(reply["error"])
+    except Exception as exception:
+        error = str(exception)
+
+    return {
+        "channels": len(channels),
+        "latency_ms": (time.monotonic() - started_at) * 1000,
+        "error": error,
+    }
+
+
+def broadcast(client, channels, data, chunk_size=1000, max_workers=8):
+    """并发地给所有 channel 发送消息
+    返回: {"sent": 成功的 channel 数量, "failed": 失败的 channel 数量,
+           "chunks": 每组的发送结果}
+    """
+    channels = list(channels)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunks = list(
+            executor.map(
+                lambda chunk: send_broadcast(client, chunk, data),
+                chunked(channels, chunk_size),
+            )
+        )
+
+    failed = sum(chunk["channels"] for chunk in chunks if chunk["error"])
+    if failed:
+        logger.warning(f"Failed to broadcast to {failed} channels")
+    return {
+        "sent": len(channels) - failed,
+        "failed": failed,
+        "chunks": chunks,
+    }
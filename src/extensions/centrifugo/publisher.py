@@ -0,0 +1,132 @@
+"""
+后台发送 Centrifugo 消息
+
+请求中只把消息放入队列, 后台线程把队列中的消息合并成一次 http 请求
+(Centrifugo 的 batch api: 一行一个 command) 发送出去, 请求不再等待 Centrifugo
+
+队列满时丢弃新的消息, 通过 metrics() 查看丢弃的数量
+消息在放入队列时序列化, 不能序列化的消息直接抛出异常, 不会进入队列
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPublisher:
+
+    def __init__(self, client, max_queue_size=10000, batch_size=100):
+        """
+        client: cent.Client, 只在后台线程中使用
+        max_queue_size: 队列中最多缓存的消息数量
+        batch_size: 一次 http 请求最多发送的消息数量
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+        self.counters = {
+            "published": 0,
+            "failed": 0,
+            "dropped": 0,
+            "batches": 0,
+        }
+
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(
+            target=self._run, name="centrifugo-publisher", daemon=True
+        )
+        self._worker.start()
+
+    def publish(self, channel, data, uid=None):
+        """消息放入队列, 队列已满时丢弃消息并返回 False
+        data 不能序列化为 json 时抛出 TypeError / ValueError
+        """
+        return self.add(
+            "publish", self.client.get_publish_params(channel, data, uid=uid)
+        )
+
+    def broadcast(self, channels, data, uid=None):
+        return self.add(
+            "broadcast",
+            self.client.get_broadcast_params(channels, data, uid=uid)
+        )
+
+    def add(self, method, params):
+        command = {"method": method, "params": params}
+        line = json.dumps(command, cls=self.client.json_encoder)
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.counters["dropped"] += 1
+            return False
+        return True
+
+    def _next_batch(self):
+        """等待第一条消息, 再取出队列中已有的消息, 最多 batch_size 条"""
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.send_batch(batch)
+            except Exception:
+                # 后台线程不能退出, 否则之后的消息都不会被发送
+                self.counters["failed"] += len(batch)
+                logger.exception(f"Failed to publish {len(batch)} messages")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def send_batch(self, commands):
+        """一次 http 请求发送多个序列化后的 command"""
+        data = "\n".join(commands).encode()
+        self.counters["batches"] += 1
+        try:
+            response = self.client._send(self.client.prepare_url(), data)
+        except Exception as error:
+            self.counters["failed"] += len(commands)
+            logger.warning(
+                f"Failed to publish {len(commands)} messages: {error}"
+            )
+            return
+
+        # 每个 command 对应一行结果
+        replies = [json.loads(line) for line in response.split("\n") if line]
+        failed = sum(1 for reply in replies if reply.get("error"))
+        self.counters["failed"] += failed
+        self.counters["published"] += len(commands) - failed
+
+    def flush(self, timeout=None):
+        """等待队列中的消息发送完成, 返回还没有发送的消息数量"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+        return self.queue.unfinished_tasks
+
+    def close(self):
+        self._stopped.set()
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def metrics(self):
+        return dict(self.counters, queue_depth=len(self))
@@ -0,0 +1,133 @@
+"""
+延迟初始化的客户端
+
+Redis / Kafka / Centrifugo 等客户端在第一次使用时才创建, 每个进程单独创建一次
+gunicorn 开启 preload_app 时, master 进程中导入的代码可以被 worker 共享,
+而连接和后台线程不能跨进程共享, 所以 fork 之后需要在 worker 中重新创建
+
+eg:
+    redis_client = LazyClient("redis", initialize_redis_client)
+    redis_client.get("key")  # 第一次调用时创建 RedisCluster
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHUTDOWN_TIMEOUT = 10
+# 退出时的清理顺序: 发送缓冲的消息 -> 发送 tracing 数据 -> 关闭连接
+SHUTDOWN_ORDER_FLUSH = 0
+SHUTDOWN_ORDER_TRACING = 10
+SHUTDOWN_ORDER_CLOSE = 20
+
+
+class LazyClient:
+    """客户端代理, 属性访问会转发给真正的客户端"""
+
+    def __init__(self, name, factory, registry=None):
+        self.name = name
+        self.factory = factory
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        (registry or client_registry).register(self)
+
+    @property
+    def is_initialized(self):
+        return self._client is not None and self._pid == os.getpid()
+
+    def get_client(self):
+        """获取当前进程的客户端, 没有时创建"""
+        if self.is_initialized:
+            return self._client
+
+        with self._lock:
+            if not self.is_initialized:
+                self._client = self.factory()
+                self._pid = os.getpid()
+                logger.info(f"Client initialized: {self.name}")
+        return self._client
+
+    def reset(self):
+        """fork 之后丢弃父进程的客户端, 下次使用时重新创建"""
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.get_client(), name)
+
+    def __repr__(self):
+        return f"<LazyClient {self.name}>"
+
+
+class ClientRegistry:
+    """管理进程中所有的客户端, 处理 fork 前后的连接"""
+
+    def __init__(self):
+        self.clients = {}
+        self.before_fork_handlers = []
+        self.after_fork_handlers = []
+        self.shutdown_handlers = []
+
+    def register(self, client: LazyClient):
+        self.clients[client.name] = client
+
+    def register_fork_handler(self, before=None, after=None):
+        """注册不是 LazyClient 的连接 (例如 Cassandra) 在 fork 前后的处理函数"""
+        if before is not None:
+            self.before_fork_handlers.append(before)
+        if after is not None:
+            self.after_fork_handlers.append(after)
+
+    def register_shutdown_handler(
+        self, name, handler, order=SHUTDOWN_ORDER_CLOSE
+    ):
+        """注册进程退出时的清理函数
+        handler(timeout): timeout 为剩余的时间, 单位: 秒
+        order: 越小越先执行, 先把数据发送出去, 再关闭连接
+        """
+        self.shutdown_handlers.append((order, name, handler))
+        self.shutdown_handlers.sort(key=lambda item: item[0])
+
+    def before_fork(self):
+        """在 master 进程 fork worker 之前释放连接"""
+        for handler in self.before_fork_handlers:
+            handler()
+
+    def after_fork(self):
+        """在 worker 进程中重新初始化"""
+        for client in self.clients.values():
+            client.reset()
+        for handler in self.after_fork_handlers:
+            handler()
+
+    def shutdown(self, timeout=DEFAULT_SHUTDOWN_TIMEOUT):
+        """worker 退出时依次执行清理函数, 所有清理函数共用 timeout 秒
+        返回: 每个清理函数的耗时
+        """
+        deadline = time.monotonic() + timeout
+        durations = {}
+        for _, name, handler in self.shutdown_handlers:
+            started_at = time.monotonic()
+            try:
+                handler(max(deadline - started_at, 0))
+            except Exception:
+                # 一个客户端清理失败不影响其他客户端
+                logger.exception(f"Shutdown handler failed: {name}")
+            durations[name] = time.monotonic() - started_at
+        return durations
+
+
+client_registry = ClientRegistry()
+
+
+def _reset_clients_after_fork():
+    for client in client_registry.clients.values():
+        client.reset()
+
+
+# 任何方式的 fork 之后都不能继续使用父进程的客户端
+os.register_at_fork(after_in_child=_reset_clients_after_fork)
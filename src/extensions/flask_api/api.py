@@ -1,36 +1,75 @@
+import hashlib
 import uuid
 from functools import wraps
 
 from flask import Blueprint, Response
 from flask import current_app as app
-from flask import g, jsonify, request
+from flask import g, request
 from flask.views import MethodView, MethodViewType
 from marshmallow import ValidationError
 
+from extensions.flask_api.encoder import encode_failed, encode_ok, get_encoder
 from extensions.flask_api.exceptions import APIException, PermissionDenied
+from extensions.metrics import phase, record_error, request_metrics, timed
+from extensions.opentelemetry.spans import mark_failed
 from extensions.sentry import sentry
 
 
+class TimedEncoder:
+    """编码的耗时记录为 encoding 阶段"""
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.name = encoder.name
+
+    def dumps(self, obj) -> bytes:
+        with phase("encoding"):
+            return self.encoder.dumps(obj)
+
+
+def response_encoder():
+    """当前 app 配置的 json 编码后端"""
+    return TimedEncoder(get_encoder(app.config.get("JSON_ENCODER")))
+
+
+def json_response(body: bytes, status=None):
+    """用已经编码好的 json bytes 创建 response"""
+    return app.response_class(
+        body, status=status, mimetype=app.config["JSONIFY_MIMETYPE"]
+    )
+
+
+def make_etag(data: bytes) -> str:
+    """根据响应内容或数据版本计算 ETag"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def not_modified_response(etag):
+    """304 response, 不包含 body"""
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+
 def ok_response(result):
     """成功的 response"""
-    new_body = {"ok": True, "result": result}
-    return jsonify(new_body)
+    return json_response(encode_ok(result, encoder=response_encoder()))
 
 
 def failed_response(error_type, error_message, error_data=None):
     """失败的 response"""
-    body = {
-        "ok": False,
-        "error_type": error_type,
-        "error_message": error_message
-    }
-    if error_data is not None:
-        body["error_data"] = error_data
-    return jsonify(body)
+    return json_response(
+        encode_failed(
+            error_type,
+            error_message,
+            error_data=error_data,
+            encoder=response_encoder(),
+        )
+    )
 
 
-def validation_error_response(validation_error):
-    """字段验证失败的 response
+def validation_error_body(validation_error):
+    """字段验证失败的 response body
     validation_error: ValidationError
     """
     errors = list()
@@ -55,13 +94,20 @@ def validation_error_response(validation_error):
         }
         errors.append(field_error)
 
-    new_body = {
+    return {
         "ok": False,
         "error_type": "data_validation_errors",
         "error_message": "Data has validation errors",
         "errors": errors,
     }
-    return jsonify(new_body)
+
+
+def validation_error_response(validation_error):
+    """字段验证失败的 response
+    validation_error: ValidationError
+    """
+    body = validation_error_body(validation_error)
+    return json_response(response_encoder().dumps(body))
 
 
 def route(blueprint: Blueprint, rule, **options):
@@ -72,15 +118,16 @@ def route(blueprint: Blueprint, rule, **options):
         @wraps(view)
         def decorator(*args, **kwargs):
             """处理错误响应"""
-            try:
-                result = view(*args, **kwargs)
-            except Exception as exception:
-                return handle_exception(view.__name__, exception, **kwargs)
-            else:
-                if isinstance(result, Response):
-                    return result
+            with request_metrics():
+                try:
+                    result = view(*args, **kwargs)
+                except Exception as exception:
+                    return handle_exception(view.__name__, exception, **kwargs)
+                else:
+                    if isinstance(result, Response):
+                        return result
 
-                return ok_response(result)
+                    return ok_response(result)
 
         # Flask 的 endpoint, 用于 url_for(endpoint) 获取 endpoint 对应的 url rule
         endpoint = options.pop("endpoint", decorator.__name__)
@@ -99,6 +146,10 @@ def class_route(blueprint: Blueprint, rule, **options):
         else:
             view_func = view
 
+        if not (isinstance(view, type) and issubclass(view, APIBaseView)):
+            # APIBaseView 在 dispatch_request 中记录 metrics
+            view_func = metered(view_func)
+
         blueprint.add_url_rule(
             rule, view.__name__, view_func=view_func, **options
         )
@@ -107,15 +158,30 @@ def class_route(blueprint: Blueprint, rule, **options):
     return decorator
 
 
+def metered(view_func):
+    """记录 view 的耗时"""
+
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        with request_metrics():
+            return view_func(*args, **kwargs)
+
+    return wrapper
+
+
 def handle_exception(view_name, exception, **kwargs):
     """处理异常
     APIException: 返回适当的错误信息
     else: 重新抛出异常
     """
     if isinstance(exception, ValidationError):
+        record_error("data_validation_errors")
+        mark_failed("data_validation_errors")
         return validation_error_response(exception)
     elif hasattr(exception,
                  "error_type") and hasattr(exception, "error_message"):
+        record_error(exception.error_type)
+        mark_failed(exception.error_type)
         error_data = getattr(exception, "error_data", None)
         return failed_response(
             error_type=exception.error_type,
@@ -123,6 +189,7 @@ def handle_exception(view_name, exception, **kwargs):
             error_data=error_data,
         )
     else:
+        record_error("server_error")
         # 非 debug 模式下, 发送错误消息到 sentry
         if not app.config["DEBUG"]:
             with sentry.context:
@@ -147,7 +214,24 @@ def login_required(view):
 
 
 class APIBaseView(MethodView):
-    """扩展 class based view, 增加异常处理"""
+    """扩展 class based view, 增加异常处理
+
+    etag_enabled 为 True 时, 响应会带上 ETag, 请求的 If-None-Match 和 ETag 一致时返回 304
+    实现了 get_etag_version 的 view 可以不读取数据就判断是否返回 304
+    """
+
+    etag_enabled = False
+    # 需要记录耗时的方法和对应的阶段, 见 extensions.metrics
+    metric_phases = {
+        "get_validated_data": "validation",
+        "get_object": "query",
+        "filter_objects": "query",
+        "paging_objects": "query",
+        "mget": "query",
+        "save": "save",
+        "save_items": "save",
+        "response": "serialization",
+    }
 
     @property
     def kong_user_id(self):
@@ -175,10 +259,56 @@ class APIBaseView(MethodView):
         """解析 request body 为 json"""
         return request.json or {}
 
+    def get_etag_version(self):
+        """不读取完整数据就能得到的数据版本, 例如 updated_at 字段
+        返回 None 时根据响应内容计算 ETag
+
+        注意: 版本 ETag 只由 url 和版本组成, 不包含用户和语言,
+        响应内容随用户 (x-authenticated-userid) 或 Accept-Language 变化的 view
+        不能实现这个方法, 否则会把其他用户的 304 当成自己的缓存
+        """
+        return None
+
+    def get_version_etag(self):
+        """根据数据版本计算的 ETag"""
+        if not self.etag_enabled:
+            return None
+
+        version = self.get_etag_version()
+        if version is None:
+            return None
+        return make_etag(f"{request.full_path}:{version}".encode())
+
+    def is_not_modified(self, etag):
+        return etag is not None and request.if_none_match.contains_weak(etag)
+
+    def conditional_response(self, body: bytes, etag=None):
+        """返回编码好的 json, 开启了 ETag 时处理 If-None-Match"""
+        if not self.etag_enabled:
+            return json_response(body)
+
+        if etag is None:
+            etag = make_etag(body)
+        if self.is_not_modified(etag):
+            return not_modified_response(etag)
+
+        response = json_response(body)
+        response.set_etag(etag)
+        return response
+
+    def time_phases(self):
+        """子类会覆盖 get_object / save 等方法, 所以在请求开始时包装实例的方法"""
+        for name, phase_name in self.metric_phases.items():
+            method = getattr(self, name, None)
+            if method is not None:
+                setattr(self, name, timed(phase_name, method))
+
     def dispatch_request(self, *args, **kwargs):
-        try:
-            return super().dispatch_request(*args, **kwargs)
-        except Exception as exception:
-            return handle_exception(
-                self.__class__.__name__, exception, **kwargs
-            )
+        with request_metrics():
+            self.time_phases()
+            try:
+                return super().dispatch_request(*args, **kwargs)
+            except Exception as exception:
+                return handle_exception(
+                    self.__class__.__name__, exception, **kwargs
+                )
@@ -0,0 +1,149 @@
+"""
+GetView 的响应缓存
+
+两级缓存:
+    L1: 进程内的 LRU 缓存, 有数量上限和过期时间
+    L2: Redis Cluster
+
+缓存的内容是编码后的 result bytes, 命中时不需要查询数据库, 也不需要序列化
+数据修改后需要调用 invalidate 清除缓存, 只能清除当前进程的 L1 缓存,
+其他进程的 L1 缓存在 local_ttl 过期前仍可能返回旧数据, 所以 local_ttl 需要设置得比较短
+Redis 出错时由调用方跳过缓存, 命中和出错的次数由 /metrics 输出
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from redis.exceptions import RedisError
+from rediscluster.exceptions import RedisClusterException
+
+from extensions.metrics import register_collector
+from extensions.redis_cluster import redis_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_MAX_SIZE = 1024
+CACHE_KEY_PREFIX = "response_cache"
+# 访问 Redis 时可能出现的错误, 例如连接失败和 cluster 不可用
+REDIS_ERRORS = (RedisError, RedisClusterException)
+
+
+class LocalTTLCache:
+    """线程安全的 LRU 缓存, 每个 key 有独立的过期时间"""
+
+    def __init__(self, max_size=DEFAULT_LOCAL_MAX_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            value, expire_at = item
+            if expire_at <= time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+
+    def __init__(self, local_max_size=DEFAULT_LOCAL_MAX_SIZE):
+        self.local_cache = LocalTTLCache(max_size=local_max_size)
+        self.counters = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "errors": 0,
+        }
+
+    def get(self, key, local_ttl):
+        value = self.local_cache.get(key)
+        if value is not None:
+            self.counters["local_hits"] += 1
+            return value
+
+        value = redis_client.get(key)
+        if value is None:
+            self.counters["misses"] += 1
+            return None
+
+        self.counters["redis_hits"] += 1
+        self.local_cache.set(key, value, local_ttl)
+        return value
+
+    def set(self, key, value: bytes, ttl, local_ttl):
+        redis_client.set(key, value, ex=ttl)
+        self.local_cache.set(key, value, min(ttl, local_ttl))
+
+    def invalidate(self, key):
+        self.counters["invalidations"] += 1
+        self.local_cache.delete(key)
+        redis_client.delete(key)
+
+    def record_error(self, operation, key, error):
+        """记录 Redis 错误, 调用方继续执行, 不使用缓存"""
+        self.counters["errors"] += 1
+        logger.warning(f"Response cache {operation} failed: {key}: {error!r}")
+
+    def stats(self):
+        """命中统计, 用于调整缓存大小和过期时间"""
+        return dict(self.counters, local_size=len(self.local_cache))
+
+
+response_cache = ResponseCache()
+
+register_collector(
+    "response_cache_events_total",
+    "event",
+    lambda: dict(response_cache.counters),
+    help_text="GetView response cache hits, misses, invalidations and errors",
+)
+
+
+def make_cache_key(namespace, values):
+    return ":".join([CACHE_KEY_PREFIX, namespace, *map(str, values)])
+
+
+def invalidate_view_caches(views, data):
+    """清除 views 的缓存, 缓存 key 的字段从 data 中获取
+    在保存数据之后调用, 无法清除时只记录日志, 缓存在过期后更新
+    """
+    for view in views:
+        missing = [
+            field for field in view.cache_key_fields if field not in data
+        ]
+        if missing:
+            logger.warning(
+                f"Skip invalidating {view.__name__}: missing fields {missing}"
+            )
+            continue
+        try:
+            view.invalidate_cache(**data)
+        except REDIS_ERRORS as error:
+            response_cache.record_error("invalidate", view.__name__, error)
@@ -0,0 +1,39 @@
+"""
+ListView 分页使用的 cursor
+
+cursor 中包含驱动的 paging_state 和生成它的 view, 使用 SECRET_KEY 签名,
+客户端只能原样传回, 不能修改或者用在其他 view 上
+"""
+from flask import current_app as app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from extensions.cassandra_orm.paging import (
+    decode_paging_state,
+    encode_paging_state,
+)
+
+CURSOR_SALT = "list_view_cursor"
+
+
+def cursor_serializer():
+    return URLSafeSerializer(app.config["SECRET_KEY"], salt=CURSOR_SALT)
+
+
+def encode_cursor(paging_state: bytes, scope: str):
+    """paging_state 编码为 cursor, 没有下一页时返回 None"""
+    if paging_state is None:
+        return None
+    return cursor_serializer().dumps([scope, encode_paging_state(paging_state)])
+
+
+def decode_cursor(cursor: str, scope: str):
+    """解码 cursor, 签名错误或者不属于 scope 时抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        cursor_scope, paging_state = cursor_serializer().loads(cursor)
+    except (BadSignature, TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if cursor_scope != scope:
+        raise ValueError("Invalid cursor")
+    return decode_paging_state(paging_state)
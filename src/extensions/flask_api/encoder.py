@@ -0,0 +1,183 @@
+"""
+API 响应的 JSON 编码器
+
+通过 BaseConfig.JSON_ENCODER 选择编码后端:
+    stdlib: 标准库 json
+    ujson: ujson (需要支持 default 参数的版本)
+    orjson: orjson, 直接输出 bytes (可选依赖, 未安装时退回 stdlib)
+
+所有后端都输出紧凑的 utf-8 bytes, 并按照 Flask JSONEncoder 的规则
+处理 marshmallow dump 出来的 UUID / datetime 等类型
+"""
+import dataclasses
+import decimal
+import json
+import logging
+import uuid
+from datetime import date
+
+import ujson
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODER = "stdlib"
+
+OK_PREFIX = b'{"ok":true,"result":'
+FAILED_PREFIX = b'{"ok":false,"error_type":'
+ENVELOPE_SUFFIX = b"}"
+
+
+def json_default(o):
+    """序列化 json 原生不支持的类型, 和 flask.json.JSONEncoder 保持一致"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        # flask_babel 的 LazyString
+        return str(o.__html__())
+    raise TypeError(
+        f"Object of type {type(o).__name__} is not JSON serializable"
+    )
+
+
+class StdlibEncoder:
+    name = "stdlib"
+
+    @staticmethod
+    def is_available():
+        return True
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return json.dumps(
+            obj,
+            default=json_default,
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode()
+
+
+class UJSONEncoder:
+    name = "ujson"
+
+    @staticmethod
+    def is_available():
+        # ujson 2.0 之前的版本不支持 default 参数, 无法处理 UUID / datetime
+        try:
+            ujson.dumps(None, default=str)
+        except TypeError:
+            return False
+        return True
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return ujson.dumps(
+            obj,
+            default=json_default,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+        ).encode()
+
+
+class ORJSONEncoder:
+    name = "orjson"
+
+    @staticmethod
+    def is_available():
+        return orjson is not None
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        # orjson 默认把 datetime 序列化为 isoformat, 交给 default 处理以保持一致
+        # orjson 默认只支持 str 类型的 key, 和其他后端一样支持 int 等类型的 key
+        return orjson.dumps(
+            obj,
+            default=json_default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+
+ENCODER_BACKENDS = {
+    StdlibEncoder.name: StdlibEncoder,
+    UJSONEncoder.name: UJSONEncoder,
+    ORJSONEncoder.name: ORJSONEncoder,
+}
+
+_encoders = {}
+
+
+def get_encoder(name: str = None):
+    """获取编码后端, 后端不可用时退回标准库"""
+    name = name or DEFAULT_ENCODER
+    encoder = _encoders.get(name)
+    if encoder is not None:
+        return encoder
+
+    encoder = ENCODER_BACKENDS.get(name)
+    if encoder is None:
+        raise ValueError(f"Unknown json encoder: {name}")
+    if not encoder.is_available():
+        logger.warning(
+            f"JSON encoder {name} is not available, fallback to stdlib"
+        )
+        encoder = StdlibEncoder
+
+    _encoders[name] = encoder
+    return encoder
+
+
+def encode_ok(result, encoder=None) -> bytes:
+    """直接把 {"ok": true, "result": ...} 写成 bytes, 不创建中间 dict"""
+    encoder = encoder or get_encoder()
+    return encode_ok_raw(encoder.dumps(result))
+
+
+def encode_ok_raw(encoded_result: bytes) -> bytes:
+    """用已经编码好的 result 生成成功的 response body"""
+    return b"".join((OK_PREFIX, encoded_result, ENVELOPE_SUFFIX))
+
+
+def encode_failed(
+    error_type, error_message, error_data=None, encoder=None
+) -> bytes:
+    """失败 response 的 bytes"""
+    encoder = encoder or get_encoder()
+    parts = [
+        FAILED_PREFIX,
+        encoder.dumps(error_type),
+        b',"error_message":',
+        encoder.dumps(error_message),
+    ]
+    if error_data is not None:
+        parts.append(b',"error_data":')
+        parts.append(encoder.dumps(error_data))
+    parts.append(ENVELOPE_SUFFIX)
+    return b"".join(parts)
+
+
+def iter_encode_ok_items(items_name, batches, encoder=None):
+    """流式编码 {"ok": true, "result": {items_name: [...]}}
+    batches: 依次返回已序列化数据列表的迭代器
+    输出的 bytes 拼接后和 encode_ok({items_name: items}) 一致
+    """
+    encoder = encoder or get_encoder()
+    yield b"".join((OK_PREFIX, b"{", encoder.dumps(items_name), b":["))
+
+    separator = b""
+    for batch in batches:
+        if not batch:
+            continue
+        # 去掉列表两端的 [ ]
+        yield separator + encoder.dumps(batch)[1:-1]
+        separator = b","
+
+    yield b"]}" + ENVELOPE_SUFFIX
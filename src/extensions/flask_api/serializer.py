@@ -1,7 +1,63 @@
+import threading
+from collections import defaultdict
 from functools import wraps
 
 from flask import g, request
 
+from extensions.metrics import phase
+
+
+class SchemaRegistry:
+    """进程内的 marshmallow Schema 实例缓存
+
+    每个 Schema 类 (以及 many=True 的版本) 只创建一次, 之后的请求复用同一个实例
+    marshmallow 3 的 load / dump 不会修改 Schema 实例的状态, 可以在多个线程中共用,
+    所以 Schema 中不要在 self 上保存请求相关的数据 (包括 self.context)
+    """
+
+    def __init__(self):
+        self._schemas = {}
+        self._lock = threading.Lock()
+        # 命中次数, 不加锁统计, 是近似值
+        self._hits = defaultdict(int)
+
+    def get(self, schema_class, many=False):
+        key = (schema_class, many)
+        schema = self._schemas.get(key)
+        if schema is not None:
+            self._hits[key] += 1
+            return schema
+
+        with self._lock:
+            schema = self._schemas.get(key)
+            if schema is None:
+                schema = schema_class(many=many)
+                self._schemas[key] = schema
+        return schema
+
+    def stats(self):
+        """每个 Schema 的命中次数"""
+        results = {}
+        for schema_class, many in list(self._schemas):
+            name = f"{schema_class.__module__}.{schema_class.__qualname__}"
+            if many:
+                name += "(many=True)"
+            results[name] = self._hits[(schema_class, many)]
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._schemas = {}
+            self._hits = defaultdict(int)
+
+
+schema_registry = SchemaRegistry()
+
+
+def get_schema(schema_class, many=False):
+    """获取缓存的 Schema 实例"""
+    return schema_registry.get(schema_class, many=many)
+
 
 def serialize(serializer, many=False):
     """使用指定 serializer 来序列化数据, 并返回为 json 格式"""
@@ -11,7 +67,8 @@ def serialize(serializer, many=False):
         @wraps(view)
         def decorator(*args, **kwargs):
             response_object = view(*args, **kwargs)
-            return serializer(many=many).dump(response_object)
+            with phase("serialization"):
+                return get_schema(serializer, many=many).dump(response_object)
 
         return decorator
 
@@ -36,7 +93,8 @@ def validate(validator):
                     request_data[key] = value
 
             request_data.update(kwargs)
-            g.validated_data = validator().load(request_data)
+            with phase("validation"):
+                g.validated_data = get_schema(validator).load(request_data)
             return view()
 
         return decorator
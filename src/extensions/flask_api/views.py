@@ -1,28 +1,129 @@
+import heapq
 from functools import wraps
+from itertools import islice
 
+from cassandra.cqlengine.query import AbstractQuerySet
+from flask import Response
 from flask import current_app as app
-from flask import request
+from flask import request, stream_with_context
 from flask.views import MethodViewType
-
-from extensions.flask_api.api import APIBaseView, failed_response, ok_response
+from marshmallow import ValidationError
+
+from extensions.cassandra_orm.management import DatabaseManagement
+from extensions.cassandra_orm.paging import (
+    decode_paging_state,
+    encode_paging_state,
+    fetch_page,
+    fetch_queryset_page,
+    iter_queryset,
+)
+from extensions.cassandra_orm.queries import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CONCURRENCY,
+    bulk_insert,
+    missing_primary_keys,
+    multi_get,
+)
+from extensions.flask_api.api import (
+    APIBaseView,
+    failed_response,
+    not_modified_response,
+    ok_response,
+    response_encoder,
+    validation_error_body,
+)
+from extensions.flask_api.cache import (
+    REDIS_ERRORS,
+    invalidate_view_caches,
+    make_cache_key,
+    response_cache,
+)
+from extensions.flask_api.cursor import decode_cursor, encode_cursor
+from extensions.flask_api.encoder import (
+    encode_ok,
+    encode_ok_raw,
+    iter_encode_ok_items,
+)
 from extensions.flask_api.exceptions import APIException
+from extensions.flask_api.serializer import get_schema
+from extensions.kafka import kafka_producer
+from extensions.metrics import phase, stream_metrics, timed, timed_iter
 
 
 class GetView(APIBaseView):
     """GET api view
     1. 获取数据对象
     2. 序列化数据
+
+    设置 cache_ttl 后, 序列化的结果会缓存在进程内和 Redis 中,
+    缓存 key 由 cache_key_fields 对应的 validated_data 组成
+    修改数据的 view 可以通过 invalidate_views 清除缓存
     """
 
     args_deserializer_class = None
     get_serializer_class = None
 
+    # 缓存时间, 单位: 秒, None 表示不缓存
+    cache_ttl = None
+    cache_key_fields = ()
+    # 进程内缓存的时间, 单位: 秒
+    cache_local_ttl = 5
+
     def get(self, *args, **kwargs):
         """处理 GET 请求"""
         self.validated_data = self.get_validated_data(kwargs)
+
+        # 数据版本没有变化时, 不需要读取数据
+        version_etag = self.get_version_etag()
+        if self.is_not_modified(version_etag):
+            return not_modified_response(version_etag)
+
+        if self.cache_ttl:
+            body = encode_ok_raw(self.get_cached_result())
+        else:
+            target_object = self.get_object()
+            serialized_data = self.serialize(target_object)
+            body = encode_ok(serialized_data, encoder=response_encoder())
+        return self.conditional_response(body, version_etag)
+
+    @classmethod
+    def get_cache_key(cls, data):
+        namespace = f"{cls.__module__}.{cls.__name__}"
+        return make_cache_key(
+            namespace, [data[field] for field in cls.cache_key_fields]
+        )
+
+    @classmethod
+    def invalidate_cache(cls, **data):
+        """清除缓存, data 需要包含 cache_key_fields 中的字段"""
+        response_cache.invalidate(cls.get_cache_key(data))
+
+    def get_cached_result(self):
+        """获取编码后的 result, 没有缓存时查询并缓存
+        Redis 出错时直接查询, 不使用缓存
+        """
+        cache_key = self.get_cache_key(self.validated_data)
+        try:
+            result = response_cache.get(cache_key, self.cache_local_ttl)
+        except REDIS_ERRORS as error:
+            response_cache.record_error("get", cache_key, error)
+            return self.encode_result()
+        if result is not None:
+            return result
+
+        result = self.encode_result()
+        try:
+            response_cache.set(
+                cache_key, result, self.cache_ttl, self.cache_local_ttl
+            )
+        except REDIS_ERRORS as error:
+            response_cache.record_error("set", cache_key, error)
+        return result
+
+    def encode_result(self):
+        """查询并编码 result"""
         target_object = self.get_object()
-        serialized_data = self.serialize(target_object)
-        return ok_response(serialized_data)
+        return response_encoder().dumps(self.serialize(target_object))
 
     @classmethod
     def parse_json(cls):
@@ -44,7 +145,7 @@ class GetView(APIBaseView):
             else:
                 request_data[key] = value
         request_data.update(kwargs)
-        deserializer = self.args_deserializer_class()
+        deserializer = get_schema(self.args_deserializer_class)
         validated_data = deserializer.load(request_data)
         return validated_data
 
@@ -52,7 +153,7 @@ class GetView(APIBaseView):
         """序列化目标对象"""
         if not self.get_serializer_class:
             return {}
-        data = self.get_serializer_class().dump(target_object)
+        data = get_schema(self.get_serializer_class).dump(target_object)
         return data
 
     def get_object(self):
@@ -69,6 +170,8 @@ class PutView(APIBaseView):
 
     args_deserializer_class = None
     put_serializer_class = None
+    # 保存数据后需要清除缓存的 GetView
+    invalidate_views = ()
 
     def put(self, *args, **kwargs):
         self.request_data = kwargs
@@ -76,6 +179,7 @@ class PutView(APIBaseView):
 
         # 保存数据
         patched_object = self.save()
+        invalidate_view_caches(self.invalidate_views, self.validated_data)
         return self.response(patched_object)
 
     def get_validated_data(self, kwargs):
@@ -85,7 +189,7 @@ class PutView(APIBaseView):
 
         request_data = self.parse_json()
         request_data.update(kwargs)
-        deserializer = self.args_deserializer_class()
+        deserializer = get_schema(self.args_deserializer_class)
         validated_data = deserializer.load(request_data)
         return validated_data
 
@@ -98,7 +202,7 @@ class PutView(APIBaseView):
         默认返回空 json 对象, 需要修改则在子类中覆盖这个方法
         """
         if self.put_serializer_class:
-            data = self.put_serializer_class().dump(saved_object)
+            data = get_schema(self.put_serializer_class).dump(saved_object)
             return ok_response(data)
         else:
             return ok_response({})
@@ -113,12 +217,15 @@ class PatchView(APIBaseView):
 
     args_deserializer_class = None
     patch_serializer_class = None
+    # 保存数据后需要清除缓存的 GetView
+    invalidate_views = ()
 
     def patch(self, *args, **kwargs):
         self.validated_data = self.get_validated_data(kwargs)
 
         # 保存数据
         patched_object = self.save()
+        invalidate_view_caches(self.invalidate_views, self.validated_data)
         return self.response(patched_object)
 
     def get_validated_data(self, kwargs):
@@ -128,7 +235,7 @@ class PatchView(APIBaseView):
 
         request_data = self.parse_json()
         request_data.update(kwargs)
-        deserializer = self.args_deserializer_class()
+        deserializer = get_schema(self.args_deserializer_class)
         validated_data = deserializer.load(request_data)
         return validated_data
 
@@ -141,7 +248,7 @@ class PatchView(APIBaseView):
         默认返回空 json 对象, 需要修改则在子类中覆盖这个方法
         """
         if self.patch_serializer_class:
-            data = self.patch_serializer_class().dump(saved_object)
+            data = get_schema(self.patch_serializer_class).dump(saved_object)
             return ok_response(data)
         else:
             return ok_response({})
@@ -152,12 +259,18 @@ class PostView(APIBaseView):
 
     args_deserializer_class = None
     post_serializer_class = None
+    # 保存数据后需要清除缓存的 GetView
+    invalidate_views = ()
 
     def post(self, *args, **kwargs):
         self.validated_data = self.get_validated_data(kwargs)
 
         # 保存数据
         saved_object = self.save()
+        invalidate_view_caches(self.invalidate_views, self.validated_data)
+        if isinstance(saved_object, Response):
+            # 使用了 idempotent 装饰器的 save 直接返回 response
+            return saved_object
         return self.response(saved_object)
 
     def get_validated_data(self, kwargs):
@@ -167,7 +280,7 @@ class PostView(APIBaseView):
 
         request_data = self.parse_json()
         request_data.update(kwargs)
-        deserializer = self.args_deserializer_class()
+        deserializer = get_schema(self.args_deserializer_class)
         validated_data = deserializer.load(request_data)
         return validated_data
 
@@ -180,12 +293,149 @@ class PostView(APIBaseView):
         默认返回空 json 对象, 需要修改则在子类中覆盖这个方法
         """
         if self.post_serializer_class:
-            data = self.post_serializer_class().dump(saved_object)
+            data = get_schema(self.post_serializer_class).dump(saved_object)
             return ok_response(data)
         else:
             return ok_response({})
 
 
+class BulkPostView(APIBaseView):
+    """批量创建数据的 view
+    请求: {"items": [...]}
+    1. 使用 item_deserializer_class 一次验证所有的 item
+    2. 验证通过的 item 写入 bulk_model: 同一个 partition 的数据使用 unlogged batch,
+       不同 partition 的数据并发写入
+    3. 写入成功的 item 发送到 kafka_topic, 所有消息发送后只 poll 一次
+    返回: {"items": [...]}, 和请求的 items 顺序一致, 每个 item 的格式和单个请求的
+         response 一致, 失败的 item 都有 error_type 和 error_message:
+         验证失败: data_validation_errors, errors 为每个字段的错误
+         保存失败: save_failed
+    注意: 值为 None 的字段不会写入 (UNSET), 不会像 Model.create 一样写入 null,
+         数据已经存在时这些字段保持原来的值, 也不会产生 tombstone
+    """
+
+    item_deserializer_class = None
+    bulk_serializer_class = None
+    # cqlengine model
+    bulk_model = None
+    bulk_batch_size = DEFAULT_BATCH_SIZE
+    bulk_concurrency = DEFAULT_CONCURRENCY
+    max_items = 1000
+    # 写入成功后发送消息的 topic
+    kafka_topic = None
+    # 保存数据后需要清除缓存的 GetView
+    invalidate_views = ()
+
+    def post(self, *args, **kwargs):
+        items = self.parse_json().get("items")
+        if not isinstance(items, list):
+            raise APIException(
+                error_type="need_items_argument",
+                error_message="bulk api need items argument",
+            )
+        if len(items) > self.max_items:
+            raise APIException(
+                error_type="too_many_items",
+                error_message=f"bulk api accept at most {self.max_items} items",
+            )
+
+        validated_items, results = self.validate_items(items, kwargs)
+
+        indexes = [
+            index for index, item in enumerate(validated_items)
+            if item is not None
+        ]
+        errors = self.save_items([validated_items[index] for index in indexes])
+
+        saved_items = []
+        for index, error in zip(indexes, errors):
+            if error is not None:
+                results[index] = {
+                    "ok": False,
+                    "error_type": "save_failed",
+                    "error_message": str(error),
+                }
+                continue
+
+            item = validated_items[index]
+            saved_items.append(item)
+            results[index] = {"ok": True, "result": self.serialize_item(item)}
+
+        for item in saved_items:
+            invalidate_view_caches(self.invalidate_views, item)
+        self.produce_messages(saved_items)
+        return ok_response({"items": results})
+
+    def validate_items(self, items, kwargs):
+        """验证所有的 item
+        返回: (验证后的数据, 验证失败的为 None; 每个 item 的结果, 验证通过的为 None)
+        """
+        for item in items:
+            if isinstance(item, dict):
+                item.update(kwargs)
+
+        deserializer = get_schema(self.item_deserializer_class, many=True)
+        try:
+            return deserializer.load(items), [None] * len(items)
+        except ValidationError as validation_error:
+            messages = validation_error.messages
+            valid_data = validation_error.valid_data
+            if not all(isinstance(index, int) for index in messages):
+                # 不是每个 item 的错误
+                raise
+
+        validated_items, results = [], []
+        for index, item in enumerate(valid_data):
+            if index in messages:
+                validated_items.append(None)
+                results.append(
+                    validation_error_body(ValidationError(messages[index]))
+                )
+            else:
+                validated_items.append(item)
+                results.append(None)
+        return validated_items, results
+
+    def serialize_item(self, item):
+        if not self.bulk_serializer_class:
+            return {}
+        return get_schema(self.bulk_serializer_class).dump(item)
+
+    def save_items(self, items):
+        """保存数据, 返回和 items 顺序一致的列表, 保存成功为 None, 失败为异常
+        默认写入 bulk_model, 需要其他的保存方式在子类中覆盖
+        """
+        if self.bulk_model is None:
+            raise NotImplementedError
+
+        return bulk_insert(
+            DatabaseManagement(app),
+            self.bulk_model,
+            items,
+            batch_size=self.bulk_batch_size,
+            concurrency=self.bulk_concurrency,
+        )
+
+    def kafka_message(self, item):
+        """item 对应的 kafka 消息, 返回 None 时不发送"""
+        return response_encoder().dumps(item)
+
+    def get_kafka_topic(self):
+        return self.kafka_topic
+
+    def produce_messages(self, items):
+        """所有消息放入发送队列后, 只 poll 一次处理发送结果"""
+        topic = self.get_kafka_topic()
+        if not topic or not items:
+            return
+
+        for item in items:
+            message = self.kafka_message(item)
+            if message is not None:
+                kafka_producer.send(topic, message)
+        kafka_producer.poll(0)
+
+
 class DeleteView(APIBaseView):
     """删除数据的 view
     1. 获取上下文: 通过数据库或其他 model 层获取数据
@@ -195,12 +445,15 @@ class DeleteView(APIBaseView):
 
     args_deserializer_class = None
     delete_serializer_class = None
+    # 保存数据后需要清除缓存的 GetView
+    invalidate_views = ()
 
     def delete(self, *args, **kwargs):
         self.validated_data = self.get_validated_data(kwargs)
 
         # 保存数据
         deleted_object = self.save()
+        invalidate_view_caches(self.invalidate_views, self.validated_data)
         return self.response(deleted_object)
 
     def get_validated_data(self, kwargs):
@@ -210,7 +463,7 @@ class DeleteView(APIBaseView):
 
         request_data = self.parse_json()
         request_data.update(kwargs)
-        deserializer = self.args_deserializer_class()
+        deserializer = get_schema(self.args_deserializer_class)
         validated_data = deserializer.load(request_data)
         return validated_data
 
@@ -225,7 +478,7 @@ class DeleteView(APIBaseView):
         默认返回空 json 对象, 需要修改则在子类中覆盖这个方法
         """
         if self.delete_serializer_class:
-            data = self.delete_serializer_class().dump(deleted_object)
+            data = get_schema(self.delete_serializer_class).dump(deleted_object)
             return ok_response(data)
         else:
             return ok_response({})
@@ -236,6 +489,12 @@ class ListView(APIBaseView):
     1. 反序列化传入的参数
     2. 获取一组数据
     3. 序列化一组数据
+
+    cursor_paging 为 True 时使用 cursor 分页, filter_objects 返回 cqlengine 的查询:
+        请求参数 cursor: 上一页返回的 next_cursor, 第一页不传
+        请求参数 size: 每页的数量, 默认为 page_size, 最大为 max_page_size
+        返回结果中的 next_cursor 为 null 时没有下一页
+    每次请求只从 Cassandra 读取一页数据
     """
 
     # 传入参数的的反序列化器
@@ -243,11 +502,29 @@ class ListView(APIBaseView):
     # 过滤出来的结果的序列化器
     list_serializer_class = None
     list_result_name = "items"
+    # 流式返回结果: 从结果迭代器中分批序列化和编码, 使用 chunked response 返回
+    # 注意: 开始返回数据后发生的异常无法再转换成错误的 response
+    stream_results = False
+    stream_batch_size = 100
+    # 根据数据版本计算的 ETag, 在 get 中设置
+    version_etag = None
+    # cursor 分页
+    cursor_paging = False
+    page_size = 20
+    max_page_size = 100
+    next_cursor = None
 
     def get(self, *args, **kwargs):
         """处理 GET 请求"""
         self.validated_data = self.get_validated_data(kwargs)
+
+        self.version_etag = self.get_version_etag()
+        if self.is_not_modified(self.version_etag):
+            return not_modified_response(self.version_etag)
+
         target_objects = self.filter_objects()
+        if self.cursor_paging:
+            target_objects = self.paging_objects(target_objects)
         return self.response(target_objects)
 
     def get_validated_data(self, kwargs):
@@ -257,13 +534,16 @@ class ListView(APIBaseView):
         request_data = {}
         # 处理 GET 参数的格式，让 marshmallow 比较容易处理
         for key, value in request.args.items():
+            # 分页参数不需要反序列化
+            if self.cursor_paging and key in ("cursor", "size"):
+                continue
             if isinstance(value, list) and len(value) == 1:
                 request_data[key] = value[0]
             else:
                 request_data[key] = value
 
         request_data.update(kwargs)
-        deserializer = self.args_deserializer_class()
+        deserializer = get_schema(self.args_deserializer_class)
         validated_data = deserializer.load(request_data)
         return validated_data
 
@@ -271,6 +551,40 @@ class ListView(APIBaseView):
         """获取需要序列化的对象"""
         raise NotImplementedError
 
+    def get_page_size(self):
+        try:
+            size = int(request.args.get("size", self.page_size))
+        except ValueError:
+            raise APIException(
+                error_type="invalid_page_size",
+                error_message="Invalid page size",
+            )
+        return min(max(size, 1), self.max_page_size)
+
+    def fetch_page(self, objects, size, paging_state):
+        """读取一页数据, 返回: (当前页的数据, 下一页的 paging_state)
+        默认 objects 为 cqlengine 的查询, 其他类型的查询需要在子类中覆盖
+        """
+        return fetch_queryset_page(objects, size, paging_state)
+
+    def paging_objects(self, objects):
+        """根据请求中的 cursor 读取一页数据, 设置 next_cursor"""
+        try:
+            paging_state = decode_cursor(
+                request.args.get("cursor"), request.endpoint
+            )
+        except ValueError:
+            raise APIException(
+                error_type="invalid_cursor",
+                error_message="Invalid cursor",
+            )
+
+        page, next_paging_state = self.fetch_page(
+            objects, self.get_page_size(), paging_state
+        )
+        self.next_cursor = encode_cursor(next_paging_state, request.endpoint)
+        return page
+
     def response(self, results):
         """响应结果
         默认返回空 json 对象, 需要修改则在子类中覆盖这个方法
@@ -278,24 +592,77 @@ class ListView(APIBaseView):
         if not self.list_serializer_class:
             return ok_response({})
 
-        _serializer = self.list_serializer_class()
-        return ok_response({
-            self.list_result_name: _serializer.dump(results, many=True),
-        })
+        _serializer = get_schema(self.list_serializer_class)
+        if self.stream_results and not self.cursor_paging:
+            return self.stream_response(_serializer, results)
+
+        # cqlengine 的查询在迭代时才读取数据, 先读取全部数据, 耗时记录为 query
+        with phase("query"):
+            results = list(results)
+        result = {self.list_result_name: _serializer.dump(results, many=True)}
+        if self.cursor_paging:
+            result["next_cursor"] = self.next_cursor
+        body = encode_ok(result, encoder=response_encoder())
+        return self.conditional_response(body, self.version_etag)
+
+    def iter_batches(self, results):
+        """按 stream_batch_size 分批读取结果"""
+        iterator = iter(results)
+        while True:
+            batch = list(islice(iterator, self.stream_batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def iter_objects(self, objects):
+        """流式读取 filter_objects 的结果
+        cqlengine 的查询使用驱动分页逐页读取, 每页 stream_batch_size 条数据
+        """
+        if isinstance(objects, AbstractQuerySet):
+            return iter_queryset(objects, fetch_size=self.stream_batch_size)
+        return objects
+
+    def stream_response(self, serializer, results):
+        """分批序列化并返回结果, 内存中只保留一批数据
+        读取, 序列化和编码都在返回 response 之后进行, 由 stream_metrics 记录耗时
+        """
+        results = self.iter_objects(results)
+        dump = timed("serialization", serializer.dump)
+        batches = (
+            dump(batch, many=True)
+            for batch in self.iter_batches(timed_iter("query", results))
+        )
+        chunks = iter_encode_ok_items(
+            self.list_result_name, batches, encoder=response_encoder()
+        )
+        return app.response_class(
+            stream_with_context(stream_metrics(chunks)),
+            mimetype=app.config["JSONIFY_MIMETYPE"],
+        )
 
 
 class MultiRetrievePutView(APIBaseView):
+    """批量获取数据的 view
+    设置了 mget_model 时, 默认的 mget 会根据 items 中的主键并发地查询 Cassandra,
+    请求中的 fields 会作为查询的字段, 不存在的数据返回 null
+    """
+
     args_deserializer_class = None
     multi_args_deserializer_class = None
     retrieve_serializer_class = None
+    # cqlengine model
+    mget_model = None
+    # 同时进行中的查询数量上限
+    mget_concurrency = DEFAULT_CONCURRENCY
 
     def put(self, *args, **kwargs):
         self.validated_data = self.get_validated_data(kwargs)
         retrieve_items = self.mget()
 
-        serializer = self.retrieve_serializer_class()
+        serializer = get_schema(self.retrieve_serializer_class)
         serialized_retrieve_items = [
-            serializer.dump(item) for item in retrieve_items
+            serializer.dump(item) if item is not None else None
+            for item in retrieve_items
         ]
 
         retrieve_items_with_allow_fields = self.filter_fields(
@@ -316,19 +683,42 @@ class MultiRetrievePutView(APIBaseView):
 
         request_data.update(kwargs)
         if self.args_deserializer_class:
-            args_deserializer = self.args_deserializer_class()
+            args_deserializer = get_schema(self.args_deserializer_class)
             result = args_deserializer.load(request_data)
         else:
             result = {}
 
-        multi_args_deserializer = self.multi_args_deserializer_class()
+        multi_args_deserializer = get_schema(self.multi_args_deserializer_class)
         result.update({
             "items": [multi_args_deserializer.load(item) for item in items]
         })
         return result
 
     def mget(self):
-        raise NotImplementedError
+        if self.mget_model is None:
+            raise NotImplementedError
+
+        # multi_args_deserializer_class 没有要求完整的主键时, 返回字段验证错误
+        missing = missing_primary_keys(
+            self.mget_model, self.validated_data["items"]
+        )
+        if missing:
+            raise ValidationError({
+                "items": {
+                    index: {
+                        name: ["Missing data for required field."]
+                        for name in names
+                    } for index, names in missing.items()
+                }
+            })
+
+        return multi_get(
+            DatabaseManagement(app),
+            self.mget_model,
+            self.validated_data["items"],
+            fields=self.allow_fields,
+            concurrency=self.mget_concurrency,
+        )
 
     def filter_fields(self, items):
         if self.allow_fields is None:
@@ -336,6 +726,10 @@ class MultiRetrievePutView(APIBaseView):
 
         results = []
         for item in items:
+            if item is None:
+                results.append(None)
+                continue
+
             # 只获取 item 中需要的字段
             _item = {}
             for field_name in self.allow_fields:
@@ -353,7 +747,24 @@ class MultiRetrievePutView(APIBaseView):
 
 
 class AdminListView(GetView):
-    """管理界面用的ListView"""
+    """管理界面用的ListView
+
+    paging_mode 分页方式:
+        memory: 加载全部数据, 排序后分页
+        driver: 使用 Cassandra 驱动分页, 每次只读取 size 条数据,
+                按表的 clustering 顺序返回, 需要实现 get_paging_query
+        top_k: 流式遍历 get_all_objects 的结果, 用堆选出前 end 条数据,
+               内存占用为 O(end), get_all_objects 需要返回迭代器,
+               例如 cassandra_orm.paging.iter_rows
+               search 会一次处理所有数据, top_k 模式中使用逐条判断的 match 过滤
+
+    top_k 和 driver 模式中 end 最大为 max_end, 每页最多 max_page_size 条数据,
+    memory 模式已经加载了全部数据, 不限制 start / end / size
+    """
+
+    paging_mode = "memory"
+    max_page_size = 100
+    max_end = 10000
 
     def get(self, *args, **kwargs):
         """处理 GET 请求"""
@@ -362,23 +773,51 @@ class AdminListView(GetView):
         serialized_data = self.serialize(target_object)
         return ok_response(serialized_data)
 
+    @staticmethod
+    def int_arg(name, default):
+        try:
+            return int(request.args.get(name, default))
+        except ValueError:
+            raise APIException(
+                error_type=f"invalid_{name}",
+                error_message=f"Invalid {name}",
+            )
+
     def get_context(self, kwargs):
+        start = self.int_arg("start", 0)
+        end = self.int_arg("end", 10)
+        size = self.int_arg("size", 10)
+        if self.paging_mode != "memory":
+            # top_k 的内存占用和 end 成正比, driver 每次读取 size 条数据
+            start = min(max(start, 0), self.max_end)
+            end = min(max(end, start), start + self.max_page_size, self.max_end)
+            size = min(max(size, 1), self.max_page_size)
         return {
-            "start": int(request.args.get("start", 0)),
-            "end": int(request.args.get("end", 10)),
+            "start": start,
+            "end": end,
             "order": request.args.get("order", "desc"),
             "sort": request.args.get("sort", "created_at"),
             "keyword": request.args.get("keyword", None),
-            "size": int(request.args.get("size", 10)),
+            "size": size,
             "paging_state": request.args.get("paging_state", None),
         }
 
     def get_all_objects(self):
         raise NotImplementedError
 
+    def get_paging_query(self):
+        """driver 分页模式使用的查询
+        返回: (cql 或 statement, 参数)
+        """
+        raise NotImplementedError
+
     def search(self, results):
         raise NotImplementedError
 
+    def match(self, result):
+        """top_k 模式中过滤数据, 返回 False 的数据不会出现在结果中"""
+        return True
+
     def paging_results(self, results, start, end, order_by, sort_field):
         if order_by.lower() == "desc":
             reverse = True
@@ -390,13 +829,64 @@ class AdminListView(GetView):
         )
         return sorted_results[start:end], len(sorted_results)
 
+    def top_k_results(self, results, start, end, order_by, sort_field):
+        """和 paging_results 结果一致, 但只在内存中保留前 end 条数据"""
+        total = 0
+
+        def counted_results():
+            nonlocal total
+            for result in results:
+                total += 1
+                yield result
+
+        if order_by.lower() == "desc":
+            select = heapq.nlargest
+        else:
+            select = heapq.nsmallest
+
+        top_results = select(
+            end, counted_results(), key=lambda x: getattr(x, sort_field)
+        )
+        return top_results[start:end], total
+
+    def driver_paging_results(self, paging_state, size):
+        """使用驱动分页读取一页数据"""
+        try:
+            paging_state = decode_paging_state(paging_state)
+        except ValueError:
+            raise APIException(
+                error_type="invalid_paging_state",
+                error_message="Invalid paging state",
+            )
+
+        query, parameters = self.get_paging_query()
+        rows, next_paging_state = fetch_page(
+            app.cql, query, parameters, size=size, paging_state=paging_state
+        )
+        return rows, encode_paging_state(next_paging_state)
+
     def get_object(self, kwargs):
         self.context = self.get_context(kwargs)
 
+        if self.paging_mode == "driver":
+            paging_results, next_paging_state = self.driver_paging_results(
+                self.context["paging_state"], self.context["size"]
+            )
+            # 驱动分页无法低成本地得到总数
+            self.context["total"] = None
+            self.context["next_paging_state"] = next_paging_state
+            return paging_results
+
         results = self.get_all_objects()
-        results = self.search(results)
+        if self.paging_mode == "top_k":
+            # 逐条过滤, 不会把所有数据加载到内存中
+            results = filter(self.match, results)
+            get_paging_results = self.top_k_results
+        else:
+            results = self.search(results)
+            get_paging_results = self.paging_results
 
-        paging_results, total_results = self.paging_results(
+        paging_results, total_results = get_paging_results(
             results,
             self.context["start"],
             self.context["end"],
@@ -407,11 +897,14 @@ class AdminListView(GetView):
         return paging_results
 
     def serialize(self, results):
-        _serializer = self.get_serializer_class()
-        return {
+        _serializer = get_schema(self.get_serializer_class)
+        data = {
             "items": _serializer.dump(results, many=True),
             "total": self.context["total"],
         }
+        if self.paging_mode == "driver":
+            data["paging_state"] = self.context["next_paging_state"]
+        return data
 
 
 def deprecated_api(view):
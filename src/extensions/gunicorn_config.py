@@ -3,10 +3,55 @@ import os
 bind = "0.0.0.0:8000"
 
 workers = 3
+# 收到 SIGTERM 后 worker 退出的最长时间, 需要大于 worker_exit 中清理的时间
+graceful_timeout = 30
 max_requests = 3000
 max_requests_jitter = 1000
+# worker 共享 master 中导入的代码, 客户端在 worker 中第一次使用时创建
+preload_app = True
 
 # staging 环境下，显示 access-log
 if os.environ.get("STAGE") != "production":
     accesslog = "-"
     loglevel = "DEBUG"
+
+
+def on_starting(server):
+    """清除上一次运行的 worker 留下的 metrics 文件"""
+    from extensions.metrics import clear_metrics_files
+
+    clear_metrics_files()
+
+
+def when_ready(server):
+    """master 加载 app 时建立的连接, 在 fork worker 之前释放"""
+    from extensions.client_registry import client_registry
+
+    client_registry.before_fork()
+
+
+def post_fork(server, worker):
+    """fork 之前创建的连接不能在 worker 中使用, 需要重新连接"""
+    from extensions.client_registry import client_registry
+
+    client_registry.after_fork()
+
+
+def worker_exit(server, worker):
+    """worker 退出 (重启 / 达到 max_requests) 时发送缓冲的数据, 关闭连接"""
+    from extensions.client_registry import client_registry
+
+    durations = client_registry.shutdown()
+    worker.log.info(
+        "Worker %s drained in %.3fs: %s",
+        worker.pid,
+        sum(durations.values()),
+        ", ".join(f"{name}={cost:.3f}s" for name, cost in durations.items()),
+    )
+
+
+def on_exit(server):
+    """master 退出时清理 master 进程中的客户端"""
+    from extensions.client_registry import client_registry
+
+    client_registry.shutdown()
@@ -1,15 +1,29 @@
 import importlib
+import logging
 import os
 import signal
-from functools import partial
+import threading
+import time
 
 import ujson
 from confluent_kafka import Producer
+from opentelemetry.trace import SpanKind
 
+from extensions.client_registry import (
+    SHUTDOWN_ORDER_FLUSH,
+    LazyClient,
+    client_registry,
+)
+from extensions.metrics import register_collector
+from extensions.opentelemetry.spans import byte_size, child_span
 from extensions.sentry import sentry
 
-default_sigint_handler = signal.getsignal(signal.SIGINT)
-default_sigterm_handler = signal.getsignal(signal.SIGTERM)
+logger = logging.getLogger(__name__)
+
+default_handlers = {
+    signal.SIGINT: signal.getsignal(signal.SIGINT),
+    signal.SIGTERM: signal.getsignal(signal.SIGTERM),
+}
 
 
 def get_config(config_name: str = None):
@@ -27,14 +41,145 @@ def get_config(config_name: str = None):
 config = get_config()
 
 
-class KafkaProducer(Producer):
+class KafkaProducer:
+    """confluent_kafka Producer 的封装
+
+    1. 后台线程定期调用 poll, 发送结果的回调可以及时执行, 发送失败的消息记录到 sentry
+    2. 本地队列满 (BufferError) 时最多阻塞 block_timeout 秒等待队列空出位置
+    3. topic_configs 中的 topic 使用单独的 producer 配置, 例如调整 linger.ms
+    """
+
+    def __init__(
+        self,
+        producer_config,
+        topic_configs=None,
+        poll_interval=0.1,
+        block_timeout=1,
+    ):
+        self.poll_interval = poll_interval
+        self.block_timeout = block_timeout
+
+        self.default_producer = Producer(producer_config)
+        self.topic_producers = {
+            topic: Producer({
+                **producer_config,
+                **topic_config
+            }) for topic, topic_config in (topic_configs or {}).items()
+        }
+
+        self.counters = {
+            "sent": 0,
+            "delivered": 0,
+            "failed": 0,
+            "buffer_full": 0,
+            # 等待 block_timeout 后队列仍然已满, 没有发送的消息
+            "rejected": 0,
+        }
+        self.latency_total = 0
+        self.latency_max = 0
+
+        self._stopped = threading.Event()
+        self._poller = threading.Thread(
+            target=self._poll_loop, name="kafka-poller", daemon=True
+        )
+        self._poller.start()
+
+    @property
+    def producers(self):
+        return [self.default_producer, *self.topic_producers.values()]
+
+    def producer_for(self, topic):
+        return self.topic_producers.get(topic, self.default_producer)
+
+    def _poll_loop(self):
+        # poll(0) 不阻塞, 使用 sleep 等待, 在 gevent worker 中也不会阻塞其他请求
+        while not self._stopped.is_set():
+            self.poll(0)
+            time.sleep(self.poll_interval)
+
+    def _delivery_callback(self, callback):
+        """记录发送结果和延迟"""
+        sent_at = time.monotonic()
+
+        def on_delivery(err, msg):
+            latency = time.monotonic() - sent_at
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if err:
+                self.counters["failed"] += 1
+            else:
+                self.counters["delivered"] += 1
+            callback(err, msg)
+
+        return on_delivery
+
+    def send(self, topic, *args, **kwargs):
+        """发送消息，如果发送消息失败，记录到 sentry"""
+        callback = kwargs.pop("callback",
+                              None) or kwargs.pop("on_delivery", None)
+        kwargs["on_delivery"] = self._delivery_callback(
+            callback or self.report_failed_msg
+        )
+
+        producer = self.producer_for(topic)
+
+        def attributes():
+            value = args[0] if args else kwargs.get("value")
+            return {
+                "messaging.system": "kafka",
+                "messaging.destination": topic,
+                "messaging.message_payload_size_bytes": byte_size(value),
+            }
+
+        # 只记录放入本地队列的耗时, 发送到 broker 在后台线程中完成
+        with child_span(f"kafka send {topic}", attributes, SpanKind.PRODUCER):
+            deadline = time.monotonic() + self.block_timeout
+            while True:
+                try:
+                    producer.produce(topic, *args, **kwargs)
+                except BufferError:
+                    # 本地队列已满, 处理发送结果空出位置后重试
+                    self.counters["buffer_full"] += 1
+                    if time.monotonic() >= deadline:
+                        self.counters["rejected"] += 1
+                        raise
+                    producer.poll(self.poll_interval)
+                else:
+                    self.counters["sent"] += 1
+                    return
 
-    def send(self, *args, **kwargs):
-        """patch produce 方法，如果发送消息失败，记录到 sentry"""
-        if "callback" in kwargs:
-            return self.produce(*args, **kwargs)
-        return partial(self.produce,
-                       callback=self.report_failed_msg)(*args, **kwargs)
+    produce = send
+
+    def poll(self, timeout=0):
+        return sum(producer.poll(timeout) for producer in self.producers)
+
+    def flush(self, timeout=None):
+        """等待所有消息发送完成, 返回还没有发送的消息数量"""
+        if timeout is None:
+            return sum(producer.flush() for producer in self.producers)
+
+        deadline = time.monotonic() + timeout
+        remaining = 0
+        for producer in self.producers:
+            remaining += producer.flush(max(deadline - time.monotonic(), 0))
+        return remaining
+
+    def close(self):
+        self._stopped.set()
+
+    def __len__(self):
+        return sum(len(producer) for producer in self.producers)
+
+    def metrics(self):
+        """队列长度和发送延迟"""
+        finished = self.counters["delivered"] + self.counters["failed"]
+        average_latency = self.latency_total / finished if finished else 0
+        return dict(
+            self.counters,
+            queue_depth=len(self),
+            delivery_latency_avg_ms=average_latency * 1000,
+            delivery_latency_max_ms=self.latency_max * 1000,
+        )
 
     @staticmethod
     def report_failed_msg(err, msg):
@@ -48,28 +193,71 @@ class KafkaProducer(Producer):
         )
 
 
-# config 字段文档
-# https://github.com/edenhill/librdkafka/blob/master/CONFIGURATION.md
-kafka_producer = KafkaProducer(
-    **{
-        "bootstrap.servers": config.KAFKA_SERVER,
-        "compression.type": "snappy",
-        "enable.idempotence": True,
-    }
+def initialize_kafka_producer():
+    # config 字段文档
+    # https://github.com/edenhill/librdkafka/blob/master/CONFIGURATION.md
+    return KafkaProducer(
+        {
+            "bootstrap.servers": config.KAFKA_SERVER,
+            "compression.type": "snappy",
+            "enable.idempotence": True,
+            "linger.ms": config.KAFKA_LINGER_MS,
+            "batch.num.messages": config.KAFKA_BATCH_NUM_MESSAGES,
+        },
+        topic_configs=config.KAFKA_TOPIC_CONFIGS,
+        poll_interval=config.KAFKA_POLL_INTERVAL,
+        block_timeout=config.KAFKA_PRODUCE_BLOCK_TIMEOUT,
+    )
+
+
+kafka_producer = LazyClient("kafka", initialize_kafka_producer)
+
+
+def collect_kafka_counters():
+    """没有使用过 producer 时不创建"""
+    if not kafka_producer.is_initialized:
+        return {}
+    return dict(kafka_producer.counters)
+
+
+register_collector(
+    "kafka_producer_messages_total",
+    "event",
+    collect_kafka_counters,
+    help_text="Kafka messages sent, delivered, failed and local queue full",
+)
+
+
+def drain_kafka_producer(timeout):
+    """发送本地队列中的消息, 最多等待 timeout 秒"""
+    if not kafka_producer.is_initialized:
+        return
+
+    remaining = kafka_producer.flush(timeout)
+    kafka_producer.close()
+    if remaining:
+        logger.warning(f"Kafka producer drained with {remaining} messages lost")
+
+
+client_registry.register_shutdown_handler(
+    "kafka", drain_kafka_producer, order=SHUTDOWN_ORDER_FLUSH
 )
 
 
 def shutdown(signum, frame):
     """清理 kafka producer"""
-    global default_sigint_handler
-    global default_sigterm_handler
-
-    kafka_producer.flush(timeout=3)
+    drain_kafka_producer(timeout=config.KAFKA_SHUTDOWN_TIMEOUT)
 
-    if signum == signal.SIGTERM:
-        default_sigterm_handler(signum, frame)
-    if signum == signal.SIGINT:
-        default_sigint_handler(signum, frame)
+    default_handler = default_handlers[signum]
+    if callable(default_handler):
+        default_handler(signum, frame)
+    elif default_handler != signal.SIG_IGN:
+        # SIG_DFL: 恢复默认的处理方式后重新发送信号, 退出进程
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
 
 
+# gunicorn worker 会设置自己的信号处理函数, 通过 worker_exit 清理
+# 这里处理直接运行 flask / 脚本时的退出
 signal.signal(signal.SIGINT, shutdown)
+signal.signal(signal.SIGTERM, shutdown)
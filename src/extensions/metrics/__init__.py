@@ -0,0 +1,243 @@
+"""
+API 的耗时和错误统计, 使用 Prometheus 的文本格式输出
+
+每个请求按阶段记录耗时:
+    validation: 反序列化和验证请求数据
+    query: get_object / filter_objects / mget 等读取数据
+    save: save / save_items 保存数据
+    serialization: 序列化结果
+    encoding: json 编码
+    total: 整个请求
+嵌套的阶段不计入外层阶段, 例如 serialization 中的 encoding 只记录到 encoding
+流式 response 在 view 返回之后才读取和编码数据, 使用 stream_metrics 包装生成器,
+生成器结束时才记录 total
+
+gunicorn 的多个 worker 通过 METRICS_DIR 目录中的文件汇总, 由 /metrics 输出
+
+客户端在进程内累计的统计 (例如缓存命中数) 通过 register_collector 注册,
+和错误统计一起写入文件汇总
+
+eg:
+    register_collector(
+        "response_cache_events_total", "event", lambda: dict(cache.counters)
+    )
+"""
+import importlib
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, has_request_context, request
+
+from extensions.client_registry import LazyClient, client_registry
+from extensions.metrics.store import MetricsStore, render, render_counter
+
+PHASE_METRIC = "api_phase_seconds"
+ERROR_METRIC = "api_errors_total"
+# register_collector 注册的 counter 在 labels 中记录名称, 和错误统计区分
+NAME_LABEL = "__name__"
+
+# counter 名称 -> (label 名称, 读取累计值的函数, help)
+collectors = {}
+
+
+def get_config(config_name: str = None):
+    """
+    读取 config
+    如果没有配置, 就从环境变量读取 config
+    """
+    if not config_name:
+        config_name = os.environ.get("STAGE")
+
+    configs_module = importlib.import_module("configs")
+    return getattr(configs_module, config_name.capitalize())
+
+
+config = get_config()
+
+
+def register_collector(name, label, collect, help_text=""):
+    """注册进程内累计的 counter
+    collect 返回 {label 的值: 进程启动以来的累计值}, 写入文件和输出 /metrics 时调用
+    """
+    collectors[name] = (label, collect, help_text)
+
+
+def collect_counters():
+    """所有注册的 counter 的当前值, 作为 MetricsStore 的 collector"""
+    values = {}
+    for name, (label, collect, _) in collectors.items():
+        for key, value in collect().items():
+            values[((NAME_LABEL, name), (label, key))] = value
+    return values
+
+
+def initialize_metrics_store():
+    store = MetricsStore(
+        directory=config.METRICS_DIR, collector=collect_counters
+    )
+    if config.METRICS_DIR:
+        store.start_flusher(config.METRICS_FLUSH_INTERVAL)
+    return store
+
+
+metrics_store = LazyClient("metrics", initialize_metrics_store)
+
+
+class PhaseTimer:
+    """一个请求中各阶段的耗时"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = {}
+        # 正在进行的阶段中, 嵌套的子阶段的耗时
+        self.stack = []
+        # 流式 response 在生成器结束时才记录
+        self.streaming = False
+
+
+@contextmanager
+def phase(name):
+    """记录当前请求中一个阶段的耗时"""
+    timer = g.get("_metrics_timer") if has_request_context() else None
+    if timer is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    timer.stack.append(0.0)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        children = timer.stack.pop()
+        timer.phases[name] = timer.phases.get(name, 0) + elapsed - children
+        if timer.stack:
+            timer.stack[-1] += elapsed
+
+
+def timed_iter(name, iterable):
+    """迭代 iterable 的耗时记录为 name 阶段
+    用于迭代时才读取数据的查询, 例如 cqlengine 的 queryset 和 iter_rows
+    """
+    with phase(name):
+        iterator = iter(iterable)
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def timed(name, func):
+    """func 的耗时记录为 name 阶段"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def request_metrics():
+    """记录整个请求的耗时, 请求结束后把各阶段的耗时写入 metrics_store"""
+    if not config.METRICS_ENABLED or "_metrics_timer" in g:
+        yield
+        return
+
+    timer = g._metrics_timer = PhaseTimer()
+    try:
+        yield
+    finally:
+        g.pop("_metrics_timer")
+        if not timer.streaming:
+            observe_request(timer)
+
+
+def observe_request(timer):
+    timer.phases["total"] = time.perf_counter() - timer.started_at
+
+    store = metrics_store.get_client()
+    endpoint = ("endpoint", request.endpoint or "unknown")
+    method = ("method", request.method)
+    for name, seconds in timer.phases.items():
+        store.observe((endpoint, method, ("phase", name)), seconds)
+
+
+def stream_metrics(chunks):
+    """包装流式 response 的生成器, 生成器执行时继续记录各阶段的耗时,
+    生成器结束 (或客户端断开) 时记录 total, 需要在 view 中调用
+    """
+    timer = g.get("_metrics_timer") if has_request_context() else None
+    if timer is None:
+        return chunks
+
+    timer.streaming = True
+    return _stream_chunks(timer, chunks)
+
+
+def _stream_chunks(timer, chunks):
+    # stream_with_context 保留了请求的 g, 但 view 返回时已经移除了 timer
+    g._metrics_timer = timer
+    try:
+        yield from chunks
+    finally:
+        g.pop("_metrics_timer", None)
+        observe_request(timer)
+
+
+def record_error(error_type):
+    """记录 API 返回的错误类型"""
+    if not config.METRICS_ENABLED or not has_request_context():
+        return
+    metrics_store.inc((
+        ("endpoint", request.endpoint or "unknown"),
+        ("error_type", error_type),
+    ))
+
+
+def render_metrics():
+    """所有 worker 汇总后的 Prometheus 文本"""
+    histograms, counters = metrics_store.collect()
+    errors = {}
+    families = {name: {} for name in collectors}
+    for labels, value in counters.items():
+        if labels and labels[0][0] == NAME_LABEL:
+            families.setdefault(labels[0][1], {})[labels[1:]] = value
+        else:
+            errors[labels] = value
+
+    text = render(
+        PHASE_METRIC,
+        histograms,
+        ERROR_METRIC,
+        errors,
+        buckets=metrics_store.buckets,
+        histogram_help="API latency by endpoint and phase in seconds",
+        counter_help="API error responses by endpoint and error type",
+    )
+    for name, family in sorted(families.items()):
+        help_text = collectors[name][2] if name in collectors else ""
+        text += render_counter(name, family, help_text)
+    return text
+
+
+def clear_metrics_files():
+    """gunicorn 启动时清除上一次运行留下的文件"""
+    if config.METRICS_DIR and os.path.isdir(config.METRICS_DIR):
+        shutil.rmtree(config.METRICS_DIR)
+
+
+def flush_metrics(timeout):
+    """worker 退出时把数据合并到 aggregate 文件"""
+    if metrics_store.is_initialized:
+        metrics_store.retire()
+
+
+client_registry.register_shutdown_handler("metrics", flush_metrics)
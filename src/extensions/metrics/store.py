@@ -0,0 +1,256 @@
+"""
+进程内的 histogram / counter, 以及多进程汇总和 Prometheus 文本格式输出
+
+每个 gunicorn worker 定期把自己的数据写入 directory/<pid>-<启动时间>.json,
+/metrics 读取目录中所有 worker 的文件汇总后输出
+文件名包含启动时间, pid 被新的 worker 复用时不会覆盖退出的 worker 的数据
+worker 退出时把数据合并到 aggregate.json 并删除自己的文件,
+汇总结果和 Prometheus 的 counter 一样只增不减, 目录中的文件数量也不会一直增加
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 和 prometheus_client 的默认 buckets 一致, 单位: 秒
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5,
+    10.0
+)
+# 退出的 worker 合并后的数据
+AGGREGATE_NAME = "aggregate"
+# 合并和读取文件时使用的文件锁
+LOCK_NAME = ".lock"
+
+
+class MetricsStore:
+
+    def __init__(self, directory=None, buckets=DEFAULT_BUCKETS, collector=None):
+        self.directory = directory
+        self.buckets = tuple(buckets)
+        # labels -> [每个 bucket 的数量 (最后一个为 +Inf), sum]
+        self.histograms = {}
+        # labels -> value
+        self.counters = {}
+        self._lock = threading.Lock()
+        # 文件名, 每个进程创建自己的 store
+        self.worker_id = f"{os.getpid()}-{time.time_ns()}"
+        self._file_lock = threading.Lock()
+        self._retired = False
+        # 读取进程内累计值的函数, 返回 {labels: value}, 生成快照前更新到 counters
+        self.collector = collector
+
+    def observe(self, labels: tuple, seconds: float):
+        """记录一次耗时, labels 为 ((name, value), ...)"""
+        index = len(self.buckets)
+        for bucket_index, bucket in enumerate(self.buckets):
+            if seconds <= bucket:
+                index = bucket_index
+                break
+
+        with self._lock:
+            histogram = self.histograms.get(labels)
+            if histogram is None:
+                counts = [0] * (len(self.buckets) + 1)
+                histogram = self.histograms[labels] = [counts, 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    def inc(self, labels: tuple, value=1):
+        with self._lock:
+            self.counters[labels] = self.counters.get(labels, 0) + value
+
+    def snapshot(self):
+        """可以序列化为 json 的数据"""
+        values = self.collector() if self.collector else {}
+        with self._lock:
+            self.counters.update(values)
+            return make_snapshot(self.histograms, self.counters)
+
+    def path(self, name=None):
+        return os.path.join(self.directory, f"{name or self.worker_id}.json")
+
+    @contextmanager
+    def locked(self, operation):
+        """目录的文件锁, 合并退出的 worker 的数据时不会被读取方重复计算"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_NAME), "a") as file:
+            fcntl.flock(file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def write(self):
+        """写入当前进程的数据"""
+        if not self.directory:
+            return
+        with self._file_lock:
+            if self._retired:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            write_json(self.path(), self.snapshot())
+
+    def retire(self):
+        """worker 退出时把数据合并到 aggregate 文件, 删除自己的文件"""
+        if not self.directory:
+            return
+        with self._file_lock:
+            if self._retired:
+                return
+            self._retired = True
+            with self.locked(fcntl.LOCK_EX):
+                aggregate_path = self.path(AGGREGATE_NAME)
+                snapshots = [self.snapshot()]
+                aggregate = read_json(aggregate_path)
+                if aggregate is not None:
+                    snapshots.append(aggregate)
+                write_json(
+                    aggregate_path, make_snapshot(*merge_snapshots(snapshots))
+                )
+                try:
+                    os.remove(self.path())
+                except FileNotFoundError:
+                    pass
+
+    def collect(self):
+        """汇总所有进程的数据, 当前进程使用内存中最新的数据"""
+        snapshots = [self.snapshot()]
+        if not self.directory or not os.path.isdir(self.directory):
+            return merge_snapshots(snapshots)
+
+        own_file = os.path.basename(self.path())
+        with self.locked(fcntl.LOCK_SH):
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json") or name == own_file:
+                    continue
+                snapshot = read_json(os.path.join(self.directory, name))
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return merge_snapshots(snapshots)
+
+    def start_flusher(self, interval):
+        """后台线程定期写入文件"""
+
+        def flush():
+            while True:
+                time.sleep(interval)
+                self.write()
+
+        thread = threading.Thread(
+            target=flush, name="metrics-flusher", daemon=True
+        )
+        thread.start()
+        return thread
+
+
+def make_snapshot(histograms, counters):
+    return {
+        "histograms": [[list(labels), list(counts), total]
+                       for labels, (counts, total) in histograms.items()],
+        "counters": [[list(labels), value] for labels, value in counters.items()
+                    ],
+    }
+
+
+def write_json(path, data):
+    """先写临时文件再替换, 读取时不会读到写了一半的文件"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def read_json(path):
+    """读取失败时返回 None"""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def merge_snapshots(snapshots):
+    """合并多个进程的数据, 返回 (histograms, counters)"""
+    histograms, counters = {}, {}
+    for snapshot in snapshots:
+        for labels, counts, total in snapshot["histograms"]:
+            labels = tuple(tuple(label) for label in labels)
+            merged = histograms.get(labels)
+            if merged is None:
+                histograms[labels] = [list(counts), total]
+                continue
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+        for labels, value in snapshot["counters"]:
+            labels = tuple(tuple(label) for label in labels)
+            counters[labels] = counters.get(labels, 0) + value
+    return histograms, counters
+
+
+def escape(value):
+    return (
+        str(value).replace("\\", r"\\").replace("\n",
+                                                r"\n").replace('"', r"\"")
+    )
+
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{escape(value)}"' for name, value in pairs
+    ) + "}"
+
+
+def format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render(
+    histogram_name,
+    histograms,
+    counter_name,
+    counters,
+    buckets=DEFAULT_BUCKETS,
+    histogram_help="",
+    counter_help="",
+):
+    """Prometheus 文本格式"""
+    lines = [
+        f"# HELP {histogram_name} {histogram_help}",
+        f"# TYPE {histogram_name} histogram",
+    ]
+    bounds = [format_number(float(bucket)) for bucket in buckets] + ["+Inf"]
+    for labels, (counts, total) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            lines.append(
+                f"{histogram_name}_bucket"
+                f"{format_labels(labels, [('le', bound)])} {cumulative}"
+            )
+        lines.append(
+            f"{histogram_name}_sum{format_labels(labels)} "
+            f"{format_number(float(total))}"
+        )
+        lines.append(
+            f"{histogram_name}_count{format_labels(labels)} {cumulative}"
+        )
+
+    return "\n".join(lines) + "\n" + render_counter(
+        counter_name, counters, counter_help
+    )
+
+
+def render_counter(name, counters, help_text=""):
+    """一个 counter 的 Prometheus 文本格式"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for labels, value in sorted(counters.items()):
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
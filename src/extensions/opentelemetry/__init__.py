@@ -5,11 +5,14 @@ from opentelemetry import trace
 from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider, sampling
-from opentelemetry.sdk.trace.export import (
-    BatchSpanProcessor,
-    ConsoleSpanExporter,
-    SimpleSpanProcessor,
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+from extensions.client_registry import (
+    SHUTDOWN_ORDER_TRACING,
+    LazyClient,
+    client_registry,
 )
+from extensions.opentelemetry.tail_sampling import TailSamplingSpanProcessor
 
 tracer = None
 
@@ -26,29 +29,61 @@ def get_config(config_name: str = None):
     return getattr(configs_module, config_name.capitalize())
 
 
+def build_span_processor():
+    """发送 span 到 jaeger 的 processor
+    BatchSpanProcessor 创建时会启动后台线程, fork 之后不可用, 所以在 worker 中创建
+    """
+    config = get_config()
+    jaeger_exporter = JaegerExporter(agent_host_name=config.JAEGER_AGENT_HOST)
+    span_processor = BatchSpanProcessor(jaeger_exporter)
+    if config.TRACE_SAMPLING_MODE == "tail":
+        span_processor = TailSamplingSpanProcessor(
+            span_processor,
+            latency_threshold=config.TRACE_TAIL_LATENCY_THRESHOLD,
+            endpoint_thresholds=config.TRACE_TAIL_ENDPOINT_THRESHOLDS,
+            baseline_rate=config.TRACE_TAIL_BASELINE_RATE,
+            max_traces=config.TRACE_TAIL_MAX_TRACES,
+        )
+    return span_processor
+
+
+# 每个进程在第一次记录 span 时创建自己的 processor
+span_processor = LazyClient("opentelemetry", build_span_processor)
+
+
 class TracingMiddleware:
 
     @staticmethod
     def init_tracer():
-        """如果设置了 debug，则会将 tracing 信息打印出来"""
+        """创建 TracerProvider, gunicorn preload_app 时在 master 进程中调用,
+        发送 span 的 processor 在 worker 中第一次使用时创建
+        """
         config = get_config()
-        sampler = sampling.TraceIdRatioBased(config.SAMPLER_RATE)
+        if config.TRACE_SAMPLING_MODE == "tail":
+            # 所有请求都记录 span, 由 TailSamplingSpanProcessor 决定是否发送
+            sampler = sampling.ALWAYS_ON
+        else:
+            sampler = sampling.TraceIdRatioBased(config.SAMPLER_RATE)
         resource = Resource.create({"service.name": config.SERVICE_NAME})
-        trace.set_tracer_provider(
-            TracerProvider(resource=resource, sampler=sampler)
-        )
-
-        if os.environ.get("STAGE") == "testing":
-            trace.get_tracer_provider().add_span_processor(
-                SimpleSpanProcessor(ConsoleSpanExporter())
-            )
-
-        jaeger_exporter = JaegerExporter(
-            agent_host_name=config.JAEGER_AGENT_HOST
-        )
-        trace.get_tracer_provider().add_span_processor(
-            BatchSpanProcessor(jaeger_exporter)
+        # 退出时由 flush_spans 发送缓存的 span, 避免在 master 进程中创建 processor
+        tracer_provider = TracerProvider(
+            resource=resource, sampler=sampler, shutdown_on_exit=False
         )
+        tracer_provider.add_span_processor(span_processor)
+        trace.set_tracer_provider(tracer_provider)
 
         global tracer
         tracer = trace.get_tracer(__name__)
+
+
+def flush_spans(timeout):
+    """worker 退出时发送 BatchSpanProcessor 中缓存的 span
+    当前进程没有记录过 span 时不需要发送
+    """
+    if span_processor.is_initialized:
+        span_processor.force_flush(timeout_millis=int(timeout * 1000))
+
+
+client_registry.register_shutdown_handler(
+    "opentelemetry", flush_spans, order=SHUTDOWN_ORDER_TRACING
+)
@@ -0,0 +1,80 @@
+"""
+redis / kafka / centrifugo / cassandra 客户端调用的子 span
+
+只有当前 span 正在记录时才创建子 span, 请求没有被采样时不创建 span,
+也不会计算 attributes, 所以 attributes 以函数的形式传入
+
+eg:
+    with child_span("redis GET", lambda: {"db.redis.key": key}):
+        ...
+"""
+from contextlib import contextmanager
+
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+_tracer = None
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        _tracer = trace.get_tracer(__name__)
+    return _tracer
+
+
+def is_recording():
+    return trace.get_current_span().is_recording()
+
+
+def start_child_span(name, attributes=None, kind=SpanKind.CLIENT):
+    """创建子 span, 当前 span 没有在记录时返回 None
+    attributes: 返回 span attributes 的函数
+    """
+    if not is_recording():
+        return None
+    span = get_tracer().start_span(name, kind=kind)
+    if attributes is not None:
+        span.set_attributes(attributes())
+    return span
+
+
+def end_span(span, error=None):
+    if error is not None:
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+    span.end()
+
+
+@contextmanager
+def child_span(name, attributes=None, kind=SpanKind.CLIENT):
+    """在 with 中执行的调用记录为子 span, 返回 span 或者 None"""
+    span = start_child_span(name, attributes, kind)
+    if span is None:
+        yield None
+        return
+
+    # 出现异常时记录异常, 设置 ERROR 状态
+    with trace.use_span(span, end_on_exit=True):
+        yield span
+
+
+def mark_failed(error_type):
+    """当前 span 标记为失败
+    API 的错误返回 HTTP 200, flask 的请求 span 不会被标记为失败,
+    标记后 tail 采样会发送这个 trace
+    """
+    span = trace.get_current_span()
+    if not span.is_recording():
+        return
+    span.set_attribute("api.error_type", error_type)
+    span.set_status(Status(StatusCode.ERROR, error_type))
+
+
+def byte_size(value):
+    """str / bytes 的长度, 其他类型返回 0"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode())
+    return 0
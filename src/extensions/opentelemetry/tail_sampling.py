@@ -0,0 +1,135 @@
+"""
+tail-based 采样: 每个请求都记录 span, 请求结束后再决定是否发送
+
+TraceIdRatioBased 在请求开始时决定是否采样, 采样率低时会丢掉慢请求和失败的请求,
+采样率高时发送 span 的开销和总请求量成正比
+这里所有的 span 先缓存在内存中, 本地的根 span (一般是 flask 的请求 span) 结束时:
+    1. 耗时超过 endpoint 的阈值
+    2. 有 span 的状态为 ERROR 或者记录了异常
+    3. 命中 baseline_rate 的随机采样
+满足任意一个条件, 把整个 trace 的 span 交给下游的 processor (BatchSpanProcessor)
+发送, 否则丢弃
+
+eg:
+    processor = TailSamplingSpanProcessor(
+        BatchSpanProcessor(exporter),
+        latency_threshold=0.5,
+        endpoint_thresholds={"/paging": 1},
+        baseline_rate=0.01,
+    )
+"""
+import random
+import threading
+from collections import OrderedDict
+
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.semconv.trace import SpanAttributes
+from opentelemetry.trace import StatusCode
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+
+    def __init__(
+        self,
+        span_processor: SpanProcessor,
+        latency_threshold=0.5,
+        endpoint_thresholds=None,
+        baseline_rate=0.01,
+        max_traces=10000,
+        max_spans_per_trace=1000,
+    ):
+        """
+        span_processor: 发送采样的 span 的 processor
+        latency_threshold: 默认的慢请求阈值, 单位: 秒
+        endpoint_thresholds: 各个 endpoint 的阈值, key 为 flask 的 url rule
+        baseline_rate: 正常请求的采样率
+        max_traces: 最多缓存的 trace 数量, 超过时丢弃最早的 trace
+        max_spans_per_trace: 每个 trace 最多缓存的 span 数量
+        """
+        self.span_processor = span_processor
+        self.latency_threshold = latency_threshold
+        self.endpoint_thresholds = endpoint_thresholds or {}
+        self.baseline_rate = baseline_rate
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+
+        self._lock = threading.Lock()
+        # trace_id -> 已结束的 span
+        self._traces = OrderedDict()
+        # 根 span 结束之后才结束的 span (例如后台线程中的 span) 使用已有的决定
+        # trace_id -> 是否发送
+        self._decisions = OrderedDict()
+        self.stats = {"exported": 0, "dropped": 0, "evicted": 0}
+
+    def on_start(self, span, parent_context=None):
+        self.span_processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is None:
+                spans = self._buffer(trace_id, span)
+                if not is_local_root(span):
+                    return
+                del self._traces[trace_id]
+                decision = self.should_export(span, spans)
+                self._decide(trace_id, decision)
+            else:
+                spans = [span]
+            self.stats["exported" if decision else "dropped"] += len(spans)
+
+        if decision:
+            for buffered_span in spans:
+                self.span_processor.on_end(buffered_span)
+
+    def _buffer(self, trace_id, span):
+        spans = self._traces.get(trace_id)
+        if spans is None:
+            spans = self._traces[trace_id] = []
+            if len(self._traces) > self.max_traces:
+                _, evicted = self._traces.popitem(last=False)
+                self.stats["evicted"] += len(evicted)
+        if len(spans) < self.max_spans_per_trace:
+            spans.append(span)
+        else:
+            self.stats["evicted"] += 1
+        return spans
+
+    def _decide(self, trace_id, decision):
+        self._decisions[trace_id] = decision
+        if len(self._decisions) > self.max_traces:
+            self._decisions.popitem(last=False)
+
+    def threshold(self, root_span):
+        route = (root_span.attributes or {}).get(SpanAttributes.HTTP_ROUTE)
+        return self.endpoint_thresholds.get(
+            route or root_span.name, self.latency_threshold
+        )
+
+    def should_export(self, root_span, spans):
+        """根 span 结束时决定是否发送整个 trace"""
+        duration = (root_span.end_time - root_span.start_time) / 1e9
+        if duration >= self.threshold(root_span):
+            return True
+        if any(is_failed(span) for span in spans):
+            return True
+        return random.random() < self.baseline_rate
+
+    def shutdown(self):
+        self.span_processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        # 缓存中的 trace 还没有结束, 不需要发送
+        return self.span_processor.force_flush(timeout_millis)
+
+
+def is_local_root(span):
+    """当前进程中的根 span, 它的 parent 不存在或者来自上游服务"""
+    return span.parent is None or span.parent.is_remote
+
+
+def is_failed(span):
+    if span.status.status_code is StatusCode.ERROR:
+        return True
+    return any(event.name == "exception" for event in span.events)
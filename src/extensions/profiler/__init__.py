@@ -0,0 +1,95 @@
+"""
+在运行中的 worker 中采样调用栈, 按 endpoint 汇总
+
+每个线程正在处理的 endpoint 记录在 active_endpoints 中, 只在采样期间记录,
+没有采样时每个请求只多一次判断
+同一个 worker 同时只运行一个采样
+
+需要把 track_request / untrack_request 注册到 app, 见 apps/profiler
+
+start_profile 在后台线程中采样, 不占用处理请求的线程, 同步 worker 在采样期间可以
+继续处理请求, 这些请求的调用栈才会被采样到
+
+eg:
+    sampler = run_profile(seconds=10)
+    sampler.collapsed()
+
+    start_profile(seconds=10, callback=lambda sampler: save(sampler.collapsed()))
+"""
+import logging
+import threading
+
+from flask import request
+
+from extensions.profiler.sampler import Sampler
+
+logger = logging.getLogger(__name__)
+
+# thread id -> 正在处理的 endpoint
+active_endpoints = {}
+_profiling = threading.Event()
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """当前 worker 正在采样"""
+
+
+def track_request():
+    if _profiling.is_set():
+        active_endpoints[threading.get_ident()] = request.endpoint or "unknown"
+
+
+def untrack_request(error=None):
+    if active_endpoints:
+        active_endpoints.pop(threading.get_ident(), None)
+
+
+def _begin(interval):
+    """开始记录 endpoint, 正在采样时抛出 ProfilerBusy"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy
+    _profiling.set()
+    return Sampler(interval=interval, labels=active_endpoints.copy)
+
+
+def _end():
+    _profiling.clear()
+    active_endpoints.clear()
+    _profile_lock.release()
+
+
+def run_profile(seconds, interval=0.01):
+    """在当前线程中采样 seconds 秒, 返回 Sampler, 正在采样时抛出 ProfilerBusy"""
+    sampler = _begin(interval)
+    try:
+        sampler.profile(seconds)
+        return sampler
+    finally:
+        _end()
+
+
+def start_profile(seconds, interval=0.01, callback=None):
+    """在后台线程中采样 seconds 秒, 立即返回 Sampler, 正在采样时抛出 ProfilerBusy
+    采样结束后在后台线程中调用 callback(sampler)
+    """
+    sampler = _begin(interval)
+
+    def run():
+        try:
+            sampler.profile(seconds)
+        finally:
+            _end()
+        if callback is None:
+            return
+        try:
+            callback(sampler)
+        except Exception:
+            logger.exception("Profiler callback failed")
+
+    try:
+        threading.Thread(target=run, name="profiler", daemon=True).start()
+    except BaseException:
+        _end()
+        raise
+    return sampler
@@ -4,6 +4,9 @@ import uuid
 
 from rediscluster import RedisCluster
 
+from extensions.client_registry import LazyClient, client_registry
+from extensions.opentelemetry.spans import byte_size, child_span
+
 
 def get_config(config_name: str = None):
     """
@@ -20,9 +23,32 @@ def get_config(config_name: str = None):
 config = get_config()
 
 
+class TracedRedisCluster(RedisCluster):
+    """每个 redis 命令记录为子 span, 包括 lock 等内部发送的命令"""
+
+    def execute_command(self, *args, **kwargs):
+        command = str(args[0]) if args else ""
+
+        def attributes():
+            attributes = {
+                "db.system": "redis",
+                "db.operation": command,
+                "db.redis.request_bytes": sum(byte_size(arg) for arg in args),
+            }
+            if len(args) > 1:
+                attributes["db.redis.key"] = str(args[1])
+            return attributes
+
+        with child_span(f"redis {command}", attributes) as span:
+            result = super().execute_command(*args, **kwargs)
+            if span is not None:
+                span.set_attribute("db.redis.response_bytes", byte_size(result))
+            return result
+
+
 def initialize_redis_client():
     RedisCluster.RedisClusterRequestTTL = config.REDIS_CLUSTER_REQUEST_TTL
-    client = RedisCluster(
+    client = TracedRedisCluster(
         startup_nodes=config.REDIS_STARTUP_NODES, read_from_replicas=True
     )
     return client
@@ -44,6 +70,10 @@ class DuplicateRequest(Exception):
         self.error_message = "Duplicate request"
 
 
+def request_key(name: str, request_id) -> str:
+    return f"request:{name}:{request_id}"
+
+
 def assert_new_request(
     name: str, request_id: uuid.UUID, life_time_second: int = 60
 ):
@@ -54,13 +84,22 @@ def assert_new_request(
     """
     assert isinstance(request_id, uuid.UUID)
 
-    request_key = f"request:{name}:{request_id}"
-
-    if redis_client.exists(request_key):
+    # SET NX: 检查和设置在一次请求中完成, 并发的重复请求只有一个能成功
+    # 如果请求不存在，60秒内就不再接受相同的请求了
+    is_new = redis_client.set(
+        request_key(name, request_id), value="", ex=life_time_second, nx=True
+    )
+    if not is_new:
         raise DuplicateRequest
-    else:
-        # 如果请求不存在，60秒内就不再接受相同的请求了
-        redis_client.set(request_key, value="", ex=life_time_second)
 
 
-redis_client = initialize_redis_client()
+redis_client = LazyClient("redis", initialize_redis_client)
+
+
+def close_redis_client(timeout):
+    """worker 退出时关闭连接池"""
+    if redis_client.is_initialized:
+        redis_client.connection_pool.disconnect()
+
+
+client_registry.register_shutdown_handler("redis", close_redis_client)
@@ -0,0 +1,78 @@
+"""
+写请求的幂等处理
+
+每个请求只需要执行一次 Lua 脚本: 请求 id 不存在时占用, 存在时返回保存的响应
+第一个请求完成后保存响应, 重试的请求直接返回保存的响应
+
+eg:
+    class CreateOrderView(PostView):
+
+        @idempotent("create-order")
+        def save(self):
+            ...
+"""
+from functools import wraps
+
+from extensions.flask_api.api import json_response
+from extensions.redis_cluster import (
+    DuplicateRequest,
+    redis_client,
+    request_key,
+)
+
+# 请求 id 不存在时设置为空字符串 (处理中), 存在时返回保存的值
+ACQUIRE_SCRIPT = """
+local stored = redis.call('GET', KEYS[1])
+if stored then
+    return stored
+end
+redis.call('SET', KEYS[1], '', 'EX', ARGV[1])
+return false
+"""
+
+
+def acquire_request(key, life_time_second):
+    """占用请求 id
+    返回 None: 新的请求
+    返回 b"": 相同的请求正在处理中
+    返回其他值: 已经完成的请求保存的响应
+    """
+    return redis_client.eval(ACQUIRE_SCRIPT, 1, key, life_time_second)
+
+
+def idempotent(
+    name, request_id_field="request_id", life_time_second=60, replay=True
+):
+    """PostView.save 的装饰器, 相同 request id 的请求只执行一次
+    request_id_field: validated_data 中请求 id 的字段
+    replay: 重复的请求返回第一次请求的响应, 为 False 时抛出 DuplicateRequest
+    """
+
+    def wrapper(save):
+
+        @wraps(save)
+        def decorator(self, *args, **kwargs):
+            key = request_key(name, self.validated_data[request_id_field])
+            stored_response = acquire_request(key, life_time_second)
+            if stored_response is not None:
+                if replay and stored_response:
+                    return json_response(stored_response)
+                raise DuplicateRequest
+
+            try:
+                saved_object = save(self, *args, **kwargs)
+            except Exception:
+                # 执行失败的请求可以重试
+                redis_client.delete(key)
+                raise
+
+            if not replay:
+                return saved_object
+
+            response = self.response(saved_object)
+            redis_client.set(key, response.get_data(), ex=life_time_second)
+            return response
+
+        return decorator
+
+    return wrapper
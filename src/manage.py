@@ -35,12 +35,20 @@ def sync_db():
 
 
 @cli.command("migrate")
-def migrate():
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="只采样执行 transform, 估算迁移的时间和写入量, 不写入数据",
+)
+@click.option(
+    "--sample", default=1, show_default=True, help="dry run 采样的 token 范围数量"
+)
+def migrate(dry_run, sample):
     from extensions.cassandra_migration.utils import migrate
     from extensions.cassandra_orm.utils import connect_to_db
 
     connect_to_db(app)
-    migrate()
+    migrate(dry_run=dry_run, sample=sample)
 
 
 @cli.command("test")
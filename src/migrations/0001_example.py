@@ -2,15 +2,26 @@ from typing import Type
 
 from cassandra.cqlengine.models import Model
 
+from extensions.cassandra_migration.token_range import TokenRangeMigration
 
-def migrate():
-    """迁移脚本示范"""
+
+def init_new_property(row):
+    """已经有值的数据不再写入, 重复执行 migration 不会覆盖数据"""
+    if row["new_property"] is not None:
+        return None
+    return {"new_property": "init value"}
+
+
+def get_migration():
+    """迁移脚本示范, migrate --dry-run 使用这个函数采样估算"""
     MyModel: Type[Model] = None
-    # FIXME 注意这个默认只取 1w 条数据
-    if 10000 < MyModel.objects.count():
-        raise Exception("数据量超过 1w，无法 migrate")
-
-    objects = MyModel.objects.all()
-    for _object in objects:
-        _object.new_property = "init value"
-        _object.save()
+    return TokenRangeMigration(
+        MyModel,
+        init_new_property,
+        name=__name__,
+        fields=["new_property"],
+    )
+
+
+def migrate():
+    return get_migration().run()
@@ -4,6 +4,7 @@ import uuid
 
 from flask.testing import FlaskClient
 
+from extensions.centrifugo import centrifugo_publisher
 from extensions.redis_cluster import redis_client
 from unittests.centrifugo_client import CentrifugoClient
 from unittests.docs import api_docs
@@ -42,6 +43,70 @@ class TestExample:
             "正确响应": response1.json,
         }
 
+    def test_cursor_paging(self, client: FlaskClient):
+        first_names = {f"Paging{index}" for index in range(5)}
+        for first_name in first_names:
+            client.post(
+                "/v1/example/",
+                headers=kong_user_header(uuid.uuid4()),
+                json={
+                    "first_name": first_name,
+                    "last_name": "Name",
+                },
+            )
+
+        names, cursor = [], None
+        while True:
+            params = {"size": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get(
+                "/v1/example/paging",
+                query_string=params,
+                headers=kong_user_header(uuid.uuid4()),
+            )
+            result = response.json["result"]
+            assert len(result["items"]) <= 2
+            names.extend(item["first_name"] for item in result["items"])
+            cursor = result["next_cursor"]
+            if cursor is None:
+                break
+
+        assert first_names <= set(names)
+        assert len(names) == len(set(names))
+
+        # 修改过的 cursor 无法使用
+        response = client.get(
+            "/v1/example/paging",
+            query_string={"cursor": "invalid"},
+            headers=kong_user_header(uuid.uuid4()),
+        )
+        assert response.json["error_type"] == "invalid_cursor"
+
+    def test_bulk_post(self, client: FlaskClient):
+        items = [{
+            "first_name": f"Bulk{index}",
+            "last_name": "Name"
+        } for index in range(3)]
+        items.insert(1, {"first_name": "Bulk"})
+
+        response = client.post(
+            "/v1/example/bulk",
+            headers=kong_user_header(uuid.uuid4()),
+            json={"items": items},
+        )
+        results = response.json["result"]["items"]
+        assert [result["ok"] for result in results] == [True, False, True, True]
+        assert results[0]["result"] == items[0]
+        assert results[1]["error_type"] == "data_validation_errors"
+        errors = results[1]["errors"]
+        assert [error["field"] for error in errors] == ["last_name"]
+
+        response = client.get(
+            "/v1/example/Bulk2", headers=kong_user_header(uuid.uuid4())
+        )
+        assert response.json["result"] == items[3]
+
     def test_get_single(self, client: FlaskClient):
         # 先创建一个对象
         client.post(
@@ -174,6 +239,28 @@ class TestExample:
         assert error_json_result["ok"] is False
         assert error_json_result["error_type"] == "object_not_found"
 
+    def test_class_view_cache(self, client: FlaskClient):
+        """修改数据后, GetView 的缓存会被清除"""
+        for last_name in ("Name1", "Name2"):
+            response = client.post(
+                "/v1/example/class",
+                headers=kong_user_header(uuid.uuid4()),
+                json={
+                    "first_name": "Cached",
+                    "last_name": last_name,
+                },
+            )
+            assert response.json["ok"] is True
+
+            response = client.get(
+                "/v1/example/class/Cached",
+                headers=kong_user_header(uuid.uuid4())
+            )
+            assert response.json["result"] == {
+                "first_name": "Cached",
+                "last_name": last_name,
+            }
+
     def test_centrifugo(self, client: FlaskClient):
         user_id = uuid.uuid4()
 
@@ -190,6 +277,10 @@ class TestExample:
                     },
                 )
                 assert response.json["ok"] is True
+                # 消息在后台线程中发送
+                await asyncio.get_running_loop().run_in_executor(
+                    None, centrifugo_publisher.flush, 3
+                )
             return ws.messages
 
         messages = asyncio.run(get_messages())
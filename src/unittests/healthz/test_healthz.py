@@ -13,3 +13,19 @@ def test_readiness(client: FlaskClient):
     response = client.get("/readiness")
     assert response.status_code == 200
     assert response.json["result"] == "ok"
+
+
+def test_metrics(client: FlaskClient):
+    """Prometheus 抓取 API 的耗时和错误统计"""
+    client.get("/healthz")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert response.mimetype_params["version"] == "0.0.4"
+
+    text = response.get_data(as_text=True)
+    assert "# TYPE api_phase_seconds histogram" in text
+    assert (
+        'api_phase_seconds_count{endpoint="healthz.healthz",method="GET",'
+        'phase="total"}'
+    ) in text
@@ -0,0 +1,234 @@
+import json
+import threading
+import time
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+from flask_babel import Babel
+
+from apps.profiler import views
+from extensions import profiler
+from extensions.profiler import (
+    ProfilerBusy,
+    run_profile,
+    start_profile,
+    track_request,
+    untrack_request,
+)
+from extensions.profiler.sampler import Sampler
+from extensions.redis_cluster import redis_client
+
+
+def busy_loop(stopped):
+    while not stopped.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def busy_thread():
+    stopped = threading.Event()
+    thread = threading.Thread(
+        target=busy_loop, args=(stopped,), name="busy", daemon=True
+    )
+    thread.start()
+    yield thread
+    stopped.set()
+    thread.join()
+
+
+def test_sample_stacks(busy_thread):
+    sampler = Sampler(
+        interval=0.005, labels=lambda: {busy_thread.ident: "example.busy"}
+    )
+    sampler.profile(0.1)
+
+    assert sampler.samples > 5
+    stacks = [stack for stack in sampler.stacks if stack[0] == "example.busy"]
+    assert stacks
+    assert any(f"{__name__}:busy_loop" in stack for stack in stacks)
+    # 调用 profile 的线程和采样线程不会被采样
+    assert not any("profiler-sampler" in stack[0] for stack in sampler.stacks)
+    assert not any(
+        f"{__name__}:test_sample_stacks" in stack for stack in sampler.stacks
+    )
+
+    line = sampler.collapsed().splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert stack.split(";")[0] and int(count) > 0
+    assert sampler.summary()["labels"]["example.busy"] > 0
+
+
+def test_one_profile_per_worker():
+    thread = threading.Thread(target=run_profile, args=(0.2,))
+    thread.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(ProfilerBusy):
+            run_profile(0.01)
+    finally:
+        thread.join()
+    assert not profiler.active_endpoints
+
+
+def test_profile_concurrent_request():
+    flask_app = Flask(__name__)
+    flask_app.before_request(track_request)
+    flask_app.teardown_request(untrack_request)
+
+    @flask_app.route("/busy")
+    def busy():
+        stopped = threading.Event()
+        threading.Timer(0.2, stopped.set).start()
+        busy_loop(stopped)
+        return "ok"
+
+    finished = threading.Event()
+    samplers = []
+
+    def callback(sampler):
+        samplers.append(sampler)
+        finished.set()
+
+    # 采样在后台进行, 和同步 worker 一样由当前线程继续处理请求
+    started_at = time.monotonic()
+    start_profile(0.4, interval=0.005, callback=callback)
+    assert time.monotonic() - started_at < 0.1
+    with pytest.raises(ProfilerBusy):
+        start_profile(0.1)
+
+    assert flask_app.test_client().get("/busy").data == b"ok"
+    assert finished.wait(2)
+
+    summary = samplers[0].summary()
+    assert summary["labels"]["busy"] > 10
+    assert any(
+        stack[0] == "busy" and f"{__name__}:busy_loop" in stack
+        for stack in samplers[0].stacks
+    )
+    assert not profiler.active_endpoints
+
+
+class FakeRedis:
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture
+def profiler_app(monkeypatch):
+    """不连接 redis 的 profiler api"""
+    monkeypatch.setattr(views.config, "PROFILER_ENABLED", True)
+    monkeypatch.setattr(views.config, "PROFILER_TOKEN", "secret")
+    monkeypatch.setattr(views, "redis_client", FakeRedis())
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    # PermissionDenied 的错误信息需要翻译
+    Babel(flask_app)
+    flask_app.register_blueprint(views.blueprint)
+    return flask_app.test_client()
+
+
+HEADERS = {"Authorization": "Bearer secret"}
+
+
+def test_token_required(profiler_app, monkeypatch):
+    response = profiler_app.get("/profiler/unknown", headers=HEADERS)
+    assert response.json["error_type"] == "profile_not_found"
+
+    monkeypatch.setattr(views.config, "PROFILER_ENABLED", False)
+    response = profiler_app.get("/profiler/unknown", headers=HEADERS)
+    assert response.json["error_type"] == "permission_denied"
+
+    # token 为空时, 不能用空的 Bearer 访问
+    monkeypatch.setattr(views.config, "PROFILER_ENABLED", True)
+    monkeypatch.setattr(views.config, "PROFILER_TOKEN", "")
+    response = profiler_app.get(
+        "/profiler/unknown", headers={"Authorization": "Bearer "}
+    )
+    assert response.json["error_type"] == "permission_denied"
+
+
+def test_profiler_busy(profiler_app, monkeypatch):
+
+    def busy(*args, **kwargs):
+        raise ProfilerBusy
+
+    monkeypatch.setattr(views, "start_profile", busy)
+    response = profiler_app.get(
+        "/profiler", query_string={"seconds": 0.1}, headers=HEADERS
+    )
+    assert response.json["error_type"] == "profiler_busy"
+    # 删除 running 的记录, 只剩下限流的 key
+    assert list(views.redis_client.data
+               ) == [f"profiler:{views.config.SERVICE_NAME}"]
+
+
+def test_collapsed_result(profiler_app):
+    views.redis_client.set(
+        views.result_key("abc"),
+        json.dumps({
+            "status": "finished",
+            "pid": 42,
+            "summary": {},
+            "collapsed": "busy;main 3\n",
+        }),
+    )
+    response = profiler_app.get("/profiler/abc", headers=HEADERS)
+    assert response.mimetype == "text/plain"
+    assert response.headers["X-Profiler-Pid"] == "42"
+    assert response.get_data(as_text=True) == "busy;main 3\n"
+
+
+def test_profiler(client: FlaskClient):
+    """在后台采样当前 worker 的调用栈, 再读取采样结果"""
+    service_name = client.application.config["SERVICE_NAME"]
+    redis_client.delete(f"profiler:{service_name}")
+
+    response = client.get("/profiler", query_string={"seconds": 0.1})
+    assert response.json["error_type"] == "permission_denied"
+
+    headers = {"Authorization": "Bearer testing"}
+    response = client.get(
+        "/profiler", query_string={"seconds": 0.1}, headers=headers
+    )
+    assert response.json["ok"]
+    profile_id = response.json["result"]["profile_id"]
+
+    response = client.get(
+        f"/profiler/{profile_id}",
+        query_string={"format": "json"},
+        headers=headers,
+    )
+    assert response.json["error_type"] == "profile_running"
+
+    time.sleep(0.3)
+    response = client.get(
+        f"/profiler/{profile_id}",
+        query_string={"format": "json"},
+        headers=headers,
+    )
+    assert response.json["ok"]
+    assert response.json["result"]["samples"] > 0
+
+    response = client.get("/profiler/unknown", headers=headers)
+    assert response.json["error_type"] == "profile_not_found"
+
+    # 限流时间内不能再次采样
+    response = client.get(
+        "/profiler", query_string={"seconds": 0.1}, headers=headers
+    )
+    assert response.json["error_type"] == "profiler_rate_limited"
@@ -0,0 +1,147 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Blueprint, Flask
+from marshmallow import Schema, fields
+
+from extensions.flask_api import views
+from extensions.flask_api.api import class_route
+from extensions.flask_api.views import AdminListView
+
+
+class ItemSerializer(Schema):
+    id = fields.Int()
+    score = fields.Int()
+
+
+def iter_items(count):
+    """模拟 iter_rows 返回的迭代器"""
+    for index in range(count):
+        yield SimpleNamespace(id=index, score=(index * 7) % 10)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    blueprint = Blueprint("admin_list", __name__)
+
+    @class_route(blueprint, "/top_k")
+    class TopKView(AdminListView):
+        paging_mode = "top_k"
+        get_serializer_class = ItemSerializer
+        max_page_size = 5
+
+        def get_all_objects(self):
+            return iter_items(20)
+
+        def match(self, result):
+            return result.id != 0
+
+        def search(self, results):
+            raise AssertionError("top_k mode should not call search")
+
+    @class_route(blueprint, "/memory")
+    class MemoryView(AdminListView):
+        get_serializer_class = ItemSerializer
+        max_page_size = 5
+        max_end = 10
+
+        def get_all_objects(self):
+            return iter_items(20)
+
+        def search(self, results):
+            return list(results)
+
+    @class_route(blueprint, "/driver")
+    class DriverView(AdminListView):
+        paging_mode = "driver"
+        get_serializer_class = ItemSerializer
+
+        def get_paging_query(self):
+            return "SELECT * FROM item", None
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.cql = object()
+    flask_app.register_blueprint(blueprint)
+    return flask_app.test_client()
+
+
+def test_top_k(client):
+    response = client.get(
+        "/top_k",
+        query_string={
+            "start": 1,
+            "end": 3,
+            "order": "asc",
+            "sort": "score"
+        },
+    )
+    result = response.json["result"]
+    expected = sorted((item for item in iter_items(20) if item.id != 0),
+                      key=lambda item: item.score)[1:3]
+    assert result["items"] == [{
+        "id": item.id,
+        "score": item.score
+    } for item in expected]
+    assert result["total"] == 19
+
+
+def test_top_k_page_size_limit(client):
+    response = client.get(
+        "/top_k", query_string={
+            "start": 2,
+            "end": 1000,
+            "sort": "id"
+        }
+    )
+    result = response.json["result"]
+    # 最多返回 max_page_size 条数据
+    assert [item["id"] for item in result["items"]] == [17, 16, 15, 14, 13]
+
+    response = client.get("/top_k", query_string={"end": "x"})
+    assert response.json["error_type"] == "invalid_end"
+
+
+def test_memory_mode_unbounded(client):
+    # memory 模式不受 max_page_size / max_end 的限制
+    response = client.get(
+        "/memory",
+        query_string={
+            "start": 8,
+            "end": 20,
+            "sort": "id",
+            "order": "asc"
+        }
+    )
+    result = response.json["result"]
+    assert [item["id"] for item in result["items"]] == list(range(8, 20))
+    assert result["total"] == 20
+
+
+def test_driver_paging_state(client, monkeypatch):
+    calls = []
+
+    def fetch_page(session, query, parameters, size, paging_state):
+        calls.append((size, paging_state))
+        items = list(iter_items(size))
+        return items, None if paging_state else b"\x00\xff"
+
+    monkeypatch.setattr(views, "fetch_page", fetch_page)
+
+    result = client.get("/driver", query_string={"size": 3}).json["result"]
+    assert len(result["items"]) == 3
+    assert result["total"] is None
+
+    response = client.get(
+        "/driver",
+        query_string={
+            "size": 1000,
+            "paging_state": result["paging_state"]
+        },
+    )
+    # 客户端传回的 paging_state 解码后和驱动返回的一致, size 不超过 max_page_size
+    assert calls == [(3, None), (100, b"\x00\xff")]
+    assert response.json["result"]["paging_state"] is None
+
+    response = client.get("/driver", query_string={"paging_state": "!"})
+    assert response.json["error_type"] == "invalid_paging_state"
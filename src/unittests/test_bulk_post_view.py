@@ -0,0 +1,52 @@
+from flask import Blueprint, Flask
+from marshmallow import Schema, fields
+
+from extensions.flask_api.api import class_route
+from extensions.flask_api.views import BulkPostView
+
+
+class ItemValidator(Schema):
+    name = fields.Str(required=True)
+    count = fields.Int()
+
+
+def test_bulk_post_results():
+    blueprint = Blueprint("bulk", __name__)
+    saved = []
+
+    @class_route(blueprint, "/items", methods=["POST"])
+    class ItemsView(BulkPostView):
+        item_deserializer_class = ItemValidator
+        bulk_serializer_class = ItemValidator
+
+        def save_items(self, items):
+            saved.extend(items)
+            return [
+                RuntimeError("write timeout") if item["name"] == "b" else None
+                for item in items
+            ]
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.register_blueprint(blueprint)
+
+    items = [{"name": "a", "count": 1}, {"count": "x"}, {"name": "b"}]
+    response = flask_app.test_client().post("/items", json={"items": items})
+    results = response.json["result"]["items"]
+
+    # 验证失败的 item 不会保存
+    assert saved == [items[0], items[2]]
+    assert results[0] == {"ok": True, "result": items[0]}
+
+    # 验证失败和保存失败的格式一致
+    for result in results[1:]:
+        assert result["ok"] is False
+        assert result["error_type"] and result["error_message"]
+    assert results[1]["error_type"] == "data_validation_errors"
+    fields_with_error = {error["field"] for error in results[1]["errors"]}
+    assert fields_with_error == {"count", "name"}
+    assert results[2] == {
+        "ok": False,
+        "error_type": "save_failed",
+        "error_message": "write timeout",
+    }
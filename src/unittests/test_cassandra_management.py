@@ -0,0 +1,128 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
+
+from extensions.cassandra_orm.management import (
+    EXEC_PROFILE_CQL,
+    DatabaseManagement,
+    PreparedStatementCache,
+    build_cluster,
+)
+
+CONFIG = {
+    "CASSANDRA_NODES": ["127.0.0.1"],
+    "CASSANDRA_USER": "cassandra",
+    "CASSANDRA_PASSWORD": "cassandra",
+    "CASSANDRA_LOCAL_DC": "dc1",
+    "CASSANDRA_PROTOCOL_VERSION": 4,
+    "CASSANDRA_KEYSPACE": "test",
+    "CASSANDRA_REPLICATION_FACTOR": 1,
+}
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.prepared = []
+
+    def prepare(self, cql):
+        self.prepared.append(cql)
+        return f"prepared:{cql}"
+
+    def execute(self, query, parameters=None, **kwargs):
+        return query, parameters, kwargs
+
+
+@pytest.fixture
+def db_management():
+    DatabaseManagement.reset()
+    yield DatabaseManagement(SimpleNamespace(config=CONFIG))
+    DatabaseManagement.reset()
+
+
+def test_build_cluster():
+    # 创建 Cluster 不会连接数据库
+    cluster = build_cluster(CONFIG)
+    assert cluster.protocol_version == 4
+
+    policy = cluster.profile_manager.profiles[EXEC_PROFILE_DEFAULT
+                                             ].load_balancing_policy
+    assert isinstance(policy, TokenAwarePolicy)
+    assert isinstance(policy._child_policy, DCAwareRoundRobinPolicy)
+    assert policy._child_policy.local_dc == "dc1"
+
+
+def test_prepared_statement_cache():
+    session = FakeSession()
+    cache = PreparedStatementCache(session)
+
+    threads = [
+        threading.Thread(target=cache.prepare, args=("SELECT 1",))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 相同的 cql 只 prepare 一次
+    assert cache.prepare("SELECT 1") == "prepared:SELECT 1"
+    assert session.prepared == ["SELECT 1"]
+    assert cache.misses == 1
+
+    # 切换 session 后清空缓存
+    new_session = FakeSession()
+    cache.bind(new_session)
+    assert len(cache) == 0
+    cache.prepare("SELECT 1")
+    assert new_session.prepared == ["SELECT 1"]
+
+
+def test_singleton(db_management):
+    assert DatabaseManagement.instance() is db_management
+    assert DatabaseManagement(None) is db_management
+
+    DatabaseManagement.reset()
+    assert DatabaseManagement.instance() is None
+
+
+def test_profiled_session(db_management):
+    cql = db_management.cql_session()
+    db_management.db_session = FakeSession()
+
+    _, _, kwargs = cql.execute("SELECT 1")
+    assert kwargs == {"execution_profile": EXEC_PROFILE_CQL}
+    _, _, kwargs = cql.execute("SELECT 1", execution_profile="other")
+    assert kwargs == {"execution_profile": "other"}
+
+    # 重新连接后使用新的 session
+    db_management.db_session = FakeSession()
+    cql.prepare("SELECT 2")
+    assert db_management.db_session.prepared == ["SELECT 2"]
+
+
+def test_reconnect_after_fork(db_management, monkeypatch):
+    connects = []
+    monkeypatch.setattr(db_management, "connect", lambda: connects.append(True))
+
+    session = FakeSession()
+    db_management.db_session = session
+    db_management.prepared_statements.bind(session)
+    db_management.prepare("SELECT 1")
+    db_management._is_connected = True
+
+    db_management.reconnect_after_fork()
+
+    # 丢弃父进程的 session 和 prepared statement, 不能调用 shutdown
+    assert db_management.db_session is None
+    assert db_management.prepared_statements.session is None
+    assert len(db_management.prepared_statements) == 0
+    assert connects == [True]
+
+    # 父进程没有连接时, 子进程也不连接
+    db_management._is_connected = False
+    db_management.reconnect_after_fork()
+    assert connects == [True]
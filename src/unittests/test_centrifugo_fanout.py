@@ -0,0 +1,90 @@
+import json
+import threading
+
+import pytest
+from cent import Client
+
+import extensions.centrifugo as centrifugo_module
+from extensions.centrifugo.fanout import broadcast, chunked, send_broadcast
+
+
+class BroadcastClient(Client):
+    """记录每个 broadcast command 的 channel, 按 channel 返回错误"""
+
+    def __init__(self, failed_channels=(), raise_channels=()):
+        super().__init__("http://centrifugo", api_key="key")
+        self.failed_channels = set(failed_channels)
+        self.raise_channels = set(raise_channels)
+        self.chunks = []
+        self._lock = threading.Lock()
+
+    def _send(self, url, data):
+        command = json.loads(data.decode())
+        assert command["method"] == "broadcast"
+        channels = command["params"]["channels"]
+        with self._lock:
+            self.chunks.append(channels)
+
+        if self.raise_channels.intersection(channels):
+            raise ConnectionError("connection reset")
+        if self.failed_channels.intersection(channels):
+            return json.dumps({"error": {"code": 102, "message": "unknown"}})
+        return json.dumps({"result": {}}) + "\n"
+
+
+@pytest.mark.parametrize(
+    "count, size, expected",
+    [(0, 3, []), (3, 3, [3]), (4, 3, [3, 1]), (6, 3, [3, 3])],
+)
+def test_chunked(count, size, expected):
+    chunks = list(chunked(list(range(count)), size))
+    assert [len(chunk) for chunk in chunks] == expected
+    assert [item for chunk in chunks for item in chunk] == list(range(count))
+
+
+def test_send_broadcast():
+    client = BroadcastClient(failed_channels=["user#2"])
+
+    result = send_broadcast(client, ["user#1"], {"text": "hi"})
+    assert result["channels"] == 1
+    assert result["error"] is None
+    assert result["latency_ms"] >= 0
+
+    # 解析 Centrifugo 返回的错误
+    result = send_broadcast(client, ["user#2"], {"text": "hi"})
+    assert result["error"] == str({"code": 102, "message": "unknown"})
+
+
+def test_broadcast():
+    channels = [f"user#{index}" for index in range(10)]
+    client = BroadcastClient(
+        failed_channels=["user#4"], raise_channels=["user#9"]
+    )
+
+    result = broadcast(client, channels, {}, chunk_size=4, max_workers=2)
+
+    expected_chunks = [channels[0:4], channels[4:8], channels[8:10]]
+    assert sorted(client.chunks) == sorted(expected_chunks)
+    # 失败的分组中所有 channel 都算作失败
+    assert result["failed"] == 6
+    assert result["sent"] == 4
+    # chunks 和分组的顺序一致
+    assert [chunk["channels"] for chunk in result["chunks"]] == [4, 4, 2]
+    assert result["chunks"][0]["error"] is None
+    assert "unknown" in result["chunks"][1]["error"]
+    assert result["chunks"][2]["error"] == "connection reset"
+
+
+def test_broadcast_users(monkeypatch):
+    client = BroadcastClient()
+    monkeypatch.setattr(
+        centrifugo_module.centrifugo, "get_client", lambda: client
+    )
+
+    result = centrifugo_module.broadcast_users(range(1001), {"text": "hi"})
+
+    # 按 CENTRIFUGO_BROADCAST_CHUNK_SIZE 分组
+    assert sorted(len(chunk) for chunk in client.chunks) == [1, 1000]
+    sent_channels = {channel for chunk in client.chunks for channel in chunk}
+    assert sent_channels == {f"user#{index}" for index in range(1001)}
+    assert (result["sent"], result["failed"]) == (1001, 0)
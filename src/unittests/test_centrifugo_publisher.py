@@ -0,0 +1,78 @@
+import json
+
+import pytest
+from cent import Client
+
+from extensions.centrifugo.publisher import AsyncPublisher
+
+
+class BatchClient(Client):
+    """记录每次 http 请求发送的 command"""
+
+    def __init__(self, reply=None):
+        super().__init__("http://centrifugo", api_key="key")
+        self.requests = []
+        self.reply = reply
+
+    def _send(self, url, data):
+        commands = [json.loads(line) for line in data.decode().split("\n")]
+        self.requests.append(commands)
+        if self.reply is not None:
+            return self.reply
+        return "\n".join(json.dumps({}) for _ in commands)
+
+
+def test_publish_batch():
+    client = BatchClient()
+    publisher = AsyncPublisher(client, batch_size=10)
+    try:
+        for index in range(25):
+            assert publisher.publish("user#1", {"index": index})
+        assert publisher.flush(timeout=3) == 0
+    finally:
+        publisher.close()
+
+    # 消息合并发送, 顺序不变
+    assert all(len(commands) <= 10 for commands in client.requests)
+    commands = [command for batch in client.requests for command in batch]
+    assert [command["params"]["data"]["index"] for command in commands
+           ] == list(range(25))
+    assert commands[0]["method"] == "publish"
+
+    metrics = publisher.metrics()
+    assert metrics["published"] == 25
+    assert metrics["batches"] == len(client.requests)
+    assert metrics["queue_depth"] == 0
+
+
+def test_queue_full():
+    publisher = AsyncPublisher(BatchClient(), max_queue_size=1)
+    publisher.close()
+    publisher._worker.join()
+
+    assert publisher.publish("user#1", {}) is True
+    assert publisher.publish("user#1", {}) is False
+    assert publisher.metrics()["dropped"] == 1
+
+
+def test_invalid_payload_and_reply():
+    client = BatchClient(reply="<html>502 Bad Gateway</html>")
+    publisher = AsyncPublisher(client)
+    try:
+        # 不能序列化的消息不会进入队列
+        with pytest.raises(TypeError):
+            publisher.publish("user#1", {"value": object()})
+        assert len(publisher) == 0
+
+        # 无法解析的返回值只影响当前的 batch, 后台线程继续发送
+        assert publisher.publish("user#1", {"index": 1})
+        assert publisher.flush(timeout=3) == 0
+        client.reply = None
+        assert publisher.publish("user#1", {"index": 2})
+        assert publisher.flush(timeout=3) == 0
+        assert publisher._worker.is_alive()
+    finally:
+        publisher.close()
+
+    metrics = publisher.metrics()
+    assert (metrics["published"], metrics["failed"]) == (1, 1)
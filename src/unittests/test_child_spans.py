@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import pytest
+from cassandra.query import BatchStatement, SimpleStatement
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.trace import StatusCode
+
+from extensions.cassandra_orm.tracing import (
+    request_bytes,
+    rows_bytes,
+    trace_request,
+)
+from extensions.centrifugo import TracedClient
+from extensions.kafka import KafkaProducer
+from extensions.opentelemetry import spans
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(spans, "_tracer", provider.get_tracer(__name__))
+    return exporter
+
+
+@pytest.fixture
+def parent_span(exporter):
+    """模拟 flask 的请求 span"""
+    with spans.get_tracer().start_as_current_span("/test") as span:
+        yield span
+
+
+def finished_spans(exporter, name):
+    return [span for span in exporter.get_finished_spans() if span.name == name]
+
+
+def test_skip_without_recording_parent(exporter):
+
+    def attributes():
+        raise AssertionError("attributes should not be computed")
+
+    with spans.child_span("redis GET", attributes) as span:
+        assert span is None
+    assert exporter.get_finished_spans() == ()
+
+
+def test_child_span_error(exporter, parent_span):
+    with pytest.raises(ValueError):
+        with spans.child_span("redis GET", lambda: {"db.redis.key": "a"}):
+            raise ValueError
+
+    span, = finished_spans(exporter, "redis GET")
+    assert span.parent.span_id == parent_span.get_span_context().span_id
+    assert span.attributes["db.redis.key"] == "a"
+    assert span.status.status_code is StatusCode.ERROR
+
+
+def test_kafka_send_span(exporter, parent_span):
+    producer = KafkaProducer({"bootstrap.servers": "127.0.0.1:1"})
+    try:
+        producer.send("test", b"12345")
+    finally:
+        producer.close()
+
+    span, = finished_spans(exporter, "kafka send test")
+    assert span.attributes["messaging.destination"] == "test"
+    assert span.attributes["messaging.message_payload_size_bytes"] == 5
+
+
+def test_centrifugo_span(exporter, parent_span):
+    session = SimpleNamespace(
+        post=lambda *args, **kwargs:
+        SimpleNamespace(status_code=200, content=b'{"result": {}}')
+    )
+    client = TracedClient("http://centrifugo:8000", session=session)
+    client.publish("user#1", {"text": "hello"})
+
+    span, = finished_spans(exporter, "centrifugo publish")
+    assert span.attributes["centrifugo.channels"] == ("user#1",)
+    assert span.attributes["centrifugo.request_bytes"] > 0
+
+
+def test_cassandra_span(exporter, parent_span):
+    callbacks = []
+    response_future = SimpleNamespace(
+        query=SimpleStatement('SELECT * FROM flask_template."person" LIMIT 1'),
+        add_callbacks=lambda *args: callbacks.append(args),
+    )
+    trace_request(response_future)
+    on_result, on_error = callbacks[0]
+    on_result([{"first_name": "a"}])
+    # 翻页时再次调用
+    on_result([])
+
+    span, = finished_spans(exporter, "cassandra SELECT flask_template.person")
+    assert span.attributes["db.cassandra.rows"] == 1
+    assert span.attributes["db.cassandra.request_bytes"] == len(
+        response_future.query.query_string
+    )
+    assert span.attributes["db.cassandra.response_bytes"] == 1
+
+
+def test_cassandra_request_bytes():
+    batch = BatchStatement()
+    batch.add("INSERT INTO t (a) VALUES (%s)", ("abc",))
+    batch.add(SimpleStatement("DELETE FROM t"))
+    expected = len("INSERT INTO t (a) VALUES ('abc')") + len("DELETE FROM t")
+    assert request_bytes(batch) == expected
+
+    # BoundStatement 只计算序列化后的参数
+    bound = SimpleNamespace(
+        prepared_statement=SimpleNamespace(query_string="SELECT"),
+        values=[b"1234", None],
+    )
+    assert request_bytes(bound) == 4
+    assert rows_bytes([("ab", 1), {"name": b"xyz"}]) == 5
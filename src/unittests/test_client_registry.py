@@ -0,0 +1,76 @@
+import os
+
+from extensions.client_registry import ClientRegistry, LazyClient
+
+
+class Client:
+    created = 0
+
+    def __init__(self):
+        Client.created += 1
+
+    def ping(self):
+        return "pong"
+
+
+def test_lazy_client(monkeypatch):
+    Client.created = 0
+    registry = ClientRegistry()
+    client = LazyClient("test", Client, registry=registry)
+
+    # 第一次使用时才创建
+    assert Client.created == 0
+    assert client.is_initialized is False
+    assert client.ping() == "pong"
+    assert client.ping() == "pong"
+    assert Client.created == 1
+
+    # 进程变化后重新创建
+    pid = os.getpid()
+    monkeypatch.setattr(os, "getpid", lambda: pid + 1)
+    assert client.is_initialized is False
+    assert client.ping() == "pong"
+    assert Client.created == 2
+
+
+def test_fork_handlers():
+    Client.created = 0
+    registry = ClientRegistry()
+    client = LazyClient("test", Client, registry=registry)
+    client.ping()
+
+    calls = []
+    registry.register_fork_handler(
+        before=lambda: calls.append("before"),
+        after=lambda: calls.append("after"),
+    )
+    registry.before_fork()
+    registry.after_fork()
+    assert calls == ["before", "after"]
+
+    assert client.is_initialized is False
+    client.ping()
+    assert Client.created == 2
+
+
+def test_shutdown_handlers():
+    registry = ClientRegistry()
+    calls = []
+
+    def failed(timeout):
+        raise RuntimeError
+
+    registry.register_shutdown_handler(
+        "close", lambda timeout: calls.append("close")
+    )
+    registry.register_shutdown_handler("failed", failed, order=5)
+    registry.register_shutdown_handler(
+        "flush", lambda timeout: calls.append(("flush", timeout)), order=0
+    )
+
+    # 按 order 执行, 失败的清理函数不影响后面的清理函数
+    durations = registry.shutdown(timeout=5)
+    assert calls[0][0] == "flush"
+    assert 0 < calls[0][1] <= 5
+    assert calls[1] == "close"
+    assert list(durations) == ["flush", "failed", "close"]
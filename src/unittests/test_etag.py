@@ -0,0 +1,69 @@
+import pytest
+from flask import Blueprint, Flask
+from marshmallow import Schema, fields
+
+from extensions.flask_api.api import class_route, make_etag
+from extensions.flask_api.views import GetView
+
+
+class ItemSerializer(Schema):
+    name = fields.Str()
+
+
+@pytest.fixture
+def calls():
+    return {"get_object": 0}
+
+
+@pytest.fixture
+def client(calls):
+    blueprint = Blueprint("etag", __name__)
+
+    @class_route(blueprint, "/item")
+    class ItemView(GetView):
+        etag_enabled = True
+        get_serializer_class = ItemSerializer
+
+        def get_object(self):
+            calls["get_object"] += 1
+            return {"name": "item"}
+
+    @class_route(blueprint, "/versioned")
+    class VersionedView(ItemView):
+
+        def get_etag_version(self):
+            return "v1"
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.register_blueprint(blueprint)
+    return flask_app.test_client()
+
+
+def test_hash_etag(client, calls):
+    response = client.get("/item")
+    assert response.status_code == 200
+    # 根据响应内容计算 ETag
+    assert response.headers["ETag"] == f'"{make_etag(response.data)}"'
+
+    etag = response.headers["ETag"]
+    response = client.get("/item", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+    response = client.get("/item", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert calls["get_object"] == 3
+
+
+def test_version_etag(client, calls):
+    response = client.get("/versioned")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert calls["get_object"] == 1
+
+    # 数据版本没有变化时, 不读取数据直接返回 304
+    response = client.get("/versioned", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert calls["get_object"] == 1
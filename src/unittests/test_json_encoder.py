@@ -0,0 +1,111 @@
+import json
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+from flask import Flask, jsonify
+
+from extensions.flask_api.api import failed_response, ok_response
+from extensions.flask_api.encoder import (
+    ENCODER_BACKENDS,
+    encode_failed,
+    encode_ok,
+    get_encoder,
+    iter_encode_ok_items,
+)
+
+
+def make_items(count):
+    """模拟 ListView 序列化后的数据"""
+    created_at = datetime(2021, 10, 1, 12, 30)
+    return [{
+        "id": uuid.uuid4(),
+        "first_name": f"first_name_{index}",
+        "last_name": "姓名",
+        "score": index * 1.5,
+        "tags": ["a", "b", "c"],
+        "created_at": created_at,
+    } for index in range(count)]
+
+
+@pytest.fixture(scope="module")
+def bare_app():
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "ujson"
+    return flask_app
+
+
+@pytest.mark.parametrize("name", list(ENCODER_BACKENDS))
+def test_encoders_match_flask_json(bare_app, name):
+    """每个后端的结果都和 flask jsonify 解析出来的一致"""
+    items = make_items(3)
+    body = encode_ok({"items": items}, encoder=get_encoder(name))
+
+    with bare_app.app_context():
+        expected = jsonify({"ok": True, "result": {"items": items}}).json
+    assert json.loads(body) == expected
+
+
+@pytest.mark.parametrize("name", list(ENCODER_BACKENDS))
+def test_non_str_keys(name):
+    """int 类型的 key 和标准库一样转成字符串"""
+    data = {1: "a", "b": {2: True}}
+    body = get_encoder(name).dumps(data)
+    assert json.loads(body) == json.loads(json.dumps(data))
+
+
+def test_encode_failed():
+    body = encode_failed("object_not_found", "Object not found")
+    assert json.loads(body) == {
+        "ok": False,
+        "error_type": "object_not_found",
+        "error_message": "Object not found",
+    }
+
+    body = encode_failed("error", "message", error_data={"id": 1})
+    assert json.loads(body)["error_data"] == {"id": 1}
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 10])
+def test_iter_encode_ok_items(batch_size):
+    """流式编码的结果和一次性编码一致"""
+    items = make_items(7)
+    batches = [
+        items[index:index + batch_size]
+        for index in range(0, len(items), batch_size)
+    ]
+    body = b"".join(iter_encode_ok_items("items", batches))
+    assert body == encode_ok({"items": items})
+
+    empty_body = b"".join(iter_encode_ok_items("items", []))
+    assert empty_body == encode_ok({"items": []})
+
+
+def test_responses(bare_app):
+    with bare_app.app_context():
+        response = ok_response("ok")
+        assert response.mimetype == "application/json"
+        assert response.data == b'{"ok":true,"result":"ok"}'
+
+        response = failed_response("api_error", "error")
+        assert response.json["ok"] is False
+
+
+@pytest.mark.slow
+def test_encoder_benchmark():
+    """对比各个后端编码大量 ListView 数据的耗时"""
+    items = make_items(10000)
+    rounds = 10
+    print()
+    for name in ENCODER_BACKENDS:
+        encoder = get_encoder(name)
+        if encoder.name != name:
+            print(f"{name:>8}: not available")
+            continue
+
+        started_at = time.perf_counter()
+        for _ in range(rounds):
+            body = encode_ok({"items": items}, encoder=encoder)
+        cost = (time.perf_counter() - started_at) / rounds
+        print(f"{name:>8}: {cost * 1000:.2f} ms, {len(body)} bytes")
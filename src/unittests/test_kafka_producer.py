@@ -0,0 +1,72 @@
+import pytest
+
+from extensions import kafka, metrics
+from extensions.kafka import KafkaProducer
+from extensions.metrics import render_metrics
+from extensions.metrics.store import MetricsStore
+
+
+@pytest.fixture
+def producer():
+    # 没有配置 broker, 不会连接 broker, 也不会产生连接失败的事件,
+    # 消息会一直留在本地队列中
+    kafka_producer = KafkaProducer(
+        {"queue.buffering.max.messages": 2},
+        topic_configs={"slow": {
+            "linger.ms": 100
+        }},
+        poll_interval=0.01,
+        block_timeout=0.05,
+    )
+    yield kafka_producer
+    kafka_producer.close()
+
+
+def test_topic_producer(producer):
+    assert producer.producer_for("slow") is not producer.default_producer
+    assert producer.producer_for("other") is producer.default_producer
+
+
+def test_buffer_full(producer):
+    producer.send("test", b"1")
+    producer.send("test", b"2")
+    # 处理完所有待处理的事件后, 队列中只剩下两条消息
+    producer.poll(0)
+    assert len(producer) == 2
+
+    # 队列已满, 等待 block_timeout 后仍然抛出 BufferError
+    with pytest.raises(BufferError):
+        producer.send("test", b"3")
+
+    counters = producer.metrics()
+    assert counters["sent"] == 2
+    assert counters["buffer_full"] > 0
+    assert counters["rejected"] == 1
+    assert counters["queue_depth"] == 2
+    assert counters["delivered"] == 0
+
+
+@pytest.fixture
+def lazy_producer(producer, monkeypatch):
+    monkeypatch.setattr(
+        metrics.metrics_store, "factory",
+        lambda: MetricsStore(collector=metrics.collect_counters)
+    )
+    monkeypatch.setattr(kafka.kafka_producer, "factory", lambda: producer)
+    metrics.metrics_store.reset()
+    kafka.kafka_producer.reset()
+    yield kafka.kafka_producer
+    kafka.kafka_producer.reset()
+    metrics.metrics_store.reset()
+
+
+def test_render_counters(lazy_producer):
+    # 没有使用过 producer 时不创建
+    render_metrics()
+    assert not lazy_producer.is_initialized
+
+    lazy_producer.send("test", b"1")
+    text = render_metrics()
+    assert "# TYPE kafka_producer_messages_total counter" in text
+    assert 'kafka_producer_messages_total{event="sent"} 1' in text
+    assert 'kafka_producer_messages_total{event="rejected"} 0' in text
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+
+import pytest
+from flask import Blueprint, Flask
+from marshmallow import Schema, fields
+
+from extensions import metrics
+from extensions.flask_api.api import class_route, route
+from extensions.flask_api.exceptions import APIException
+from extensions.flask_api.views import ListView
+from extensions.metrics import phase, render_metrics
+from extensions.metrics.store import MetricsStore, render
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """使用不写文件的 store"""
+    monkeypatch.setattr(metrics.metrics_store, "factory", MetricsStore)
+    metrics.metrics_store.reset()
+    yield metrics.metrics_store.get_client()
+    metrics.metrics_store.reset()
+
+
+def make_app():
+    blueprint = Blueprint("metrics_test", __name__)
+
+    @route(blueprint, "/slow")
+    def slow():
+        with phase("query"):
+            time.sleep(0.02)
+            with phase("serialization"):
+                time.sleep(0.01)
+        return {"ok": 1}
+
+    @route(blueprint, "/failed")
+    def failed():
+        raise APIException()
+
+    @class_route(blueprint, "/items")
+    class ItemsView(ListView):
+        list_serializer_class = ItemSerializer
+
+        def filter_objects(self):
+            return lazy_query(5)
+
+    @class_route(blueprint, "/stream")
+    class StreamView(ItemsView):
+        stream_results = True
+        stream_batch_size = 2
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.register_blueprint(blueprint)
+    return flask_app
+
+
+class ItemSerializer(Schema):
+    id = fields.Int()
+
+
+def lazy_query(count):
+    """和 cqlengine 的查询一样, 迭代时才读取数据"""
+    for index in range(count):
+        time.sleep(0.005)
+        yield {"id": index}
+
+
+def endpoint_phases(store, endpoint):
+    return {
+        dict(labels)["phase"]: total
+        for labels, (counts, total) in store.histograms.items()
+        if dict(labels)["endpoint"] == endpoint
+    }
+
+
+def test_merge_worker_files(tmp_path):
+    labels = (("endpoint", "a"), ("method", "GET"), ("phase", "total"))
+    worker = MetricsStore(directory=str(tmp_path))
+    worker.observe(labels, 0.003)
+    worker.observe(labels, 20)
+    worker.inc((("endpoint", "a"), ("error_type", "not_found")))
+    # 模拟其他 worker 写入的文件
+    (tmp_path / "1.json").write_text(json.dumps(worker.snapshot()))
+
+    # 另一个 worker 读取时汇总文件和自己内存中的数据
+    current = MetricsStore(directory=str(tmp_path))
+    current.observe(labels, 0.3)
+    histograms, counters = current.collect()
+    counts, total = histograms[labels]
+    assert sum(counts) == 3
+    assert counts[0] == 1 and counts[-1] == 1
+    assert total == pytest.approx(20.303)
+    assert counters[(("endpoint", "a"), ("error_type", "not_found"))] == 1
+
+    text = render("latency", histograms, "errors", counters)
+    assert '# TYPE latency histogram' in text
+    assert (
+        'latency_bucket{endpoint="a",method="GET",phase="total",le="+Inf"} 3'
+        in text
+    )
+    assert 'latency_count{endpoint="a",method="GET",phase="total"} 3' in text
+    assert 'errors{endpoint="a",error_type="not_found"} 1' in text
+
+
+def test_retire_worker(tmp_path):
+    labels = (("endpoint", "a"), ("error_type", "not_found"))
+    # 同一个 pid 先后启动的两个 worker
+    old_worker = MetricsStore(directory=str(tmp_path))
+    old_worker.inc(labels, 3)
+    old_worker.write()
+    new_worker = MetricsStore(directory=str(tmp_path))
+    new_worker.inc(labels, 2)
+    new_worker.write()
+    assert old_worker.path() != new_worker.path()
+
+    # 退出的 worker 合并到 aggregate 文件, 之后不会再写入自己的文件
+    old_worker.retire()
+    old_worker.write()
+    new_worker.retire()
+    assert sorted(os.listdir(tmp_path)) == [".lock", "aggregate.json"]
+
+    reader = MetricsStore(directory=str(tmp_path))
+    reader.inc(labels)
+    _, counters = reader.collect()
+    assert counters[labels] == 6
+
+
+def test_request_phases(store):
+    client = make_app().test_client()
+    assert client.get("/slow").status_code == 200
+    client.get("/failed")
+
+    phases = endpoint_phases(store, "metrics_test.slow")
+    assert set(phases) == {"query", "serialization", "encoding", "total"}
+    # 嵌套的 serialization 不计入 query
+    assert phases["serialization"] >= 0.01
+    assert 0.02 <= phases["query"] < 0.02 + phases["serialization"]
+    assert phases["total"] >= phases["query"] + phases["serialization"]
+
+    text = render_metrics()
+    assert (
+        'api_errors_total{endpoint="metrics_test.failed",'
+        'error_type="api_error"} 1' in text
+    )
+
+
+@pytest.mark.parametrize(
+    "path, endpoint", [("/items", "ItemsView"), ("/stream", "StreamView")]
+)
+def test_list_phases(store, path, endpoint):
+    response = make_app().test_client().get(path)
+    assert len(response.json["result"]["items"]) == 5
+
+    phases = endpoint_phases(store, f"metrics_test.{endpoint}")
+    assert set(phases) == {
+        "validation", "query", "serialization", "encoding", "total"
+    }
+    # 迭代时读取数据的耗时记录为 query, 流式 response 的耗时也计入 total
+    assert phases["query"] >= 0.025
+    assert phases["serialization"] < phases["query"]
+    assert phases["total"] >= sum(
+        seconds for name, seconds in phases.items() if name != "total"
+    )
@@ -0,0 +1,175 @@
+from types import SimpleNamespace
+
+import pytest
+from cassandra.cqlengine import ValidationError, columns
+from cassandra.cqlengine.models import Model
+from flask import Blueprint, Flask
+from marshmallow import Schema, fields
+
+from extensions.cassandra_orm import queries
+from extensions.cassandra_orm.queries import (
+    multi_get,
+    primary_key_select_cql,
+    select_columns,
+)
+from extensions.flask_api import views
+from extensions.flask_api.api import class_route
+from extensions.flask_api.views import MultiRetrievePutView
+
+
+class Score(Model):
+    __keyspace__ = "mget_test"
+
+    user_id = columns.Integer(primary_key=True)
+    game = columns.Text(primary_key=True)
+    points = columns.Integer(db_field="p")
+    level = columns.Integer()
+
+
+class FakeDatabase:
+    """prepare 直接返回 cql, 按主键返回 rows 中的数据"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.db_session = object()
+        self.calls = []
+
+    def prepare(self, cql):
+        return cql
+
+    def execute_concurrent_with_args(
+        self, session, statement, parameters, concurrency
+    ):
+        self.calls.append((statement, list(parameters), concurrency))
+        results = []
+        for key in parameters:
+            row = self.rows.get(key)
+            results.append((True, SimpleNamespace(one=lambda row=row: row)))
+        return results
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase({
+        (1, "go"): {
+            "user_id": 1,
+            "game": "go",
+            "p": 10,
+            "level": 2
+        },
+        (2, "go"): {
+            "user_id": 2,
+            "game": "go",
+            "p": 20,
+            "level": 3
+        },
+    })
+    monkeypatch.setattr(
+        queries, "execute_concurrent_with_args",
+        database.execute_concurrent_with_args
+    )
+    return database
+
+
+def test_primary_key_select_cql():
+    assert select_columns(Score, ["points"]) == ["points"]
+    # 去重并按 model 字段的顺序排列
+    assert select_columns(Score,
+                          ["level", "points", "level"]) == ["points", "level"]
+    # 有不存在的字段时查询所有字段, 由 view 返回字段不存在的错误
+    assert select_columns(Score, ["points", "unknown"]) == list(Score._columns)
+
+    assert primary_key_select_cql(Score, ["user_id", "points"]) == (
+        'SELECT "user_id", "p" FROM mget_test.score '
+        'WHERE "user_id" = ? AND "game" = ?'
+    )
+
+
+def test_multi_get(database):
+    keys = [
+        {
+            "user_id": 2,
+            "game": "go"
+        },
+        {
+            "user_id": 3,
+            "game": "go"
+        },
+        {
+            "user_id": 1,
+            "game": "go"
+        },
+    ]
+    items = multi_get(database, Score, keys, fields=["points"], concurrency=2)
+
+    # 和 keys 的顺序一致, 不存在的数据为 None
+    assert items == [{"points": 20}, None, {"points": 10}]
+    statement, parameters, concurrency = database.calls[0]
+    assert statement.startswith('SELECT "p" FROM')
+    assert parameters == [(2, "go"), (3, "go"), (1, "go")]
+    assert concurrency == 2
+
+    # 缺少主键字段时不会查询
+    with pytest.raises(ValidationError):
+        multi_get(database, Score, [{"user_id": 1}])
+    assert len(database.calls) == 1
+
+
+class ScoreKey(Schema):
+    user_id = fields.Int(required=True)
+    game = fields.Str()
+
+
+class ScoreSerializer(Schema):
+    user_id = fields.Int()
+    points = fields.Int()
+    level = fields.Int()
+
+
+def test_mget_view(database, monkeypatch):
+    monkeypatch.setattr(views, "DatabaseManagement", lambda app: database)
+    blueprint = Blueprint("mget", __name__)
+
+    @class_route(blueprint, "/scores", methods=["PUT"])
+    class ScoresView(MultiRetrievePutView):
+        multi_args_deserializer_class = ScoreKey
+        retrieve_serializer_class = ScoreSerializer
+        mget_model = Score
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.register_blueprint(blueprint)
+
+    response = flask_app.test_client().put(
+        "/scores",
+        json={
+            "items": [{
+                "user_id": 1,
+                "game": "go"
+            }, {
+                "user_id": 5,
+                "game": "go"
+            }],
+            "fields": ["user_id", "points"],
+        },
+    )
+    assert response.json["result"]["items"] == [{
+        "user_id": 1,
+        "points": 10
+    }, None]
+    # 只查询请求的字段
+    assert database.calls[0][0].startswith('SELECT "user_id", "p" FROM')
+
+    # 缺少主键字段时返回字段验证错误
+    response = flask_app.test_client().put(
+        "/scores",
+        json={"items": [{
+            "user_id": 1,
+            "game": "go"
+        }, {
+            "user_id": 2
+        }]}
+    )
+    assert response.json["ok"] is False
+    assert response.json["error_type"] == "data_validation_errors"
+    assert len(database.calls) == 1
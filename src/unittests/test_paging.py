@@ -0,0 +1,136 @@
+from types import SimpleNamespace
+
+import pytest
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+from flask import Blueprint, Flask
+from marshmallow import Schema, fields
+
+from extensions.cassandra_orm import paging
+from extensions.cassandra_orm.paging import (
+    decode_paging_state,
+    encode_paging_state,
+    fetch_queryset_page,
+    iter_queryset,
+)
+from extensions.flask_api.api import class_route
+from extensions.flask_api.views import ListView
+
+
+class Event(Model):
+    __keyspace__ = "paging_test"
+
+    user_id = columns.Integer(partition_key=True)
+    created_at = columns.Integer(primary_key=True)
+    name = columns.Text()
+
+
+class FakeResult:
+    """驱动的 ResultSet: current_rows 为当前页, 迭代时返回所有页的数据"""
+
+    def __init__(self, rows, paging_state):
+        self.current_rows = rows[:1]
+        self.paging_state = paging_state
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+
+    def __init__(self, rows, paging_state):
+        self.rows = rows
+        self.paging_state = paging_state
+        self.calls = []
+
+    def execute(self, statement, parameters, timeout=None, paging_state=None):
+        self.calls.append((statement, parameters, paging_state))
+        return FakeResult(self.rows, self.paging_state)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    rows = [{
+        "user_id": 1,
+        "created_at": index,
+        "name": f"event{index}"
+    } for index in range(3)]
+    session = FakeSession(rows, b"next")
+    monkeypatch.setattr(
+        paging, "connection",
+        SimpleNamespace(
+            get_session=lambda name: session,
+            get_cluster=lambda name: SimpleNamespace(protocol_version=4),
+        )
+    )
+    return session
+
+
+def test_paging_state():
+    value = encode_paging_state(b"\x00\xff\xfe")
+    assert decode_paging_state(value) == b"\x00\xff\xfe"
+    assert encode_paging_state(None) is None
+    assert decode_paging_state("") is None
+    with pytest.raises(ValueError):
+        decode_paging_state("!")
+
+
+def test_fetch_queryset_page(session):
+    items, paging_state = fetch_queryset_page(
+        Event.objects.filter(user_id=1), size=20, paging_state=b"prev"
+    )
+
+    assert [item.name for item in items] == ["event0"]
+    assert paging_state == b"next"
+
+    statement, parameters, previous = session.calls[0]
+    # 不使用 cqlengine 默认的 LIMIT 10000, 由驱动分页
+    assert "LIMIT" not in statement.query_string
+    assert statement.fetch_size == 20
+    assert statement.routing_key is not None
+    assert list(parameters.values()) == [1]
+    assert previous == b"prev"
+
+
+def test_iter_queryset(session):
+    queryset = Event.objects.filter(user_id=1)
+    items = iter_queryset(queryset, fetch_size=2)
+
+    # 迭代时才执行查询
+    assert session.calls == []
+    assert [item.created_at for item in items] == [0, 1, 2]
+    statement, _, _ = session.calls[0]
+    assert "LIMIT" not in statement.query_string
+    assert statement.fetch_size == 2
+    # 不会缓存在 queryset 中
+    assert queryset._result_cache is None
+
+
+class EventSerializer(Schema):
+    name = fields.Str()
+
+
+def test_stream_queryset(session):
+    blueprint = Blueprint("paging", __name__)
+
+    @class_route(blueprint, "/events")
+    class EventsView(ListView):
+        list_serializer_class = EventSerializer
+        stream_results = True
+        stream_batch_size = 2
+
+        def filter_objects(self):
+            return Event.objects.filter(user_id=1)
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.register_blueprint(blueprint)
+
+    response = flask_app.test_client().get("/events")
+    assert response.json["result"]["items"] == [{
+        "name": f"event{index}"
+    } for index in range(3)]
+    statement, _, _ = session.calls[0]
+    assert "LIMIT" not in statement.query_string
+    assert statement.fetch_size == 2
@@ -2,8 +2,11 @@ import time
 import uuid
 
 import pytest
+from flask import Flask
 
+from extensions.flask_api.api import ok_response
 from extensions.redis_cluster import DuplicateRequest, assert_new_request
+from extensions.redis_cluster.idempotency import idempotent
 
 
 def test_duplicate_request():
@@ -16,3 +19,27 @@ def test_duplicate_request():
     # 当时间过了，还是可以继续用相同的 request id 请求
     time.sleep(1.01)
     assert_new_request("my-request", request_id, life_time_second=1)
+
+
+def test_idempotent_replay():
+    """重复的请求返回第一次请求的响应"""
+    calls = []
+
+    class View:
+        validated_data = {"request_id": uuid.uuid4()}
+
+        @idempotent("my-idempotent-request", life_time_second=5)
+        def save(self):
+            calls.append(1)
+            return len(calls)
+
+        def response(self, saved_object):
+            return ok_response(saved_object)
+
+    with Flask(__name__).app_context():
+        response1 = View().save()
+        response2 = View().save()
+
+    assert calls == [1]
+    assert response1.get_data() == response2.get_data()
+    assert response2.json["result"] == 1
@@ -0,0 +1,128 @@
+import time
+
+import pytest
+from flask import Blueprint, Flask
+from marshmallow import Schema, fields
+from rediscluster.exceptions import ClusterDownError
+
+from extensions import metrics
+from extensions.flask_api import cache, views
+from extensions.flask_api.api import class_route
+from extensions.flask_api.cache import (
+    LocalTTLCache,
+    ResponseCache,
+    invalidate_view_caches,
+    make_cache_key,
+)
+from extensions.flask_api.views import GetView
+from extensions.metrics import render_metrics
+from extensions.metrics.store import MetricsStore
+
+
+def test_local_cache_lru():
+    cache = LocalTTLCache(max_size=2)
+    cache.set("a", b"1", ttl=10)
+    cache.set("b", b"2", ttl=10)
+
+    # 访问 a 之后, b 是最久没有使用的
+    assert cache.get("a") == b"1"
+    cache.set("c", b"3", ttl=10)
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+    assert len(cache) == 2
+
+    cache.delete("a")
+    assert cache.get("a") is None
+
+
+def test_local_cache_ttl():
+    cache = LocalTTLCache()
+    cache.set("a", b"1", ttl=0.01)
+    assert cache.get("a") == b"1"
+
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_make_cache_key():
+    key = make_cache_key("example.GetExampleView", ["Test", 1])
+    assert key == "response_cache:example.GetExampleView:Test:1"
+
+
+class FailingRedis:
+    """所有命令都失败的 Redis"""
+
+    def __getattr__(self, name):
+
+        def command(*args, **kwargs):
+            raise ClusterDownError("CLUSTERDOWN")
+
+        return command
+
+
+class ItemSerializer(Schema):
+    id = fields.Int()
+
+
+class ItemValidator(Schema):
+    id = fields.Int(required=True)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setattr(
+        metrics.metrics_store, "factory",
+        lambda: MetricsStore(collector=metrics.collect_counters)
+    )
+    metrics.metrics_store.reset()
+    yield metrics.metrics_store.get_client()
+    metrics.metrics_store.reset()
+
+
+@pytest.fixture
+def failing_redis(monkeypatch):
+    monkeypatch.setattr(cache, "redis_client", FailingRedis())
+    monkeypatch.setattr(cache, "response_cache", ResponseCache())
+    monkeypatch.setattr(views, "response_cache", cache.response_cache)
+    return cache.response_cache
+
+
+def test_redis_error_fallback(failing_redis, store):
+    blueprint = Blueprint("response_cache", __name__)
+    queries = []
+
+    @class_route(blueprint, "/items/<int:id>")
+    class ItemView(GetView):
+        args_deserializer_class = ItemValidator
+        get_serializer_class = ItemSerializer
+        cache_ttl = 60
+        cache_key_fields = ("id",)
+
+        def get_object(self):
+            queries.append(self.validated_data["id"])
+            return {"id": self.validated_data["id"]}
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.register_blueprint(blueprint)
+
+    # Redis 出错时直接查询, 不缓存
+    for _ in range(2):
+        response = flask_app.test_client().get("/items/1")
+        assert response.json == {"ok": True, "result": {"id": 1}}
+    assert queries == [1, 1]
+    assert failing_redis.counters["errors"] == 2
+
+    # 缺少 cache_key_fields 的字段时跳过, Redis 出错时只记录
+    invalidate_view_caches([ItemView], {"name": "a"})
+    assert failing_redis.counters["invalidations"] == 0
+    invalidate_view_caches([ItemView], {"id": 1})
+    assert failing_redis.counters["errors"] == 3
+
+    # 命中和出错的次数由 /metrics 输出
+    text = render_metrics()
+    assert "# TYPE response_cache_events_total counter" in text
+    assert 'response_cache_events_total{event="errors"} 3' in text
+    assert 'response_cache_events_total{event="misses"} 0' in text
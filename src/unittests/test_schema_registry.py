@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from marshmallow import Schema, fields
+
+from extensions.flask_api.serializer import SchemaRegistry
+
+
+class NameSchema(Schema):
+    name = fields.Str(required=True)
+
+
+def test_schema_registry():
+    registry = SchemaRegistry()
+
+    schema = registry.get(NameSchema)
+    assert registry.get(NameSchema) is schema
+    assert registry.get(NameSchema, many=True) is not schema
+    assert registry.get(NameSchema, many=True).many is True
+
+    assert registry.stats() == {
+        f"{__name__}.NameSchema": 1,
+        f"{__name__}.NameSchema(many=True)": 1,
+    }
+
+    registry.clear()
+    assert registry.stats() == {}
+
+
+def test_schema_registry_threads():
+    """多个线程同时获取, 只会创建一个实例"""
+    registry = SchemaRegistry()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        schemas = list(
+            executor.map(lambda _: registry.get(NameSchema), range(100))
+        )
+    assert len({id(schema) for schema in schemas}) == 1
+    assert schemas[0].load({"name": "test"}) == {"name": "test"}
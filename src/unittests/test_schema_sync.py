@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+from cassandra.cqlengine.usertype import UserType
+from cassandra.metadata import (
+    ColumnMetadata,
+    IndexMetadata,
+    KeyspaceMetadata,
+    TableMetadataV3,
+)
+
+from extensions.cassandra_orm.schema import (
+    SchemaAgreementError,
+    collect_user_types,
+    defer_schema_agreement,
+    plan_sync,
+)
+
+
+class Address(UserType):
+    city = columns.Text()
+
+
+class Profile(UserType):
+    address = columns.UserDefinedType(Address)
+
+
+class Player(Model):
+    __keyspace__ = "schema_test"
+
+    id = columns.UUID(primary_key=True)
+    name = columns.Text(index=True)
+    level = columns.Integer()
+    profile = columns.UserDefinedType(Profile)
+
+
+class Game(Model):
+    __keyspace__ = "schema_test"
+
+    id = columns.UUID(primary_key=True)
+
+
+def existing_keyspace():
+    """数据库中已经有 player 表, 缺少 level / profile 字段和 name 的索引"""
+    keyspace = KeyspaceMetadata(
+        "schema_test", True, "SimpleStrategy", {"replication_factor": "1"}
+    )
+    table = TableMetadataV3("schema_test", "player")
+    for name, cql_type in (("id", "uuid"), ("name", "text")):
+        table.columns[name] = ColumnMetadata(table, name, cql_type)
+    table.partition_key = [table.columns["id"]]
+    keyspace.tables["player"] = table
+    return keyspace
+
+
+def test_collect_user_types():
+    # 被依赖的 user type 排在前面
+    assert collect_user_types([Player]) == [Address, Profile]
+
+
+def test_plan_sync():
+    type_statements, table_statements, index_statements = plan_sync(
+        existing_keyspace(), [Player, Game]
+    )
+
+    assert len(type_statements) == 2
+    assert type_statements[0].startswith("CREATE TYPE schema_test.address")
+    assert type_statements[1].startswith("CREATE TYPE schema_test.profile")
+
+    assert table_statements[:2] == [
+        'ALTER TABLE schema_test.player ADD "level" int',
+        'ALTER TABLE schema_test.player ADD "profile" frozen<profile>',
+    ]
+    assert table_statements[2].startswith("CREATE TABLE schema_test.game")
+    assert index_statements == ['CREATE INDEX ON schema_test.player ("name")']
+
+
+def test_plan_sync_without_changes():
+    keyspace = existing_keyspace()
+    table = keyspace.tables["player"]
+    for name, cql_type in (("level", "int"), ("profile", "frozen<profile>")):
+        table.columns[name] = ColumnMetadata(table, name, cql_type)
+    table.indexes["player_name_idx"] = IndexMetadata(
+        "schema_test", "player", "player_name_idx", "COMPOSITES",
+        {"target": "name"}
+    )
+
+    type_statements, table_statements, index_statements = plan_sync(
+        keyspace, [Player]
+    )
+    assert table_statements == []
+    assert index_statements == []
+
+
+def fake_cluster(agreed):
+    waits = []
+
+    def wait_for_schema_agreement():
+        waits.append(cluster.max_schema_agreement_wait)
+        return agreed
+
+    cluster = SimpleNamespace(
+        max_schema_agreement_wait=10,
+        control_connection=SimpleNamespace(
+            wait_for_schema_agreement=wait_for_schema_agreement
+        ),
+    )
+    return cluster, waits
+
+
+def test_defer_schema_agreement():
+    cluster, waits = fake_cluster(agreed=True)
+    with defer_schema_agreement(cluster):
+        # 执行 DDL 时不等待
+        assert cluster.max_schema_agreement_wait == 0
+    assert waits == [10]
+
+    # 没有等到 schema 一致时不能继续执行依赖前一阶段的 DDL
+    cluster, waits = fake_cluster(agreed=False)
+    with pytest.raises(SchemaAgreementError):
+        with defer_schema_agreement(cluster):
+            pass
+    assert waits == [10]
+
+    # DDL 失败时抛出 DDL 的错误
+    with pytest.raises(ZeroDivisionError):
+        with defer_schema_agreement(cluster):
+            1 / 0
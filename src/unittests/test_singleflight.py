@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from extensions import metrics
+from extensions.cassandra_orm import singleflight
+from extensions.cassandra_orm.singleflight import SingleFlight
+from extensions.metrics import render_metrics
+from extensions.metrics.store import MetricsStore
+
+
+def test_coalesce_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    def query():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"first_name": "Test"}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("a", query)))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 只执行了一次, 所有调用得到相同的结果
+    assert len(calls) == 1
+    assert len(results) == 10
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"executed": 1, "coalesced": 9, "in_flight": 0}
+
+    # 执行完成后再次调用会重新执行
+    flight.do("a", query)
+    assert len(calls) == 2
+
+
+class Timeout(BaseException):
+    """和 gevent.Timeout 一样不是 Exception 的子类"""
+
+
+@pytest.mark.parametrize("error_class", [KeyError, Timeout])
+def test_share_error(error_class):
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def query():
+        started.set()
+        time.sleep(0.1)
+        raise error_class("a")
+
+    errors, results = [], []
+
+    def follower():
+        started.wait()
+        try:
+            results.append(flight.do("a", query))
+        except error_class as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    with pytest.raises(error_class):
+        flight.do("a", query)
+    thread.join()
+
+    # 等待的请求得到相同的异常, 而不是 None
+    assert len(errors) == 1
+    assert results == []
+    assert flight.stats()["coalesced"] == 1
+
+
+def test_render_stats(monkeypatch):
+    monkeypatch.setattr(
+        metrics.metrics_store, "factory",
+        lambda: MetricsStore(collector=metrics.collect_counters)
+    )
+    metrics.metrics_store.reset()
+    flight = SingleFlight()
+    flight.executed, flight.coalesced = 3, 7
+    monkeypatch.setattr(singleflight, "model_flight", flight)
+
+    text = render_metrics()
+    metrics.metrics_store.reset()
+    assert "# TYPE model_singleflight_calls_total counter" in text
+    assert 'model_singleflight_calls_total{role="leader"} 3' in text
+    assert 'model_singleflight_calls_total{role="coalesced"} 7' in text
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.trace import Status, StatusCode, set_span_in_context
+
+from extensions.opentelemetry.tail_sampling import TailSamplingSpanProcessor
+
+
+@pytest.fixture
+def exporter():
+    return InMemorySpanExporter()
+
+
+def make_tracer(exporter, **kwargs):
+    processor = TailSamplingSpanProcessor(
+        SimpleSpanProcessor(exporter), **kwargs
+    )
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    return provider.get_tracer(__name__), processor
+
+
+def request(tracer, name="/fast", sleep=0, failed=False):
+    with tracer.start_as_current_span(name):
+        with tracer.start_as_current_span("query") as span:
+            time.sleep(sleep)
+            if failed:
+                span.set_status(Status(StatusCode.ERROR))
+
+
+def test_export_slow_and_failed_traces(exporter):
+    tracer, processor = make_tracer(
+        exporter,
+        latency_threshold=0.02,
+        endpoint_thresholds={"/slow": 1},
+        baseline_rate=0,
+    )
+
+    request(tracer)
+    # /slow 的阈值更高, 不算慢请求
+    request(tracer, name="/slow", sleep=0.03)
+    assert exporter.get_finished_spans() == ()
+    assert processor.stats["dropped"] == 4
+
+    request(tracer, sleep=0.03)
+    request(tracer, failed=True)
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ["query", "/fast"] * 2
+    assert processor.stats["exported"] == 4
+    # trace 结束之后不会留在内存中
+    assert not processor._traces
+
+
+def test_baseline_and_late_spans(exporter):
+    tracer, processor = make_tracer(
+        exporter, latency_threshold=10, baseline_rate=1
+    )
+    with tracer.start_as_current_span("/fast"):
+        late_span = tracer.start_span("publish")
+    late_span.end()
+
+    # 根 span 结束之后才结束的 span 使用同样的决定
+    spans = exporter.get_finished_spans()
+    assert [span.name for span in spans] == ["/fast", "publish"]
+
+
+def test_evict_oldest_trace(exporter):
+    tracer, processor = make_tracer(exporter, max_traces=2)
+    for _ in range(3):
+        # 根 span 还没有结束, 子 span 缓存在内存中
+        root = tracer.start_span("/fast")
+        tracer.start_span("query", set_span_in_context(root)).end()
+
+    assert len(processor._traces) == 2
+    assert processor.stats["evicted"] == 1
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+
+from extensions.cassandra_migration.token_range import (
+    MAX_TOKEN,
+    MIN_TOKEN,
+    RING_SIZE,
+    TokenRangeMigration,
+    sample_token_ranges,
+    split_token_ranges,
+    token_span,
+)
+from extensions.cassandra_orm.management import DatabaseManagement
+
+
+class Item(Model):
+    __keyspace__ = "token_range_test"
+
+    id = columns.Integer(primary_key=True)
+    value = columns.Text()
+
+
+class FailingMigration(TokenRangeMigration):
+    """第二个 token 范围失败, 第一个范围在失败之后还需要较长的时间完成"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_ranges = split_token_ranges(self.split_count)
+        self.failed = threading.Event()
+        self.migrated = []
+
+    def finished_token_ranges(self):
+        return set()
+
+    def migrate_range(self, start_token, end_token):
+        if (start_token, end_token) == self.token_ranges[1]:
+            self.failed.set()
+            raise RuntimeError("write timeout")
+        if (start_token, end_token) == self.token_ranges[0]:
+            self.failed.wait(1)
+            time.sleep(0.2)
+        else:
+            time.sleep(0.01)
+        self.migrated.append((start_token, end_token))
+        return 0, 0
+
+
+@pytest.mark.parametrize("split_count", [1, 3, 256])
+def test_split_token_ranges(split_count):
+    token_ranges = split_token_ranges(split_count)
+    assert len(token_ranges) == split_count
+
+    # 首尾相接, 覆盖整个 token 环
+    assert token_ranges[0][0] == MIN_TOKEN
+    assert token_ranges[-1][1] == MAX_TOKEN
+    for (_, end), (start, _) in zip(token_ranges, token_ranges[1:]):
+        assert end == start
+    assert all(start < end for start, end in token_ranges)
+
+
+def test_sample_token_ranges():
+    token_ranges = split_token_ranges(256)
+    samples = sample_token_ranges(token_ranges, 4)
+    assert samples == [token_ranges[index] for index in (0, 64, 128, 192)]
+    assert sample_token_ranges(token_ranges, 0) == token_ranges[:1]
+    assert len(sample_token_ranges(token_ranges, 1000)) == 256
+
+
+def test_token_span():
+    assert token_span(MIN_TOKEN, MAX_TOKEN) == RING_SIZE
+    assert token_span(0, 10) == 10
+    # 跨过环的终点
+    assert token_span(MAX_TOKEN - 5, MIN_TOKEN + 5) == 10
+
+
+def test_run_cancel_pending_ranges(monkeypatch):
+    monkeypatch.setattr(DatabaseManagement, "instance", lambda: object())
+    migration = FailingMigration(
+        Item, lambda row: None, name="test", split_count=64, concurrency=2
+    )
+
+    with pytest.raises(RuntimeError, match="write timeout"):
+        migration.run()
+
+    # 失败时正在执行的范围会完成, 不等待前面的范围, 还没有开始的范围被取消
+    assert len(migration.migrated) < 10
+    assert migration.token_ranges[0] in migration.migrated
+    assert migration.finished_ranges == len(migration.migrated)
@@ -0,0 +1,66 @@
+import pytest
+from flask import Blueprint, Flask
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.trace import StatusCode
+
+from extensions import opentelemetry as tracing
+from extensions.flask_api.api import route
+from extensions.flask_api.exceptions import APIException
+from extensions.opentelemetry.tail_sampling import is_failed
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemorySpanExporter()
+    monkeypatch.setattr(
+        tracing.span_processor, "factory",
+        lambda: SimpleSpanProcessor(exporter)
+    )
+    tracing.span_processor.reset()
+    yield exporter
+    tracing.span_processor.reset()
+
+
+def test_span_processor_created_on_first_span(exporter):
+    provider = TracerProvider(shutdown_on_exit=False)
+    provider.add_span_processor(tracing.span_processor)
+
+    # 添加到 TracerProvider 和退出时 flush 都不会创建 processor
+    tracing.flush_spans(1)
+    assert not tracing.span_processor.is_initialized
+
+    with provider.get_tracer(__name__).start_as_current_span("request"):
+        pass
+    assert tracing.span_processor.is_initialized
+    assert [span.name for span in exporter.get_finished_spans()] == ["request"]
+
+    # fork 之后丢弃父进程的 processor
+    tracing.client_registry.after_fork()
+    assert not tracing.span_processor.is_initialized
+
+
+def test_mark_failed_response():
+    blueprint = Blueprint("tracing", __name__)
+
+    @route(blueprint, "/failed")
+    def failed():
+        raise APIException(error_type="object_not_found")
+
+    flask_app = Flask(__name__)
+    flask_app.config["JSON_ENCODER"] = "stdlib"
+    flask_app.register_blueprint(blueprint)
+
+    tracer = TracerProvider(shutdown_on_exit=False).get_tracer(__name__)
+    # 模拟 flask instrumentation 的请求 span
+    with tracer.start_as_current_span("/failed") as span:
+        response = flask_app.test_client().get("/failed")
+
+    assert response.status_code == 200
+    assert response.json["error_type"] == "object_not_found"
+    assert span.status.status_code is StatusCode.ERROR
+    assert span.attributes["api.error_type"] == "object_not_found"
+    assert is_failed(span)